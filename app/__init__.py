@@ -2,18 +2,30 @@
 import json
 import logging
 import math
+import os
 
 from flask import (
-    abort, Flask, jsonify, redirect, render_template, request, url_for
+    abort, Flask, jsonify, make_response, redirect, render_template, request, Response, url_for
 )
 
 from flask_redis import FlaskRedis
 
 from rq import Queue
 
-from app.github_fetcher import init_cache, fetch_page_items, store_pages, pre_fetch_pages, \
-    page_num_to_github_page_num
-from app.json_transformer import InvalidRequestError, transform
+from app import github_fetcher
+from app.github_crawler import enqueue_crawl, get_index_info, get_index_page
+from app.github_fetcher import enqueue_warm_cache, enqueue_prefetch, fetch_page, get_page, \
+    get_page_generation, get_total_count, cache_expire_time, is_stale, job_settings, \
+    register_query, use_repository_store, warm_github_page_nums
+from app import json_backend
+from app.error import ValidationErrors
+from app.json_stream import transform_stream
+from app.json_transformer import InvalidRequestError, transform, transform_batch
+from app.page_cache import PageCache
+from app.prefetch_planner import PrefetchPlanner, COOKIE_NAME
+from app.search_queries import search_query
+from app.transform_cache import TransformCache
+from app.tree_documents import TreeDocumentStore
 
 
 redis_store = FlaskRedis()
@@ -34,13 +46,44 @@ def create_app(test_config=None):
         app.config.from_mapping(test_config)
 
     redis_store.init_app(app)
-    redis_store.flushall()
+
+    # a relative repository store path is in the instance folder. background jobs are given the
+    # resolved path
+    if app.config.get('REPOSITORY_STORE_PATH'):
+        os.makedirs(app.instance_path, exist_ok=True)
+        app.config['REPOSITORY_STORE_PATH'] = os.path.join(app.instance_path,
+                                                           app.config['REPOSITORY_STORE_PATH'])
+
+    use_repository_store(app.config)
 
     task_queue = Queue('default', connection=redis_store)
 
-    init_cache(redis_store, app.config.get('GITHUB_MAX_ITEMS'), app.config.get('GITHUB_BASE_QUERY'),
-               app.config.get('PAGE_SIZE'), app.config.get('GITHUB_PAGE_SIZE'),
-               app.config.get('CACHE_EXPIRE_TIME'))
+    transform_cache = None
+
+    if app.config.get('TRANSFORM_CACHE_ENABLED'):
+        transform_cache = TransformCache(
+            redis_store if app.config.get('TRANSFORM_CACHE_REDIS') else None,
+            app.config.get('TRANSFORM_CACHE_MAX_ENTRIES'),
+            app.config.get('TRANSFORM_CACHE_EXPIRE_TIME'),
+            app.config.get('TRANSFORM_CACHE_MAX_ITEM_SIZE'),
+            app.config.get('TRANSFORM_CACHE_MAX_BYTES'))
+
+    tree_documents = TreeDocumentStore(app.config.get('TREE_DOCUMENTS_MAX'))
+
+    # the cache is warmed by a background job so the app can serve straight away (pages that
+    # aren't cached yet are fetched on demand). existing cache entries are kept, so restarting or
+    # forking more web processes doesn't throw away what is cached
+    enqueue_warm_cache(redis_store, task_queue, app.config)
+
+    # background jobs are only given the settings they use
+    prefetch_settings = job_settings(app.config)
+
+    prefetch_planner = PrefetchPlanner(
+        app.config.get('GITHUB_PAGE_SIZE'), app.config.get('GITHUB_MAX_ITEMS'),
+        app.config.get('GITHUB_PREFETCH_WINDOW'), app.config.get('GITHUB_PREFETCH_LOOKAHEAD_VIEWS'))
+
+    search_page_cache = PageCache(app.config.get('SEARCH_PAGE_CACHE_MAX_ENTRIES'),
+                                  app.config.get('SEARCH_PAGE_CACHE_HTML'))
 
     #
     # routes
@@ -61,64 +104,447 @@ def create_app(test_config=None):
             return render_template('json-transformer.html')
 
         try:
+            if transform_cache is not None:
+                return Response(transform_cache.transform_body(request.form['json_input']),
+                                mimetype='application/json')
+
             json_out = transform(json.loads(request.form['json_input']))
 
             # process the POST
             return jsonify(json_out)
-        except json.JSONDecodeError as e:
+        except ValueError as e:
+            abort(400, e)
+        except InvalidRequestError as e:
+            abort(400, e)
+
+    # streaming variant of the transformer for very large inputs. the raw request body is read
+    # incrementally instead of as a form field and the nested output is streamed back out, so
+    # memory use is bounded by the element index rather than by copies of the payload
+    @app.route('/json-transformer/stream', methods=('POST', ))
+    def json_transformer_stream():
+        try:
+            json_out = transform_stream(request.stream)
+
+            return Response(json_out, mimetype='application/json')
+        except InvalidRequestError as e:
+            abort(400, e)
+
+    # REST variant of the transformer. the raw application/json body (optionally gzip encoded) is
+    # passed straight to the JSON backend, skipping the URL-decode of the form field, and the
+    # output is serialized with the same backend. PUT is the natural verb as the transformation
+    # is idempotent, POST is accepted for clients that cannot send PUT
+    @app.route('/api/json-transformer', methods=('POST', 'PUT'))
+    def api_json_transformer():
+        if request.mimetype != 'application/json':
+            abort(415, 'Content-Type must be application/json')
+
+        # ?collect_all=1 validates the whole input and reports every violation (up to max_errors)
+        # in one response instead of failing on the first one
+        collect_all = request.args.get('collect_all') in ('1', 'true')
+
+        max_errors = app.config.get('TRANSFORM_MAX_ERRORS')
+
+        try:
+            max_errors = max(1, min(int(request.args.get('max_errors', max_errors)), max_errors))
+        except ValueError as e:
+            abort(400, e)
+
+        try:
+            if transform_cache is not None and not collect_all:
+                return Response(transform_cache.transform_body(request_body()),
+                                mimetype='application/json')
+
+            json_out = transform(json_backend.loads(request_body()), collect_all, max_errors)
+
+            return Response(json_backend.dumps(json_out), mimetype='application/json')
+        except ValueError as e:
+            abort(400, e)
+        except ValidationErrors as e:
+            return jsonify(errors=e.violations, truncated=e.truncated), 400
+        except InvalidRequestError as e:
+            abort(400, e)
+
+    # transforms many documents in one request, in parallel across a process pool. the body is
+    # either a JSON array of documents or NDJSON (one document per line). the response holds one
+    # entry per document, in order: {"result": [...]} or {"error": "..."}. NDJSON in gives NDJSON
+    # out
+    @app.route('/api/json-transformer/batch', methods=('POST', ))
+    def api_json_transformer_batch():
+        if request.mimetype not in ('application/json', 'application/x-ndjson'):
+            abort(415, 'Content-Type must be application/json or application/x-ndjson')
+
+        ndjson = request.mimetype == 'application/x-ndjson'
+
+        try:
+            body = request_body()
+        except ValueError as e:
+            abort(400, e)
+
+        if ndjson:
+            documents = []
+
+            for line in body.splitlines():
+                if line.strip():
+                    try:
+                        documents.append(json_backend.loads(line))
+                    except ValueError as e:
+                        documents.append(InvalidRequestError('Invalid JSON: ' + str(e)))
+        else:
+            try:
+                documents = json_backend.loads(body)
+            except ValueError as e:
+                abort(400, e)
+
+            if not isinstance(documents, list):
+                abort(400, 'Batch body must be a JSON array of documents')
+
+        # documents that failed to parse keep their slot in the output but are not sent to the pool
+        parsed = [document for document in documents
+                  if not isinstance(document, InvalidRequestError)]
+        results = iter(transform_batch(parsed))
+
+        entries = []
+
+        for document in documents:
+            result = document if isinstance(document, InvalidRequestError) else next(results)
+
+            if isinstance(result, InvalidRequestError):
+                entries.append({'error': str(result)})
+            else:
+                entries.append({'result': result})
+
+        if ndjson:
+            return Response(b''.join(json_backend.dumps(entry) + b'\n' for entry in entries),
+                            mimetype='application/x-ndjson')
+
+        return Response(json_backend.dumps(entries), mimetype='application/json')
+
+    # hit/miss counters for the transform cache of this process, used to tune its settings
+    @app.route('/api/json-transformer/cache-stats', methods=('GET', ))
+    def api_json_transformer_cache_stats():
+        if transform_cache is None:
+            abort(404)
+
+        return jsonify(transform_cache.get_stats())
+
+    # stateful element trees that are edited with patches instead of being re-posted in full. see
+    # app/tree_documents.py for the patch format
+    @app.route('/api/documents', methods=('POST', ))
+    def api_documents_create():
+        if request.mimetype != 'application/json':
+            abort(415, 'Content-Type must be application/json')
+
+        try:
+            handle, document = tree_documents.create(json_backend.loads(request_body()))
+        except ValueError as e:
             abort(400, e)
         except InvalidRequestError as e:
             abort(400, e)
 
+        return jsonify(handle=handle, elements=len(document.elements)), 201
+
+    @app.route('/api/documents/<handle>', methods=('GET', 'PATCH', 'DELETE'))
+    def api_document(handle):
+        if request.method == 'DELETE':
+            if not tree_documents.delete(handle):
+                abort(404)
+
+            return '', 204
+
+        document = tree_documents.get(handle)
+
+        if document is None:
+            abort(404)
+
+        if request.method == 'PATCH':
+            if request.mimetype != 'application/json':
+                abort(415, 'Content-Type must be application/json')
+
+            try:
+                diff = document.patch(json_backend.loads(request_body()))
+            except ValueError as e:
+                abort(400, e)
+            except InvalidRequestError as e:
+                abort(400, e)
+
+            # the diff is returned by default, ?result=tree returns the whole updated tree
+            if request.args.get('result') != 'tree':
+                return Response(json_backend.dumps(diff), mimetype='application/json')
+
+        with document.lock:
+            json_out = json_backend.dumps(document.element_trees)
+
+        return Response(json_out, mimetype='application/json')
+
     @app.route('/github-elixir-search', methods=('GET',))
     def github_elixir_search():
-        page_size = app.config.get('PAGE_SIZE')
+        return github_search_page(search_query(app.config, 'elixir'), 'github_elixir_search',
+                                  'GitHub Elixir Search')
+
+    # searches github repositories with any query, optionally limited to a language and sorted.
+    # each search is cached separately, see app/search_queries.py
+    @app.route('/github-search', methods=('GET',))
+    def github_search():
+        try:
+            query = search_query(app.config, request.args.get('q'), request.args.get('language'),
+                                 request.args.get('sort'), request.args.get('order'))
+        except ValueError as e:
+            abort(400, e)
+
+        # new searches are warmed in the background, and may evict the searches used longest ago
+        if register_query(redis_store, app.config, query):
+            enqueue_prefetch(redis_store, task_queue, prefetch_settings, query,
+                             warm_github_page_nums(app.config),
+                             app.config.get('GITHUB_PREFETCH_COOLDOWN'))
+
+        return github_search_page(query, 'github_search', 'GitHub Search')
+
+    def github_search_page(query, endpoint, title):
+        # ?all=1 pages through every result of the search that has been crawled
+        if request.args.get('all') == '1':
+            return github_search_index_page(query, endpoint, title)
+
         github_max_items = app.config.get('GITHUB_MAX_ITEMS')
         github_page_size = app.config.get('GITHUB_PAGE_SIZE')
-        github_url = app.config.get('GITHUB_BASE_QUERY')
-        cache_exp_time = app.config.get('CACHE_EXPIRE_TIME')
+        cache_exp_time = cache_expire_time(app.config, query)
+        total_count = get_total_count(redis_store, query['id'])
+
+        try:
+            # pages are sliced out of the cached github pages, so any page size up to a github
+            # page can be served without fetching more from github
+            page_size = int(request.args.get('per_page', app.config.get('PAGE_SIZE')))
 
-        # GitHub caps search results at 1000. Since we have 10 items / per page, this means
-        # our last page is 100.
+            assert 0 < page_size <= github_page_size, \
+                'Page size invalid. per_page must be between 1 and ' + str(github_page_size)
 
-        # last page for this app is 1000 / 10 = 100 (note: this is different from the last page for
-        # github which would be 1000 / 100 = 10)
-        last_page = math.ceil(github_max_items / page_size)
+            # GitHub caps search results at 1000. Since we have 10 items / per page by default,
+            # this means our last page is 100.
+
+            # last page for this app is 1000 / 10 = 100 (note: this is different from the last page
+            # for github which would be 1000 / 100 = 10)
+            last_page = search_last_page(total_count, page_size)
 
-        try:
             page_num = int(request.args.get('page', 1))
 
             assert 0 < page_num <= last_page, \
-                'Page number invalid. Page must be between 1 and ' + str(last_page) + '. 100 is ' \
-                + 'the last page of data. The GitHub Search API limits results to the first 1000 ' \
-                + 'items for unauthenticated requests. Since the project\'s page size is 10, ' \
-                + 'we have a maximum of 100 pages. See https://developer.github.com/v3/search/ ' \
-                + 'for more info.'
+                'Page number invalid. Page must be between 1 and ' + str(last_page) + '. ' \
+                + str(last_page) + ' is the last page of data. The GitHub Search API limits ' \
+                + 'results to the first 1000 items for unauthenticated requests. With a page ' \
+                + 'size of ' + str(page_size) + ', we have a maximum of ' + str(last_page) \
+                + ' pages. See https://developer.github.com/v3/search/ for more info.'
 
         except Exception as e:
             abort(400, e)
 
-        items = redis_store.get(page_num)
+        # the items and rendered html of pages this process has served before are reused for as
+        # long as the page's generation in redis doesn't change
+        page = (endpoint, query['id'], page_num, page_size)
+        generation, ttl = get_page_generation(redis_store, query['id'], page_num, page_size,
+                                              github_page_size, github_max_items)
+        entry = search_page_cache.get(page, generation) if generation is not None else None
+
+        if entry is not None:
+            items, html = entry
+        else:
+            items, ttl, generation = get_page(redis_store, query['id'], page_num, page_size,
+                                              github_page_size, github_max_items)
+            html = None
 
         if items is None:
-            try:
-                items_pages, starting_fetched_page_num = \
-                    fetch_page_items(github_url, page_num, page_size, github_page_size)
-                store_pages(redis_store, items_pages, starting_fetched_page_num, cache_exp_time)
+            # if another request or the worker is already fetching this page from github, this
+            # waits for its result rather than fetching it again
+            items = fetch_page(redis_store, query['id'], query['url'], page_num, page_size,
+                               github_page_size, github_max_items, cache_exp_time,
+                               app.config.get('GITHUB_FETCH_LOCK_TIMEOUT'),
+                               app.config.get('GITHUB_FETCH_WAIT_TIMEOUT'))
+
+            if items is None:
+                abort(503, 'Unable to fetch page ' + str(page_num) + ' from GitHub, please try '
+                      + 'again later')
+
+            generation, ttl = get_page_generation(redis_store, query['id'], page_num, page_size,
+                                                  github_page_size, github_max_items)
+
+            # the first fetch of a search gives its total count
+            if total_count is None:
+                last_page = search_last_page(get_total_count(redis_store, query['id']), page_size)
+
+        elif is_stale(app.config, ttl):
+            # a stale page is served as is. its github pages are always part of the pre-fetch plan
+            # below, so the worker refreshes it in the background
+            logging.info('page ' + str(page_num) + ' is stale, serving it while it is refreshed')
+
+        if html is None:
+            html = render_template(
+                'github-search.html', title=title, endpoint=endpoint,
+                link_args=search_link_args(query, endpoint, page_size), items=items, first_page=1,
+                last_page=last_page, previous_page=max(page_num - 1, 1),
+                next_page=min(page_num + 1, last_page))
+
+        if entry is None and generation is not None:
+            search_page_cache.set(page, generation, items, html)
+
+        # pre-fetch the github pages the user is heading towards via a background worker
+        position = prefetch_planner.position(page_num, page_size)
+        navigation = prefetch_planner.update(
+            prefetch_planner.parse(request.cookies.get(COOKIE_NAME)), position)
+
+        enqueue_prefetch(redis_store, task_queue, prefetch_settings, query,
+                         prefetch_planner.plan(position, navigation),
+                         app.config.get('GITHUB_PREFETCH_COOLDOWN'))
+
+        response = make_response(html)
+
+        response.set_cookie(COOKIE_NAME, prefetch_planner.serialize(navigation), httponly=True,
+                            samesite='Lax')
+
+        # the browser may reuse the page while it is fresh, and revalidate it with its generation
+        # afterwards. shared caches may not: the response sets the user's navigation cookie
+        if generation is not None:
+            response.set_etag(query['id'] + '-' + str(page_num) + '-' + str(page_size) + '-'
+                              + generation)
+            response.cache_control.private = True
+            response.cache_control.max_age = \
+                max(0, min(ttl - app.config.get('CACHE_STALE_TIME'),
+                           app.config.get('SEARCH_PAGE_MAX_AGE')))
+
+        return response.make_conditional(request)
+
+    # pages of the crawled index of a search (see app/github_crawler.py), which has every result of
+    # the search rather than the first 1000
+    def github_search_index_page(query, endpoint, title):
+        github_page_size = app.config.get('GITHUB_PAGE_SIZE')
 
-                items = items_pages[(page_num - 1) % page_size]
-            except InvalidRequestError as e:
-                abort(400, e)
+        try:
+            page_size = int(request.args.get('per_page', app.config.get('PAGE_SIZE')))
 
-        else:
-            # pre-fetch pages via a background worker
-            task_queue.enqueue(pre_fetch_pages, app.config, page_num, last_page)
+            assert 0 < page_size <= github_page_size, \
+                'Page size invalid. per_page must be between 1 and ' + str(github_page_size)
+
+            page_num = int(request.args.get('page', 1))
+
+            assert 0 < page_num, 'Page number invalid. Page must be 1 or more'
+
+        except Exception as e:
+            abort(400, e)
+
+        items, total = get_index_page(redis_store, app.config, query['id'], page_num, page_size)
+
+        if items is None:
+            abort(404, 'This search has not been crawled yet')
+
+        last_page = max(1, math.ceil(total / page_size))
+
+        if page_num > last_page:
+            abort(400, 'Page number invalid. Page must be between 1 and ' + str(last_page))
+
+        return render_template(
+            'github-search.html', title=title, endpoint=endpoint,
+            link_args=search_link_args(query, endpoint, page_size), items=items, first_page=1,
+            last_page=last_page, previous_page=max(page_num - 1, 1),
+            next_page=min(page_num + 1, last_page))
+
+    # the last page of a search. github returns at most GITHUB_MAX_ITEMS results of a search, and
+    # searches with fewer results end sooner once their total count is known
+    def search_last_page(total_count, page_size):
+        github_max_items = app.config.get('GITHUB_MAX_ITEMS')
+
+        if total_count is None or total_count >= github_max_items:
+            return math.ceil(github_max_items / page_size)
+
+        return max(1, math.ceil(total_count / page_size))
+
+    # the search (normalized) and page size are carried over to the links of other pages
+    def search_link_args(query, endpoint, page_size):
+        link_args = {}
+
+        if endpoint == 'github_search':
+            link_args = {arg: query[arg] for arg in ('q', 'language', 'sort', 'order')
+                         if query[arg] is not None}
+
+        if request.args.get('all') == '1':
+            link_args['all'] = '1'
+
+        if page_size != app.config.get('PAGE_SIZE'):
+            link_args['per_page'] = page_size
+
+        return link_args
+
+    # POST enqueues a crawl of every result of a search (past the 1000 results github returns for
+    # a search) for the worker, GET returns the crawled index of the search
+    @app.route('/api/github-search/crawl', methods=('GET', 'POST'))
+    def api_github_search_crawl():
+        try:
+            query = search_query(app.config, request.values.get('q'),
+                                 request.values.get('language'), request.values.get('sort'),
+                                 request.values.get('order'))
+        except ValueError as e:
+            abort(400, e)
+
+        if request.method == 'POST':
+            enqueued = enqueue_crawl(redis_store, task_queue, prefetch_settings, query,
+                                     app.config.get('CRAWL_JOB_TIMEOUT'))
+
+            return jsonify({'query': query['id'], 'enqueued': enqueued}), 202
+
+        info = get_index_info(redis_store, query['id'])
+
+        if info is None:
+            abort(404, 'This search has not been crawled yet')
+
+        info['query'] = query['id']
+
+        return jsonify(info)
+
+    # filters, sorts and paginates the repositories in the local repository store, without a
+    # request to github. description is a substring to look for
+    @app.route('/api/repositories', methods=('GET', ))
+    def api_repositories():
+        if github_fetcher.repository_store is None:
+            abort(404, 'The repository store is not enabled')
+
+        try:
+            per_page = int(request.args.get('per_page', app.config.get('PAGE_SIZE')))
+
+            assert per_page <= app.config.get('GITHUB_PAGE_SIZE'), \
+                'Page size invalid. per_page must be at most ' \
+                + str(app.config.get('GITHUB_PAGE_SIZE'))
+
+            min_stars = request.args.get('min_stars')
+            page = int(request.args.get('page', 1))
+
+            items, total = github_fetcher.repository_store.query(
+                request.args.get('language'), request.args.get('description'),
+                int(min_stars) if min_stars is not None else None,
+                request.args.get('sort', 'stars'), request.args.get('order', 'desc'), page,
+                per_page)
+
+        except Exception as e:
+            abort(400, e)
+
+        return jsonify({'total': total, 'page': page, 'per_page': per_page, 'items': items})
+
+    # pre-fetch planner counters of this process, including the configured window
+    @app.route('/api/github-elixir-search/prefetch-stats', methods=('GET', ))
+    def api_github_elixir_search_prefetch_stats():
+        return jsonify(prefetch_planner.get_stats())
+
+    # hit/miss counters for the in-process search page cache
+    @app.route('/api/github-elixir-search/cache-stats', methods=('GET', ))
+    def api_github_elixir_search_cache_stats():
+        return jsonify(search_page_cache.get_stats())
+
+    # returns the raw request body, decompressed if it was sent gzip encoded. raises a ValueError
+    # for an invalid gzip body
+    def request_body():
+        body = request.get_data(cache=False)
 
-            items = json.loads(items)
+        if request.content_encoding == 'gzip':
+            body = json_backend.gunzip(body, app.config.get('JSON_MAX_DECOMPRESSED_SIZE'))
+        elif request.content_encoding not in (None, '', 'identity'):
+            abort(415, 'Content-Encoding must be gzip or identity')
 
-        return render_template('github-elixir-search.html', items=items, first_page=1,
-                               last_page=last_page, previous_page=max(page_num - 1, 1),
-                               next_page=min(page_num + 1, last_page))
+        return body
 
     @app.errorhandler(404)
     def bad_request(error):
@@ -0,0 +1,212 @@
+import json
+
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from app.error import InvalidRequestError
+from app.json_transformer import validate_element
+
+
+#
+# compact, column oriented representation of the elements used by the streaming transformer.
+#
+# flatten_elements() keeps every input element as a dict and build_element_trees() gives each one
+# a children list, so an element costs a dict, a list and the objects they point to. here each
+# element is a position in a set of parallel columns instead:
+#
+#   ids, levels, titles    one slot per element (lists, the values are shared with the input)
+#   parents                array of parent positions, -1 for a root. parents are usually added
+#                          before their children, so these are resolved as elements are added
+#   child_offsets          array, the children of element i are
+#   child_positions          child_positions[child_offsets[i]:child_offsets[i + 1]]
+#   extras                 position -> dict of any keys beyond the required ones, for the few
+#                          elements that have them
+#
+# the only per-element hashtable is the id -> position lookup needed to resolve parent_ids. dicts
+# are only created again when the trees are serialized.
+#
+# elements are added one at a time with add() (so they can come straight from a streaming parser
+# and never be held as a whole) and link() then resolves parents and builds the children index.
+# the same validations as flatten_elements() and build_element_trees() are applied, in the same
+# order, so the same error is raised for the same input
+#
+
+# keys that are stored in their own column rather than in extras
+column_keys = {'id', 'children', 'level', 'parent_id', 'title'}
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+_ROOT = -1
+_UNRESOLVED = -2
+
+
+class ElementIndex:
+    __slots__ = ('positions', 'ids', 'levels', 'titles', 'parents', 'unresolved', 'extras',
+                 'roots', 'child_offsets', 'child_positions', 'has_root_element')
+
+    def __init__(self):
+        # element id -> position
+        self.positions = {}
+
+        self.ids = []
+        self.levels = []
+        self.titles = []
+        self.extras = {}
+
+        self.parents = array('q')
+
+        # position -> parent_id for elements added before their parent. link() resolves them
+        self.unresolved = {}
+
+        self.roots = None
+        self.child_offsets = None
+        self.child_positions = None
+
+        self.has_root_element = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, level_key, element):
+        validate_element(level_key, element)
+
+        element_id = element['id']
+
+        if element_id in self.positions:
+            raise InvalidRequestError('Duplicate id \'' + str(element_id) + '\' detected')
+
+        if level_key[0] == '0':
+            self.has_root_element = True
+
+        position = len(self.ids)
+        self.positions[element_id] = position
+
+        self.ids.append(element_id)
+        self.levels.append(element['level'])
+        self.titles.append(element['title'])
+
+        parent_id = element['parent_id']
+
+        if parent_id is None:
+            self.parents.append(_ROOT)
+        else:
+            parent = self.positions.get(parent_id, _UNRESOLVED)
+
+            if parent == _UNRESOLVED:
+                self.unresolved[position] = parent_id
+
+            self.parents.append(parent)
+
+        if len(element) > len(column_keys):
+            self.extras[position] = {k: v for k, v in element.items() if k not in column_keys}
+
+    # resolves the remaining parent ids and groups the children of each element. a stable sort
+    # of positions by parent keeps children in input order, the same way build_element_trees()
+    # does
+    def link(self):
+        if not self.has_root_element and len(self.ids) > 0:
+            raise InvalidRequestError('There are no root elements')
+
+        parents = self.parents
+
+        # positions are in input order, so the first invalid parent is the same one
+        # build_element_trees() reports
+        for position, parent_id in self.unresolved.items():
+            parent = self.positions.get(parent_id)
+
+            # elements must have valid parent_elements
+            if parent is None:
+                raise InvalidRequestError('Element ' + str(self.ids[position]) + ' has an '
+                                          + 'invalid parent')
+
+            parents[position] = parent
+
+        self.unresolved = {}
+
+        count = len(parents)
+        order = sorted(range(count), key=parents.__getitem__)
+
+        child_counts = Counter(parents)
+        root_count = child_counts.pop(_ROOT, 0)
+
+        offsets = [0] * (count + 1)
+
+        for parent, child_count in child_counts.items():
+            offsets[parent + 1] = child_count
+
+        self.roots = array('q', order[:root_count])
+        self.child_positions = array('q', order[root_count:])
+        self.child_offsets = array('q', accumulate(offsets))
+
+    def children(self, position):
+        return self.child_positions[self.child_offsets[position]:self.child_offsets[position + 1]]
+
+    def _fields(self, position):
+        parent = self.parents[position]
+
+        fields = {'id': self.ids[position], 'level': self.levels[position],
+                  'parent_id': None if parent == _ROOT else self.ids[parent],
+                  'title': self.titles[position]}
+
+        if position in self.extras:
+            fields.update(self.extras[position])
+
+        return fields
+
+    # splits an element into the JSON text that goes before and after its children array, with
+    # keys sorted the same way jsonify() sorts them
+    def _element_parts(self, position):
+        if position not in self.extras:
+            parent = self.parents[position]
+
+            return '{"children":[', ('],"id":' + _encode(self.ids[position])
+                                     + ',"level":' + _encode(self.levels[position])
+                                     + ',"parent_id":'
+                                     + ('null' if parent == _ROOT else _encode(self.ids[parent]))
+                                     + ',"title":' + _encode(self.titles[position]) + '}')
+
+        fields = self._fields(position)
+
+        keys = sorted(list(fields.keys()) + ['children'])
+        split = keys.index('children')
+
+        head = ''.join(_encode(k) + ':' + _encode(fields[k]) + ',' for k in keys[:split])
+        tail = ''.join(',' + _encode(k) + ':' + _encode(fields[k]) for k in keys[split + 1:])
+
+        return '{' + head + '"children":[', ']' + tail + '}'
+
+    # generates the nested JSON array of element trees in chunks of about chunk_size characters.
+    # an explicit stack is used instead of recursion so deep hierarchies cannot hit the recursion
+    # limit
+    def iter_json(self, chunk_size):
+        parts = ['[']
+        size = 1
+
+        stack = [(iter(self.roots), ']')]
+        first = True
+
+        while stack:
+            child_positions, closing = stack[-1]
+            position = next(child_positions, None)
+
+            if position is None:
+                stack.pop()
+                part = closing
+                first = False
+            else:
+                head, tail = self._element_parts(position)
+                part = head if first else ',' + head
+                stack.append((iter(self.children(position)), tail))
+                first = True
+
+            parts.append(part)
+            size += len(part)
+
+            if size >= chunk_size:
+                yield ''.join(parts)
+                parts = []
+                size = 0
+
+        if parts:
+            yield ''.join(parts)
@@ -2,3 +2,18 @@
 
 class InvalidRequestError(Exception):
     pass
+
+
+# raised when validating with collect_all=True. violations holds a record for every problem found
+# (see app/json_transformer.py) and truncated is set when validation stopped at the limit
+class ValidationErrors(InvalidRequestError):
+    def __init__(self, violations, truncated=False):
+        super().__init__(str(len(violations)) + ' validation error(s), the first is: '
+                         + violations[0]['message'])
+
+        self.violations = violations
+        self.truncated = truncated
+
+    def __reduce__(self):
+        return self.__class__, (self.violations, self.truncated)
+
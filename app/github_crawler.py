@@ -0,0 +1,259 @@
+import datetime
+import logging
+import math
+import uuid
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app import page_codec
+from app.github_fetcher import decode_github_page, fetch_page_items, fetch_search_page, \
+    simplify_item, slice_page, page_num_to_github_page_nums, use_repository_store
+from app.search_queries import query_url
+
+
+#
+# crawls every result of a search, past the 1000 results github returns for a single search.
+#
+# the search is split into shards by date (created:A..B or pushed:A..B, see CRAWL_DATE_FIELD). the
+# first page of a shard gives its total count, and shards with more results than github returns are
+# split in half and probed again, level by level, until every shard is under the cap. the other
+# pages of the shards are then fetched. the requests of each level, and all the remaining pages,
+# are made CRAWL_CONCURRENCY at a time and are paced by the shared github rate limiter.
+#
+# results are deduplicated by full name (a repository pushed during a crawl by pushed date can move
+# between shards) and written as a new version of the search's index: the items in chunks of
+# GITHUB_PAGE_SIZE, encoded like cached github pages, and an info hash pointing at the version. any
+# page of the index is read in two round trips (the info, then the one or two chunks holding the
+# page) however large the index is. the chunks of the previous version are dropped after
+# CRAWL_INDEX_GRACE_TIME, so readers that already read the old info can finish.
+#
+# a crawl that fails part way doesn't replace the index
+#
+
+INDEX_PREFIX = 'crawl-index:'
+CHUNK_PREFIX = 'crawl-index-chunk:'
+CRAWL_LOCK_PREFIX = 'lock:crawl:'
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def index_key(query_id):
+    return INDEX_PREFIX + query_id
+
+
+def chunk_key(query_id, version, chunk_num):
+    return CHUNK_PREFIX + query_id + ':' + version + ':' + str(chunk_num)
+
+
+# the search url of a shard, the page number is appended to it
+def shard_url(config, query, shard):
+    start, end = shard
+    shard_query = dict(query)
+    shard_query['q'] = query['q'] + ' ' + config.get('CRAWL_DATE_FIELD') + ':' \
+        + start.strftime(DATE_FORMAT) + '..' + end.strftime(DATE_FORMAT)
+
+    return query_url(config.get('GITHUB_SEARCH_URL'), shard_query, config.get('GITHUB_PAGE_SIZE'))
+
+
+# splits a shard of two or more days into two halves
+def split_shard(shard):
+    start, end = shard
+    middle = start + (end - start) // 2
+
+    return [(start, middle), (middle + datetime.date.resolution, end)]
+
+
+# returns (total count, items of the first page), or None if the page couldn't be fetched
+def probe_shard(connection, config, query, shard):
+    fetched = fetch_search_page(connection, shard_url(config, query, shard), 1)
+
+    if fetched is None:
+        return None
+
+    response_json = fetched[0]
+
+    return response_json['total_count'], [simplify_item(item) for item in response_json['items']]
+
+
+# returns a list of (shard, total count, items of its first page) covering the whole date range,
+# with every shard under the cap, or None if a shard couldn't be probed
+def plan_shards(connection, config, query, executor):
+    max_items = config.get('GITHUB_MAX_ITEMS')
+    start = datetime.datetime.strptime(config.get('CRAWL_START_DATE'), DATE_FORMAT).date()
+
+    pending = [(start, datetime.date.today())]
+    shards = []
+
+    while len(pending) > 0:
+        probes = list(executor.map(lambda shard: probe_shard(connection, config, query, shard),
+                                   pending))
+
+        if None in probes:
+            return None
+
+        next_pending = []
+
+        for shard, (total_count, items) in zip(pending, probes):
+            if total_count <= max_items:
+                shards.append((shard, total_count, items))
+            elif shard[0] < shard[1]:
+                next_pending += split_shard(shard)
+            else:
+                logging.warning('Crawl shard ' + shard[0].strftime(DATE_FORMAT) + ' has '
+                                + str(total_count) + ' results, only the first '
+                                + str(max_items) + ' are crawled')
+                shards.append((shard, max_items, items))
+
+        pending = next_pending
+
+    return sorted(shards)
+
+
+# returns (the deduplicated items of the search in date order, the number of shards), or None if
+# a page couldn't be fetched
+def crawl_items(connection, config, query):
+    github_page_size = config.get('GITHUB_PAGE_SIZE')
+
+    with ThreadPoolExecutor(config.get('CRAWL_CONCURRENCY')) as executor:
+        shards = plan_shards(connection, config, query, executor)
+
+        if shards is None:
+            return None
+
+        # the pages of each shard after the first, which came with the probe
+        pages = [(shard, github_page_num) for shard, total_count, _ in shards
+                 for github_page_num in range(2, math.ceil(total_count / github_page_size) + 1)]
+
+        fetched = list(executor.map(
+            lambda page: fetch_page_items(connection, shard_url(config, query, page[0]), page[1]),
+            pages))
+
+    if None in fetched:
+        return None
+
+    pages_items = {page: page_fetched[0] for page, page_fetched in zip(pages, fetched)}
+    items = OrderedDict()
+
+    for shard, total_count, first_page_items in shards:
+        shard_items = list(first_page_items)
+
+        for github_page_num in range(2, math.ceil(total_count / github_page_size) + 1):
+            shard_items += pages_items[(shard, github_page_num)]
+
+        for item in shard_items:
+            items.setdefault(item['name'], item)
+
+    logging.info('Crawled ' + str(len(items)) + ' repositories in ' + str(len(shards))
+                 + ' shards for search ' + query['id'])
+
+    return list(items.values()), len(shards)
+
+
+# writes items as a new version of the search's index and points the index at it
+def store_index(connection, config, query_id, items, shard_count):
+    chunk_size = config.get('GITHUB_PAGE_SIZE')
+    version = uuid.uuid4().hex[:8]
+    old_index = get_index_info(connection, query_id)
+
+    pipeline = connection.pipeline(transaction=False)
+
+    for chunk_num in range(1, math.ceil(len(items) / chunk_size) + 1):
+        pipeline.set(chunk_key(query_id, version, chunk_num),
+                     page_codec.encode(items[(chunk_num - 1) * chunk_size:chunk_num * chunk_size]))
+
+    pipeline.hmset(index_key(query_id), {
+        'version': version,
+        'total': len(items),
+        'shards': shard_count,
+        'crawled_at': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+    })
+
+    if old_index is not None:
+        for chunk_num in range(1, math.ceil(old_index['total'] / chunk_size) + 1):
+            pipeline.expire(chunk_key(query_id, old_index['version'], chunk_num),
+                            config.get('CRAWL_INDEX_GRACE_TIME'))
+
+    pipeline.execute()
+
+    return version
+
+
+# returns a dict with the version, total, shards and crawled_at of the search's index, or None if
+# the search hasn't been crawled
+def get_index_info(connection, query_id):
+    info = {key.decode('utf8'): value.decode('utf8')
+            for key, value in connection.hgetall(index_key(query_id)).items()}
+
+    if len(info) == 0:
+        return None
+
+    info['total'] = int(info['total'])
+    info['shards'] = int(info['shards'])
+
+    return info
+
+
+# returns (items, total) of page_num of the search's index, or (None, 0) if the search hasn't been
+# crawled. the items of a page past the end are an empty list
+def get_index_page(connection, config, query_id, page_num, page_size):
+    chunk_size = config.get('GITHUB_PAGE_SIZE')
+    info = get_index_info(connection, query_id)
+
+    if info is None:
+        return None, 0
+
+    chunk_nums = page_num_to_github_page_nums(page_num, page_size, chunk_size, info['total'])
+
+    if len(chunk_nums) == 0:
+        return [], info['total']
+
+    chunks = [decode_github_page(chunk_num, chunk)
+              for chunk_num, chunk in zip(chunk_nums, connection.mget(
+                  [chunk_key(query_id, info['version'], chunk_num) for chunk_num in chunk_nums]))]
+
+    if None in chunks:
+        return None, 0
+
+    return slice_page(chunks, page_num, page_size, chunk_size), info['total']
+
+
+# this function is executed by a worker in a background process. config is the job_settings() of
+# the app config
+def crawl(config, query):
+    import redis
+    from rq import Connection
+
+    connection = redis.from_url(config.get('REDIS_URL'))
+
+    use_repository_store(config)
+
+    with Connection(connection):
+        run_crawl(connection, config, query)
+
+
+def run_crawl(connection, config, query):
+    try:
+        crawled = crawl_items(connection, config, query)
+
+        if crawled is None:
+            logging.warning('Crawl of search ' + query['id'] + ' failed, the index is unchanged')
+            return None
+
+        items, shard_count = crawled
+
+        return store_index(connection, config, query['id'], items, shard_count)
+
+    finally:
+        connection.delete(CRAWL_LOCK_PREFIX + query['id'])
+
+
+# enqueues a crawl of the search, unless one is already queued or running. returns whether a crawl
+# was enqueued
+def enqueue_crawl(connection, task_queue, settings, query, job_timeout):
+    if not connection.set(CRAWL_LOCK_PREFIX + query['id'], 1, ex=job_timeout, nx=True):
+        return False
+
+    task_queue.enqueue_call(func=crawl, args=(settings, query), timeout=job_timeout)
+
+    return True
@@ -1,51 +1,178 @@
 
-import json
+import asyncio
 import logging
 import math
 import requests
+import sqlite3
+import time
+import uuid
 
-from backoff import on_exception, expo
-from ratelimit import limits, RateLimitException
+from concurrent.futures import ThreadPoolExecutor
+from redis.exceptions import WatchError
+from requests.adapters import HTTPAdapter
+
+from app import page_codec
+from app.rate_limiter import RateLimiter
+from app.repository_store import get_store
+from app.search_queries import configured_queries
 
 
 CALLS_PER_MINUTE = 10
 SECONDS_PER_MINUTE = 60
 MAX_TRIES = 8
 
+WARM_CACHE_KEY = 'warm-cache:github'
+PREFETCH_QUEUED_PREFIX = 'prefetch-queued:github-page:'
+
+# each github page is cached whole, its items encoded with app/page_codec.py. pages of this app, of
+# any page size, are sliced out of the github pages they overlap when they are read
+GITHUB_PAGE_PREFIX = 'github-page:'
+
+# the config settings background jobs use. jobs are given only these rather than the whole app
+# config, which keeps the pickled job small
+JOB_SETTINGS = ('REDIS_URL', 'GITHUB_SEARCH_URL', 'GITHUB_MAX_ITEMS', 'GITHUB_PAGE_SIZE',
+                'CACHE_EXPIRE_TIME', 'CACHE_STALE_TIME', 'CACHE_REFRESH_TIME', 'SEARCH_QUERIES',
+                'SEARCH_QUERY_EXPIRE_TIME', 'GITHUB_FETCH_LOCK_TIMEOUT',
+                'GITHUB_FETCH_WAIT_TIMEOUT', 'GITHUB_PREFETCH_CONCURRENCY', 'CRAWL_DATE_FIELD',
+                'CRAWL_START_DATE', 'CRAWL_CONCURRENCY', 'CRAWL_INDEX_GRACE_TIME',
+                'REPOSITORY_STORE_PATH')
+FETCH_LOCK_PREFIX = 'lock:github-page:'
+FETCH_POLL_INTERVAL = 0.1   # in seconds
+
+# etag and last-modified of the github response each cached github page came from
+VALIDATORS_PREFIX = 'validators:github-page:'
+
+# set every time a github page is stored, so processes can tell when their copy of a page is out
+# of date. generations are taken from a single counter rather than counted per github page, so a
+# github page that expires and is fetched again doesn't start over with a generation it had before
+GENERATION_PREFIX = 'generation:github-page:'
+GENERATION_COUNTER_KEY = 'generation-counter:github-page'
+
+# the total count of results github reported for a search, stored with each of its github pages
+TOTAL_COUNT_PREFIX = 'total-count:github-search:'
+
+REQUEST_TIMEOUT = (5, 30)   # in seconds, (connect, read)
+POOL_SIZE = 4
+
+# connections to github are kept alive and reused across requests. each process has its own pool
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+
+# the repositories of every github response are also written to the local repository store (see
+# app/repository_store.py) when REPOSITORY_STORE_PATH is set. each process opens it once
+repository_store = None
+
+
+def use_repository_store(config):
+    global repository_store
+
+    path = config.get('REPOSITORY_STORE_PATH')
+    repository_store = get_store(path) if path else None
+
+
+# pages are fresh for the expire time of their search, then served stale for up to
+# CACHE_STALE_TIME more seconds while they are refreshed in the background. redis drops them after
+# both
+def cache_expire_time(config, query):
+    return query['expire_time'] + config.get('CACHE_STALE_TIME')
+
+
+# whether a cached page with ttl seconds left in redis is past its fresh time
+def is_stale(config, ttl):
+    return ttl < config.get('CACHE_STALE_TIME')
+
+
+def job_settings(config):
+    return {key: config.get(key) for key in JOB_SETTINGS}
+
 
 def page_url(url, page):
     return url + str(page)
 
 
-def page_num_to_github_page_num(page_num, page_size, github_page_size):
-    return math.ceil(page_num / (github_page_size / page_size))
+# keys of github pages, and of everything kept per github page, are namespaced by the id of the
+# search they belong to (see app/search_queries.py)
+def github_page_key(query_id, github_page_num, prefix=GITHUB_PAGE_PREFIX):
+    return prefix + query_id + ':' + str(github_page_num)
+
+
+def total_count_key(query_id):
+    return TOTAL_COUNT_PREFIX + query_id
+
+
+# the github pages holding the items of page_num, for pages of page_size items. only the first
+# max_items items exist, github answers a request for a page past them with an error
+def page_num_to_github_page_nums(page_num, page_size, github_page_size, max_items):
+    first_item = (page_num - 1) * page_size
+    last_item = min(page_num * page_size, max_items) - 1
+
+    return list(range(first_item // github_page_size + 1, last_item // github_page_size + 2))
+
+
+# slices the items of page_num out of the items of the github pages it overlaps
+def slice_page(github_pages_items, page_num, page_size, github_page_size):
+    first_github_page_num = (page_num - 1) * page_size // github_page_size + 1
+    offset = (page_num - 1) * page_size - (first_github_page_num - 1) * github_page_size
+
+    items = [item for github_page_items in github_pages_items for item in github_page_items]
+
+    return items[offset:offset + page_size]
+
+
+# the github pages of a search that are cached when it is warmed. the first and last github pages
+# are likely to be accessed
+def warm_github_page_nums(config):
+    return [1, last_github_page_num(config)]
+
+
+def last_github_page_num(config):
+    return math.ceil(config.get('GITHUB_MAX_ITEMS') / config.get('GITHUB_PAGE_SIZE'))
+
+
+# pre-fetch pages of the configured searches and cache them for faster response times. the github
+# pages of each search are fetched concurrently
+def init_cache(connection, config):
+    for query in configured_queries(config):
+        prefetch_pages(connection, config, query, warm_github_page_nums(config))
+
+
+# this function is executed by a worker in a background process. it is idempotent, pages that are
+# already cached are skipped. settings are the job_settings() of the app config
+def warm_cache(config):
+    import redis
+    from rq import Connection
+
+    connection = redis.from_url(config.get('REDIS_URL'))
+
+    use_repository_store(config)
+
+    with Connection(connection):
+        init_cache(connection, config)
+
 
+# every web process calls this when it starts, but only the first one in GITHUB_FETCH_LOCK_TIMEOUT
+# seconds enqueues the warm up job
+def enqueue_warm_cache(connection, task_queue, config):
+    if connection.set(WARM_CACHE_KEY, 1, ex=config.get('GITHUB_FETCH_LOCK_TIMEOUT'), nx=True):
+        task_queue.enqueue(warm_cache, job_settings(config))
 
-def github_page_num_to_page_num(github_page_num, page_size):
-    return (github_page_num - 1) * page_size + 1
 
+# github's search api allows 10 unauthenticated requests a minute. the limit is shared by every
+# web process and worker through redis, and a request that github still rate limits is retried
+# once github says the limit has reset
+def make_request(connection, url, headers=None):
+    rate_limiter = RateLimiter(connection, CALLS_PER_MINUTE, SECONDS_PER_MINUTE)
 
-# pre-fetch pages and cache them for faster response times
-def init_cache(connection, max_items, url, page_size, github_page_size, cache_exp):
-    # fetch the first PRE_FETCH_PAGES as they are likely to be accessed
-    page_num = 1
-    items_pages, starting_fetched_page_num = \
-        fetch_page_items(url, page_num, page_size, github_page_size)
-    store_pages(connection, items_pages, starting_fetched_page_num, cache_exp)
+    for _ in range(MAX_TRIES):
+        rate_limiter.acquire()
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
 
-    # fetch the last PRE_FETCH_PAGES as they are likely to be accessed
-    page_num = math.ceil(((max_items - github_page_size) / page_size)) + 1
-    items_pages, starting_fetched_page_num = \
-        fetch_page_items(url, page_num, page_size, github_page_size)
-    store_pages(connection, items_pages, starting_fetched_page_num, cache_exp)
+        if not rate_limiter.update(response):
+            break
 
+        logging.warning('Request \'' + url + '\' was rate limited by GitHub')
 
-# in this sample project only one worker is run so limits will not be exceeded, but
-# with several workers more coordination would need to be done
-@on_exception(expo, RateLimitException, max_tries=MAX_TRIES)
-@limits(calls=CALLS_PER_MINUTE, period=SECONDS_PER_MINUTE)
-def make_request(url):
-    return requests.get(url)
+    return response
 
 
 def simplify_item(item):
@@ -57,25 +184,43 @@ def simplify_item(item):
     }
 
 
-def fetch_page_items(url, page_num, page_size, github_page_size):
-    github_page_num = page_num_to_github_page_num(page_num, page_size, github_page_size)
+# the etag and last-modified headers of a response, used to make a conditional request for the
+# same github page later
+def response_validators(response):
+    return {key: response.headers[header]
+            for key, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified'))
+            if header in response.headers}
+
+
+# returns (response json, validators), or None if the github page couldn't be fetched. when
+# validators from an earlier response are given the request is conditional, and if github reports
+# the page is unchanged the response json is None
+def fetch_search_page(connection, url, github_page_num, validators=None):
+    headers = {}
+
+    if validators is not None:
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
 
-    # align page with github page boundaries of GITHUB_PAGE_SIZE
-    # aligned_page =
+    try:
+        response = make_request(connection, page_url(url, github_page_num), headers)
+    except requests.RequestException as e:
+        logging.warning('Request for github page ' + str(github_page_num) + ' failed: ' + str(e))
+        return None
 
-    response = make_request(page_url(url, github_page_num))
+    if response.status_code == 304:
+        return None, validators
 
-    if response.status_code == 200:
+    elif response.status_code == 200:
         response_json = response.json()
 
         if 'items' in response_json:
-            items = list(map(lambda item: simplify_item(item), response_json['items']))
+            store_repositories(response_json['items'])
 
-            # break list up into pages of page_size items
-            items_pages = [items[i * page_size:(i + 1) * page_size]
-                           for i in range((len(items) + page_size - 1) // page_size)]
-
-            return items_pages, github_page_num_to_page_num(github_page_num, page_size)
+            return response_json, response_validators(response)
 
         else:
             logging.warning('Received unexpected response from GitHub for request:' + response.url)
@@ -87,53 +232,470 @@ def fetch_page_items(url, page_num, page_size, github_page_size):
     return None
 
 
-def store_pages(connection, items_pages, page_num, cache_exp):
-    if items_pages is not None and len(items_pages) > 0:
-        for item_page in items_pages:
-            # it's possible for page data to go stale because we cache it. this is a trade off
-            # between performance and being up-to-date. the cache expire time can be played with
-            # to find the most suitable expiration time
-            connection.set(page_num, json.dumps(item_page), cache_exp)
+# a repository store that can't be written doesn't stop the items being cached and served
+def store_repositories(items):
+    if repository_store is None:
+        return
+
+    try:
+        repository_store.add(items)
+    except sqlite3.Error as e:
+        logging.warning('Unable to store repositories: ' + str(e))
+
+
+# returns (items, validators, total count), or None if the github page couldn't be fetched. items
+# and the total count are None if the request was conditional and github reports the page is
+# unchanged
+def fetch_page_items(connection, url, github_page_num, validators=None):
+    fetched = fetch_search_page(connection, url, github_page_num, validators)
+
+    if fetched is None:
+        return None
+
+    response_json, validators = fetched
+
+    if response_json is None:
+        return None, validators, None
+
+    return list(map(lambda item: simplify_item(item), response_json['items'])), validators, \
+        response_json.get('total_count')
+
+
+# the github page, its generation, its validators and the search's total count are written in a
+# single round trip through a pipeline, after taking the next generation from the counter
+def store_github_page(connection, query_id, github_page_num, items, cache_exp, validators=None,
+                      total_count=None):
+    generation = connection.incr(GENERATION_COUNTER_KEY)
+
+    pipeline = connection.pipeline(transaction=False)
+
+    # it's possible for page data to go stale because we cache it. this is a trade off between
+    # performance and being up-to-date. the cache expire time can be played with to find the most
+    # suitable expiration time
+    pipeline.set(github_page_key(query_id, github_page_num), page_codec.encode(items), cache_exp)
+    pipeline.set(github_page_key(query_id, github_page_num, GENERATION_PREFIX), generation,
+                 cache_exp)
+
+    validators_key = github_page_key(query_id, github_page_num, VALIDATORS_PREFIX)
+    pipeline.delete(validators_key)
+
+    if validators:
+        pipeline.hmset(validators_key, validators)
+        pipeline.expire(validators_key, cache_exp)
+
+    if total_count is not None:
+        pipeline.set(total_count_key(query_id), total_count, cache_exp)
+
+    pipeline.execute()
+
+    logging.info('Cached github page ' + query_id + ':' + str(github_page_num))
+
+
+# reads the github pages holding page_num, the seconds until redis drops the first of them and
+# their generation in a single round trip. returns (items, ttl, generation), items is None if any
+# of the github pages is not in the cache. the generation is a string that changes whenever any
+# of the github pages is stored again
+def get_page(connection, query_id, page_num, page_size, github_page_size, max_items):
+    github_page_nums = page_num_to_github_page_nums(page_num, page_size, github_page_size,
+                                                    max_items)
+
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.mget([github_page_key(query_id, github_page_num)
+                   for github_page_num in github_page_nums])
+    queue_ttls_and_generations(pipeline, query_id, github_page_nums)
+    results = pipeline.execute()
+
+    github_pages = results[0]
+    ttl, generation = page_ttl_and_generation(results[1:])
+
+    github_pages_items = [decode_github_page(github_page_num, github_page)
+                          for github_page_num, github_page in zip(github_page_nums, github_pages)]
+
+    if None in github_pages_items:
+        return None, ttl, generation
+
+    items = slice_page(github_pages_items, page_num, page_size, github_page_size)
+
+    return items, ttl, generation
+
+
+# the generation of page_num and the seconds until redis drops it, without reading the github
+# pages. returns (generation, ttl), generation is None if the page is not in the cache
+def get_page_generation(connection, query_id, page_num, page_size, github_page_size,
+                        max_items):
+    github_page_nums = page_num_to_github_page_nums(page_num, page_size, github_page_size,
+                                                    max_items)
+
+    pipeline = connection.pipeline(transaction=False)
+    queue_ttls_and_generations(pipeline, query_id, github_page_nums)
+    ttl, generation = page_ttl_and_generation(pipeline.execute())
+
+    return generation, ttl
+
+
+def queue_ttls_and_generations(pipeline, query_id, github_page_nums):
+    for github_page_num in github_page_nums:
+        pipeline.ttl(github_page_key(query_id, github_page_num))
+        pipeline.get(github_page_key(query_id, github_page_num, GENERATION_PREFIX))
+
+
+def page_ttl_and_generation(results):
+    ttls = results[0::2]
+    generations = results[1::2]
+
+    if min(ttls) < 0 or None in generations:
+        return min(ttls), None
+
+    return min(ttls), '.'.join(generation.decode('ascii') for generation in generations)
+
+
+# reads several github pages in a single round trip (MGET). returns a list with the items of each
+# github page, or None for github pages that are not in the cache
+def get_github_pages(connection, query_id, github_page_nums):
+    if len(github_page_nums) == 0:
+        return []
+
+    github_pages = connection.mget([github_page_key(query_id, github_page_num)
+                                    for github_page_num in github_page_nums])
+
+    return [decode_github_page(github_page_num, github_page)
+            for github_page_num, github_page in zip(github_page_nums, github_pages)]
+
+
+# the items of a cached github page, or None if it isn't cached or can't be decoded. pages the
+# codec rejects (eg: cached by an older version of the app) are treated as not cached, fetching
+# the github page again overwrites them
+def decode_github_page(github_page_num, github_page):
+    if github_page is None:
+        return None
+
+    try:
+        return page_codec.decode(github_page)
+    except ValueError as e:
+        logging.warning('Ignoring cached github page ' + str(github_page_num) + ': ' + str(e))
+
+        return None
+
+
+# gives an unchanged cached github page another cache_exp seconds
+def extend_github_page(connection, query_id, github_page_num, cache_exp):
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.expire(github_page_key(query_id, github_page_num), cache_exp)
+    pipeline.expire(github_page_key(query_id, github_page_num, GENERATION_PREFIX), cache_exp)
+    pipeline.expire(github_page_key(query_id, github_page_num, VALIDATORS_PREFIX), cache_exp)
+    pipeline.expire(total_count_key(query_id), cache_exp)
+    pipeline.execute()
+
+    logging.info('Extended github page ' + query_id + ':' + str(github_page_num))
+
+
+# the total count of results of a search, or None if none of its github pages are cached
+def get_total_count(connection, query_id):
+    total_count = connection.get(total_count_key(query_id))
+
+    return int(total_count) if total_count is not None else None
+
+
+def get_validators(connection, query_id, github_page_num):
+    validators = connection.hgetall(github_page_key(query_id, github_page_num, VALIDATORS_PREFIX))
+
+    return {key.decode('utf8'): value.decode('utf8') for key, value in validators.items()}
+
+
+# the number of seconds until each github page expires, in a single round trip. a negative ttl
+# means the github page is not in the cache
+def get_github_page_ttls(connection, query_id, github_page_nums):
+    pipeline = connection.pipeline(transaction=False)
+
+    for github_page_num in github_page_nums:
+        pipeline.ttl(github_page_key(query_id, github_page_num))
+
+    return pipeline.execute()
+
+
+# a redis lock per github page makes sure only one process (web or worker) fetches a github page at
+# a time. the lock expires after lock_timeout seconds in case its holder dies. returns a token
+# identifying the holder, or None if another process holds the lock
+def acquire_fetch_lock(connection, lock_key, lock_timeout):
+    token = uuid.uuid4().hex
+
+    if connection.set(lock_key, token, ex=lock_timeout, nx=True):
+        return token
+
+    return None
+
+
+# only deletes the lock if it is still ours. it may have expired and been taken by another process
+def release_fetch_lock(connection, lock_key, token):
+    with connection.pipeline() as pipeline:
+        try:
+            pipeline.watch(lock_key)
+
+            if pipeline.get(lock_key) == token.encode('ascii'):
+                pipeline.multi()
+                pipeline.delete(lock_key)
+                pipeline.execute()
+
+        except WatchError:
+            pass
+
+
+# returns the items of a github page, fetching it if it isn't cached. concurrent callers are
+# coalesced: one fetches the github page and the others wait up to wait_timeout seconds for it to
+# be cached instead of fetching it again. returns None if the github page couldn't be fetched
+def fetch_github_page(connection, query_id, url, github_page_num, cache_exp, lock_timeout,
+                      wait_timeout):
+    page_key = github_page_key(query_id, github_page_num)
+    lock_key = github_page_key(query_id, github_page_num, FETCH_LOCK_PREFIX)
+    deadline = time.monotonic() + wait_timeout
+
+    while time.monotonic() < deadline:
+        token = acquire_fetch_lock(connection, lock_key, lock_timeout)
+
+        if token is not None:
+            try:
+                # the previous holder may have cached the page just before we got the lock
+                items = decode_github_page(github_page_num, connection.get(page_key))
+
+                if items is not None:
+                    return items
+
+                fetched = fetch_page_items(connection, url, github_page_num)
+
+                if fetched is None:
+                    return None
+
+                items, validators, total_count = fetched
+                store_github_page(connection, query_id, github_page_num, items, cache_exp,
+                                  validators, total_count)
+
+                return items
+
+            finally:
+                release_fetch_lock(connection, lock_key, token)
+
+        # another process is fetching the github page, wait for it to cache the page. if the lock
+        # goes away without the page being cached that fetch failed, so try to take over
+        while True:
+            pipeline = connection.pipeline(transaction=False)
+            pipeline.get(page_key)
+            pipeline.exists(lock_key)
+            github_page, locked = pipeline.execute()
+            items = decode_github_page(github_page_num, github_page)
+
+            if items is not None:
+                return items
+
+            if not locked or time.monotonic() >= deadline:
+                break
+
+            time.sleep(FETCH_POLL_INTERVAL)
+
+    logging.warning('Timed out waiting for github page ' + str(github_page_num) + ' to be fetched')
+
+    return None
+
+
+# returns the items of page_num, for pages of page_size items, fetching the github pages holding
+# them that aren't cached. returns None if a github page couldn't be fetched
+def fetch_page(connection, query_id, url, page_num, page_size, github_page_size, max_items,
+               cache_exp, lock_timeout, wait_timeout):
+    github_page_nums = page_num_to_github_page_nums(page_num, page_size, github_page_size,
+                                                    max_items)
+    github_pages_items = get_github_pages(connection, query_id, github_page_nums)
+
+    for i, github_page_num in enumerate(github_page_nums):
+        if github_pages_items[i] is None:
+            github_pages_items[i] = fetch_github_page(connection, query_id, url, github_page_num,
+                                                      cache_exp, lock_timeout, wait_timeout)
+
+            if github_pages_items[i] is None:
+                return None
+
+    return slice_page(github_pages_items, page_num, page_size, github_page_size)
+
+
+# refreshes a cached github page with a conditional request. if it is unchanged the cached page is
+# only given a new expiry, which doesn't download the page again. nothing is done if another
+# process is already fetching the github page
+def refresh_github_page(connection, query_id, url, github_page_num, cache_exp, lock_timeout):
+    lock_key = github_page_key(query_id, github_page_num, FETCH_LOCK_PREFIX)
+
+    token = acquire_fetch_lock(connection, lock_key, lock_timeout)
+
+    if token is None:
+        return
+
+    try:
+        fetched = fetch_page_items(connection, url, github_page_num,
+                                   get_validators(connection, query_id, github_page_num) or None)
+
+        if fetched is None:
+            return
+
+        items, validators, total_count = fetched
+
+        if items is None:
+            extend_github_page(connection, query_id, github_page_num, cache_exp)
+        else:
+            store_github_page(connection, query_id, github_page_num, items, cache_exp, validators,
+                              total_count)
+
+    finally:
+        release_fetch_lock(connection, lock_key, token)
+
+
+#
+# concurrent pre-fetching.
+#
+# each github page that is missing (or about to expire) is fetched (or refreshed) as an asyncio
+# task. fetch_github_page() and refresh_github_page() block on redis and http, so the tasks run
+# them on a thread pool of GITHUB_PREFETCH_CONCURRENCY threads, which bounds how many github
+# requests are in flight. the shared rate limiter still applies, so the pages arrive as fast as the
+# rate limit allows: warming several github pages takes about as long as the slowest of them
+# instead of the sum
+#
+
+# returns a list of (action, github_page_num). action is 'fetch' for github pages that are not
+# cached and 'refresh' for github pages that redis drops within refresh_time seconds
+def plan_prefetch(connection, query_id, github_page_nums, refresh_time):
+    plan = []
+    github_page_nums = sorted(set(github_page_nums), key=github_page_nums.index)
+
+    for github_page_num, ttl in zip(github_page_nums,
+                                    get_github_page_ttls(connection, query_id, github_page_nums)):
+        # github pages will not be in cache if they haven't previously been fetched or if the
+        # cache time expired on them
+        if ttl < 0:
+            plan.append(('fetch', github_page_num))
+        elif ttl < refresh_time:
+            plan.append(('refresh', github_page_num))
+
+    return plan
+
+
+async def run_prefetch_plan(loop, executor, connection, config, query, plan):
+    cache_exp_time = cache_expire_time(config, query)
+    lock_timeout = config.get('GITHUB_FETCH_LOCK_TIMEOUT')
+    wait_timeout = config.get('GITHUB_FETCH_WAIT_TIMEOUT')
+
+    tasks = []
+
+    for action, github_page_num in plan:
+        logging.info('Pre-fetching github page ' + str(github_page_num) + ' (' + action + ')')
+
+        if action == 'fetch':
+            tasks.append(loop.run_in_executor(
+                executor, fetch_github_page, connection, query['id'], query['url'],
+                github_page_num, cache_exp_time, lock_timeout, wait_timeout))
+        else:
+            tasks.append(loop.run_in_executor(
+                executor, refresh_github_page, connection, query['id'], query['url'],
+                github_page_num, cache_exp_time, lock_timeout))
 
-            logging.info('Cached page ' + str(page_num))
+    # one failed page shouldn't stop the others from being cached
+    for (action, github_page_num), result in zip(plan, await asyncio.gather(
+            *tasks, return_exceptions=True)):
+        if isinstance(result, Exception):
+            logging.warning('Pre-fetching github page ' + str(github_page_num) + ' failed: '
+                            + str(result))
 
-            page_num = page_num + 1
 
+def prefetch_pages(connection, config, query, github_page_nums):
+    # stale pages, and pages that become stale within CACHE_REFRESH_TIME, are refreshed
+    plan = plan_prefetch(connection, query['id'], github_page_nums,
+                         config.get('CACHE_STALE_TIME') + config.get('CACHE_REFRESH_TIME'))
 
-# this function is executed by a worker in a background process
-def pre_fetch_pages(config, page_num, last_page):
+    if len(plan) == 0:
+        return
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(min(config.get('GITHUB_PREFETCH_CONCURRENCY'), len(plan)))
+
+    try:
+        loop.run_until_complete(run_prefetch_plan(loop, executor, connection, config, query,
+                                                  plan))
+    finally:
+        executor.shutdown()
+        loop.close()
+
+
+# this function is executed by a worker in a background process. github_page_nums are the github
+# pages of the search query planned by the PrefetchPlanner and config is the job_settings() of the
+# app config
+def pre_fetch_pages(config, query, github_page_nums):
     import redis
     from rq import Connection
 
-    redis_url = config.get('REDIS_URL')
-    github_url = config.get('GITHUB_BASE_QUERY')
-    page_size = config.get('PAGE_SIZE')
-    github_page_size = config.get('GITHUB_PAGE_SIZE')
-    cache_exp_time = config.get('CACHE_EXPIRE_TIME')
-
-    connection = redis.from_url(redis_url)
+    connection = redis.from_url(config.get('REDIS_URL'))
 
-    # fetching 1 github page (100 items / page) at a time is equivalent to 10 pages in this
-    # app (10 items / page)
-    pages_to_fetch = get_pages_to_fetch(page_num, 1, last_page)
+    use_repository_store(config)
 
     with Connection(connection):
-        for page in pages_to_fetch:
-            # page will not be in cache if it hasn't previously been fetched or if the
-            # cache time expired on it
-            if not connection.exists(page):
-                logging.info('page ' + str(page) + ' is not in the cache so fetching it')
+        prefetch_pages(connection, config, query, github_page_nums)
+
+
+# enqueues a pre-fetch job for the planned github pages, leaving out those that had a job enqueued
+# for them in the last cooldown seconds (by any process). the job covering them is either still
+# queued or has just run. returns the github pages enqueued
+def enqueue_prefetch(connection, task_queue, settings, query, github_page_nums, cooldown):
+    pipeline = connection.pipeline(transaction=False)
+
+    for github_page_num in github_page_nums:
+        pipeline.set(github_page_key(query['id'], github_page_num, PREFETCH_QUEUED_PREFIX), 1,
+                     ex=cooldown, nx=True)
+
+    github_page_nums = [github_page_num for github_page_num, queued
+                        in zip(github_page_nums, pipeline.execute()) if queued]
+
+    if len(github_page_nums) > 0:
+        task_queue.enqueue(pre_fetch_pages, settings, query, github_page_nums)
+
+    return github_page_nums
+
+
+#
+# searches share one redis. the github pages of each search expire after the search's own expire
+# time, and searches that aren't configured are kept in an LRU of at most SEARCH_MAX_QUERIES
+# searches: a sorted set of search ids scored by when they were last used. when a new search pushes
+# it over the limit, the github pages of the searches used longest ago are deleted, so a burst of
+# one-off searches can't push the pages of popular searches out of redis
+#
+
+SEARCH_QUERIES_KEY = 'search-queries'
+
+
+# marks the search as used. returns True if it is a search that isn't in the LRU yet (a new
+# search, or one that was evicted), which the caller warms
+def register_query(connection, config, query):
+    if query['pinned']:
+        return False
+
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.zadd(SEARCH_QUERIES_KEY, {query['id']: time.time()})
+    pipeline.zcard(SEARCH_QUERIES_KEY)
+    added, count = pipeline.execute()
+
+    if count > config.get('SEARCH_MAX_QUERIES'):
+        for query_id in connection.zrange(SEARCH_QUERIES_KEY, 0,
+                                          count - config.get('SEARCH_MAX_QUERIES') - 1):
+            evict_query(connection, config, query_id.decode('ascii'))
+
+    return added == 1
+
 
-                items_pages, starting_fetched_page_num = \
-                    fetch_page_items(github_url, page, page_size, github_page_size)
+# deletes everything cached for a search. only the process that removes the search from the LRU
+# deletes its keys
+def evict_query(connection, config, query_id):
+    if not connection.zrem(SEARCH_QUERIES_KEY, query_id):
+        return
 
-                store_pages(connection, items_pages, starting_fetched_page_num, cache_exp_time)
-            else:
-                logging.info('page ' + str(page) + ' is in the cache so not fetching it')
+    keys = []
 
+    for github_page_num in range(1, last_github_page_num(config) + 1):
+        keys += [github_page_key(query_id, github_page_num, prefix)
+                 for prefix in (GITHUB_PAGE_PREFIX, GENERATION_PREFIX, VALIDATORS_PREFIX)]
 
-# rudimentary, but it serves its purpose for this example project
-def get_pages_to_fetch(page_num, num_pages_pre_fetch, last_page):
-    r = range(page_num - num_pages_pre_fetch, page_num + num_pages_pre_fetch + 1)
+    connection.delete(total_count_key(query_id), *keys)
 
-    return list(filter(lambda page: 1 <= page <= last_page, r))
+    logging.info('Evicted search ' + query_id)
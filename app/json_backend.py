@@ -0,0 +1,75 @@
+import json
+import re
+import zlib
+
+
+#
+# pluggable JSON parser/serializer used by the REST endpoints.
+#
+# orjson is used when it is installed as it parses directly from bytes and serializes several
+# times faster than the stdlib. it is an optional dependency, so when it is not installed we fall
+# back to the stdlib json module. output is always UTF-8 encoded bytes with sorted keys, matching
+# what jsonify() returns
+#
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_stdlib_encode = json.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
+
+# orjson parses integers that don't fit in 64 bits as floats, losing their exact value. such an
+# integer has at least 19 digits, so input with a run of 19 digits (which may also be a long float,
+# or be in a string) is parsed by the stdlib instead
+_LONG_DIGITS = re.compile('[0-9]{19}')
+_LONG_DIGITS_BYTES = re.compile(b'[0-9]{19}')
+
+
+# raises a ValueError (json.JSONDecodeError or UnicodeDecodeError) for invalid input
+def loads(data):
+    if orjson is not None:
+        long_digits = _LONG_DIGITS if isinstance(data, str) else _LONG_DIGITS_BYTES
+
+        if long_digits.search(data) is None:
+            return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def dumps(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # orjson rejects some values the stdlib accepts, eg: integers wider than 64 bits
+            pass
+
+    return _stdlib_encode(obj).encode('utf8')
+
+
+# decompresses a gzip body, refusing to inflate it past max_size bytes so a small compressed
+# request cannot expand into an arbitrarily large one
+def gunzip(data, max_size=None):
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+
+    try:
+        if max_size is None:
+            body = decompressor.decompress(data)
+        else:
+            body = decompressor.decompress(data, max_size)
+
+            if decompressor.unconsumed_tail:
+                raise ValueError('Decompressed body exceeds ' + str(max_size) + ' bytes')
+
+        body += decompressor.flush()
+    except zlib.error as e:
+        raise ValueError('Invalid gzip body: ' + str(e))
+
+    if not decompressor.eof:
+        raise ValueError('Invalid gzip body: truncated')
+
+    return body
@@ -0,0 +1,179 @@
+import codecs
+import json
+
+from app.element_index import ElementIndex
+from app.error import InvalidRequestError
+from app.json_transformer import parse_level_key
+
+
+#
+# streaming variant of transform() for very large inputs.
+#
+# transform() needs the raw JSON string, the fully parsed dict and the serialized output in
+# memory at the same time, which is roughly three copies of the payload. here instead:
+#
+#   1. the input is read from a file-like object in chunks and decoded one element at a time
+#   2. each element is added to a compact ElementIndex (see app/element_index.py) and the
+#      parsed dict is dropped
+#   3. the nested output is generated lazily from the index, in chunks
+#
+# peak memory is therefore bounded by the size of the index, not by the size of the payload.
+#
+# the same validations as flatten_elements() and build_element_trees() are applied. the only
+# difference is that level lists are processed in the order they appear in the input rather than
+# in sorted key order, so when an input has several problems a different one may be reported first
+#
+
+READ_CHUNK_SIZE = 64 * 1024
+WRITE_CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = ' \t\n\r'
+
+# a number, literal (-Infinity is the longest) or \uXXXX escape cut off by the end of the buffer
+# leaves a tail shorter than this, without delimiters
+_MAX_PARTIAL_TOKEN = 10
+_DELIMITERS = _WHITESPACE + ',:[]{}"'
+
+
+class _StreamReader:
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+
+        chunk = self.stream.read(self.chunk_size)
+
+        try:
+            if not chunk:
+                # a multi-byte character cut off by the end of the input fails here
+                self.eof = True
+                chunk = self.text_decoder.decode(b'', final=True)
+            elif isinstance(chunk, bytes):
+                chunk = self.text_decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise InvalidRequestError('Input is not valid UTF-8')
+
+        # drop the part of the buffer that has already been consumed
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self._fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise InvalidRequestError('Invalid JSON: expected \'' + char + '\' at offset '
+                                      + str(self.pos))
+
+        self.pos += 1
+
+    def accept(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+
+        return False
+
+    # whether a decode error can come from the value being cut off by the end of the buffer. a cut
+    # off value fails in its last token: at the end of the buffer, in a string that isn't closed,
+    # or part way through a number, literal or escape that runs up to the end. any other error is
+    # invalid JSON, and reading the rest of the input wouldn't change that
+    def _cut_off(self, e):
+        tail = self.buf[e.pos:]
+
+        return e.msg.startswith('Unterminated string') \
+            or (len(tail) < _MAX_PARTIAL_TOKEN and not any(char in _DELIMITERS for char in tail))
+
+    # decodes the next complete JSON value. strings and objects are self-delimiting so a value
+    # that is cut off by the end of the buffer always fails to decode and we just read more
+    def value(self):
+        self.peek()
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                self.pos = end
+
+                return value
+            except json.JSONDecodeError as e:
+                if not self._cut_off(e) or not self._fill():
+                    raise InvalidRequestError('Invalid JSON: ' + str(e))
+
+
+def _iter_level_elements(reader):
+    if reader.peek() != '{':
+        raise InvalidRequestError('Top-level element must be a dictionary')
+
+    reader.expect('{')
+
+    if reader.accept('}'):
+        return
+
+    while True:
+        if reader.peek() != '"':
+            raise InvalidRequestError('Invalid JSON: expected a key at offset '
+                                      + str(reader.pos))
+
+        level_key = parse_level_key(reader.value())
+        reader.expect(':')
+
+        if reader.peek() != '[':
+            raise InvalidRequestError('Top-level element values must be lists')
+
+        reader.expect('[')
+
+        if not reader.accept(']'):
+            while True:
+                if reader.peek() != '{':
+                    raise InvalidRequestError('Elements must be dictionaries')
+
+                yield level_key, reader.value()
+
+                if reader.accept(']'):
+                    break
+
+                reader.expect(',')
+
+        if reader.accept('}'):
+            break
+
+        reader.expect(',')
+
+    if reader.peek() is not None:
+        raise InvalidRequestError('Invalid JSON: extra data after the top-level element')
+
+
+def load_stream(stream, chunk_size=READ_CHUNK_SIZE):
+    index = ElementIndex()
+
+    for level_key, element in _iter_level_elements(_StreamReader(stream, chunk_size)):
+        index.add(level_key, element)
+
+    index.link()
+
+    return index
+
+
+# reads and validates the whole input up front, so any InvalidRequestError is raised here rather
+# than part way through the response. returns a generator of output chunks
+def transform_stream(stream, chunk_size=READ_CHUNK_SIZE):
+    return load_stream(stream, chunk_size).iter_json(WRITE_CHUNK_SIZE)
@@ -1,6 +1,18 @@
 
 
-from app.error import InvalidRequestError
+import math
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from operator import itemgetter
+
+from app.error import InvalidRequestError, ValidationErrors
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 #
@@ -18,6 +30,7 @@ from app.error import InvalidRequestError
 #   8. all elements in the input JSON under key = 'x' where x is a number (in string form),
 #      element.level == x. this is assumed, but it is not explicitly validated in this example
 #      project
+#   9. each element's id and parent_id is a string, number or null, and its children is an array
 #
 # for the purposes of this project a fail-fast approach is taken to validation
 #
@@ -48,7 +61,16 @@ required_keys = {'id', 'children', 'level', 'parent_id', 'title'}
 # Note: I considered using a JSON schema validation library (eg: marshmallow) for this project, but
 # in the end, it seemed like overkill, so I just do the simple validations in the code below
 #
-def transform(json_input):
+def transform(json_input, collect_all=False, max_errors=None):
+    # validate everything in one pass and report every violation at once. see ValidationErrors
+    if collect_all:
+        return transform_collect_all(json_input, max_errors)
+
+    # very large inputs are validated and linked with whole-array operations when numpy is
+    # installed. see transform_vectorized()
+    if numpy is not None and count_elements(json_input) >= VECTORIZE_MIN_ELEMENTS:
+        return transform_vectorized(json_input)
+
     # create an intermediate structure for fast element lookup
     elements = flatten_elements(json_input)
 
@@ -59,67 +81,158 @@ def transform(json_input):
 
 
 # runs in O(n) time, as it processes each of n elements one time
-def flatten_elements(json_input):
+#
+# when violations is given (see Violations) problems are recorded there and validation carries on,
+# otherwise an InvalidRequestError is raised for the first one. when level_counts is given (a dict)
+# the number of elements in each level is recorded there, keyed by level in level order
+def flatten_elements(json_input, violations=None, level_counts=None):
     element_tree = {}
 
     has_root_element = False
 
+    for level_key, level_elements in iter_levels(json_input, violations):
+        if level_key[0] == '0' and len(level_elements) > 0:
+            has_root_element = True
+
+        if level_counts is not None:
+            level_counts[level_key[0]] = len(level_elements)
+
+        for element in level_elements:
+            if not validate_element(level_key, element, violations):
+                continue
+
+            element_id = element['id']
+
+            if element_id in element_tree:
+                report(violations, element_id, 'unique_id',
+                       'Duplicate id \'' + str(element_id) + '\' detected')
+                continue
+
+            element_tree[element_id] = element
+
+    if not has_root_element and len(element_tree) > 0:
+        report(violations, None, 'root_element', 'There are no root elements')
+
+    return element_tree
+
+
+# parses a top-level key once into a level key: (key, level number, whether the key is the plain
+# form of the level number). validate_element() takes the level key so the string work is done once
+# per level rather than once per element
+def parse_level_key(key):
+    try:
+        level = int(key)
+    except (TypeError, ValueError):
+        raise InvalidRequestError('Top-level element keys must be numbers')
+
+    return key, level, str(level) == key
+
+
+# validates the top-level dictionary and yields (level key, elements) for each level in order
+def iter_levels(json_input, violations=None):
     if not isinstance(json_input, dict):
-        raise InvalidRequestError('Top-level element must be a dictionary')
+        report(violations, None, 'top_level', 'Top-level element must be a dictionary')
+        return
 
-    # the keys in this object are level numbers (in string form) so we sort them to ensure they are,
-    # in order
-    for key in sorted(json_input.keys()):
+    level_keys = []
+
+    for key in json_input.keys():
         try:
-            int(key)
-        except ValueError:
-            raise InvalidRequestError('Top-level element keys must be numbers')
+            level_keys.append(parse_level_key(key))
+        except InvalidRequestError as e:
+            report(violations, None, 'level_key', e.args[0])
 
-        if not isinstance(json_input[key], list):
-            raise InvalidRequestError('Top-level element values must be lists')
+    # the keys in this object are level numbers (in string form) so we sort them numerically to
+    # ensure they are in order. a plain string sort would put '10' before '2'
+    level_keys.sort(key=itemgetter(1))
 
-        for element in json_input[key]:
-            missing_keys = list(required_keys - set(element.keys()))
+    for level_key in level_keys:
+        level_elements = json_input[level_key[0]]
 
-            if len(missing_keys) > 0:
-                raise InvalidRequestError('Element ' + str(element['id']) + ' is missing the '
-                                          'required keys: ' + ','.join(missing_keys))
+        if not isinstance(level_elements, list):
+            report(violations, None, 'level_value', 'Top-level element values must be lists')
+            continue
 
-            # validate a root element
-            if key == '0':
-                if element['parent_id'] is not None:
-                    raise InvalidRequestError('Element ' + str(element['id']) + ' is a root '
-                                              + 'element and cannot have a parent')
-                else:
-                    has_root_element = True
+        yield level_key, level_elements
 
-            # validate non-root element
-            elif key != '0' and element['parent_id'] is None:
-                raise InvalidRequestError('Element ' + str(element['id']) + ' is not a root '
-                                          + 'element and must have a parent')
 
-            if len(element['children']) > 0:
-                raise InvalidRequestError('Element ' + str(element['id']) + ' has a non-empty '
-                                          + 'children array')
+# validates a single element found under the given level key. checks that need to see the other
+# elements (unique ids, valid parents, at least one root) are left to the caller.
+#
+# returns whether the element can be indexed by id and linked, ie: it is a dictionary with all the
+# required keys, its id and parent_id can be used as keys of the index and its children is a list.
+# when collecting violations, elements that break the other rules are still indexed so their
+# children are not also reported as having invalid parents
+def validate_element(level_key, element, violations=None):
+    if not isinstance(element, dict):
+        report(violations, None, 'element_type', 'Elements must be dictionaries')
+        return False
 
-            if str(element['level']) != key:
-                raise InvalidRequestError('Element ' + str(element['id']) + '\'s level does not '
-                                          + 'match its level in the input')
+    missing_keys = list(required_keys - element.keys())
 
-            if element['id'] in element_tree:
-                raise InvalidRequestError('Duplicate id \'' + str(element['id']) + '\' detected')
+    if len(missing_keys) > 0:
+        report(violations, element.get('id'), 'required_keys',
+               'Element ' + str(element.get('id')) + ' is missing the required keys: '
+               + ','.join(missing_keys))
+        return False
 
-            element_tree[element['id']] = element
+    element_id = element['id']
+    key, level_number, is_plain_key = level_key
+    indexable = True
 
-    if not has_root_element and len(element_tree) > 0:
-        raise InvalidRequestError('There are no root elements')
+    if not is_hashable(element_id):
+        report(violations, element_id, 'id_type',
+               'Element id ' + str(element_id) + ' must be a string, number or null')
+        indexable = False
 
-    return element_tree
+    if not is_hashable(element['parent_id']):
+        report(violations, element_id, 'parent_id_type',
+               'Element ' + str(element_id) + '\'s parent_id must be a string, number or null')
+        indexable = False
+
+    # validate a root element
+    if key == '0':
+        if element['parent_id'] is not None:
+            report(violations, element_id, 'root_parent',
+                   'Element ' + str(element_id) + ' is a root element and cannot have a parent')
+
+    # validate non-root element
+    elif element['parent_id'] is None:
+        report(violations, element_id, 'non_root_parent',
+               'Element ' + str(element_id) + ' is not a root element and must have a parent')
+
+    if not isinstance(element['children'], list):
+        report(violations, element_id, 'children_type',
+               'Element ' + str(element_id) + '\'s children must be an array')
+        indexable = False
+
+    elif len(element['children']) > 0:
+        report(violations, element_id, 'empty_children',
+               'Element ' + str(element_id) + ' has a non-empty children array')
+
+    # integer levels are compared as numbers, only other types need converting to a string
+    level = element['level']
+
+    if not (is_plain_key and level.__class__ is int and level == level_number) \
+            and str(level) != key:
+        report(violations, element_id, 'level',
+               'Element ' + str(element_id) + '\'s level does not match its level in the input')
+
+    return indexable
+
+
+def is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+
+    return True
 
 
 # runs in O(n) time, as it processes each of n elements one time, with a constant
 # hash-based lookup of constant time
-def build_element_trees(elements):
+def build_element_trees(elements, violations=None):
     element_trees = []
 
     for element_id in elements:
@@ -131,10 +244,281 @@ def build_element_trees(elements):
         else:
             # elements must have valid parent_elements
             if parent_id not in elements:
-                raise InvalidRequestError('Element ' + str(element['id']) + ' has an invalid '
-                                          + 'parent')
+                report(violations, element['id'], 'valid_parent',
+                       'Element ' + str(element['id']) + ' has an invalid parent')
+                continue
 
             parent_element = elements[parent_id]
             parent_element['children'].append(element)
 
     return element_trees
+
+
+#
+# collecting every violation
+#
+# by default validation is fail-fast: the first problem raises an InvalidRequestError. clients
+# that fix their input in a loop would then need one round trip per problem, so with
+# collect_all=True the whole input is validated in a single pass and every violation is reported
+# at once in a ValidationErrors, as records of:
+#
+#   {"id": <element id, null for problems with the input as a whole>, "rule": ..., "message": ...}
+#
+# at most max_errors violations are recorded, after which validation stops
+#
+
+MAX_ERRORS = 100
+
+
+class _ViolationLimitReached(Exception):
+    pass
+
+
+class Violations(list):
+    def __init__(self, max_errors=MAX_ERRORS):
+        super().__init__()
+        self.max_errors = max(1, max_errors)
+        self.truncated = False
+
+    def add(self, element_id, rule, message):
+        if len(self) >= self.max_errors:
+            self.truncated = True
+            raise _ViolationLimitReached()
+
+        self.append({'id': element_id, 'rule': rule, 'message': message})
+
+
+# raises an InvalidRequestError, or when collecting violations records it instead
+def report(violations, element_id, rule, message):
+    if violations is None:
+        raise InvalidRequestError(message)
+
+    violations.add(element_id, rule, message)
+
+
+def transform_collect_all(json_input, max_errors=None):
+    violations = Violations(MAX_ERRORS if max_errors is None else max_errors)
+
+    try:
+        elements = flatten_elements(json_input, violations)
+        element_trees = build_element_trees(elements, violations)
+    except _ViolationLimitReached:
+        pass
+
+    if len(violations) > 0:
+        raise ValidationErrors(list(violations), violations.truncated)
+
+    return element_trees
+
+
+#
+# vectorized transformation
+#
+# flatten_elements() and build_element_trees() check and link one element at a time in python. for
+# inputs with millions of elements transform_vectorized() instead pulls the ids, parent ids and
+# levels out into numpy arrays and does the checks that compare elements with each other as
+# whole-array operations:
+#
+#   duplicate ids         sort the ids and compare neighbours
+#   parent existence      binary search each parent id in the sorted ids (searchsorted), which
+#                         also gives the position of the parent
+#   level checks          compare each level's array with its key
+#   children grouping     a stable argsort of positions by parent position
+#
+# the element trees are only linked together once every check has passed, reusing the input
+# element dicts the same way build_element_trees() does.
+#
+# only the common case where every id, parent_id and level is an integer is vectorized. any other
+# input, and any input that fails a check, goes through flatten_elements() and
+# build_element_trees() instead. valid input gives identical output either way, and invalid input
+# gets exactly the error transform() would raise without needing vectorized error reporting.
+#
+# numpy is an optional dependency. without it transform_vectorized() is the same as transform()
+#
+
+# below this many elements building the arrays costs more than the vectorized checks save
+VECTORIZE_MIN_ELEMENTS = 10000
+
+
+def count_elements(json_input):
+    if not isinstance(json_input, dict):
+        return 0
+
+    return sum(len(value) for value in json_input.values() if isinstance(value, list))
+
+
+# returns None unless every value is an int. numpy would turn booleans mixed in with integers
+# into integers, so the types are checked before building the array. integers too wide for int64
+# give another dtype
+def _int_column(values):
+    if not all(value.__class__ is int for value in values):
+        return None
+
+    column = numpy.array(values)
+
+    if column.dtype.kind != 'i':
+        return None
+
+    return column
+
+
+# returns the element trees, or None when the input is not all integers or fails a check
+def _link_vectorized(json_input):
+    elements = []
+    ids = []
+    parent_ids = []
+
+    root_start = 0
+    root_count = 0
+
+    for level_key, level_elements in iter_levels(json_input):
+        level = level_key[1]
+
+        if not level_key[2]:
+            return None
+
+        try:
+            if not all(isinstance(element, dict) and element.keys() >= required_keys
+                       for element in level_elements):
+                return None
+
+            if any(len(element['children']) > 0 for element in level_elements):
+                return None
+        except TypeError:
+            return None
+
+        start = len(elements)
+
+        elements.extend(level_elements)
+        ids.extend([element['id'] for element in level_elements])
+
+        level_parent_ids = [element['parent_id'] for element in level_elements]
+
+        if level == 0:
+            if level_parent_ids.count(None) != len(level_parent_ids):
+                return None
+
+            root_start = start
+            root_count = len(level_parent_ids)
+
+            # roots reference themselves for now so the parent id column stays all integers
+            level_parent_ids = ids[start:]
+        elif None in level_parent_ids:
+            return None
+
+        parent_ids.extend(level_parent_ids)
+
+        if len(level_elements) > 0:
+            level_column = _int_column([element['level'] for element in level_elements])
+
+            if level_column is None or not (level_column == level).all():
+                return None
+
+    count = len(elements)
+
+    id_column = _int_column(ids)
+    parent_id_column = _int_column(parent_ids)
+
+    if count == 0 or root_count == 0 or id_column is None or parent_id_column is None:
+        return None
+
+    # duplicate ids end up next to each other once sorted
+    id_order = numpy.argsort(id_column, kind='stable')
+    sorted_ids = id_column[id_order]
+
+    if (sorted_ids[1:] == sorted_ids[:-1]).any():
+        return None
+
+    found = numpy.searchsorted(sorted_ids, parent_id_column)
+    found[found == count] = 0
+
+    if not (sorted_ids[found] == parent_id_column).all():
+        return None
+
+    parents = id_order[found]
+    parents[root_start:root_start + root_count] = -1
+
+    # roots sort first (-1) and the stable sort keeps siblings in input order
+    order = numpy.argsort(parents, kind='stable')[root_count:].tolist()
+    parents = parents.tolist()
+
+    for position in order:
+        elements[parents[position]]['children'].append(elements[position])
+
+    return elements[root_start:root_start + root_count]
+
+
+def transform_vectorized(json_input):
+    element_trees = None
+
+    if numpy is not None:
+        element_trees = _link_vectorized(json_input)
+
+    if element_trees is None:
+        element_trees = build_element_trees(flatten_elements(json_input))
+
+    return element_trees
+
+
+#
+# batch transformation
+#
+# transform() is pure python and CPU bound, so within one process it is pinned to a single core by
+# the GIL. transform_batch() spreads many documents over a pool of processes sized to the host's
+# cores. batches of a single document, or a pool of a single process, are run in-process as the
+# pickling round trip to a worker would only add overhead
+#
+
+# each worker is handed several documents at once to amortize the cost of the round trip
+CHUNKS_PER_WORKER = 4
+
+_executor = None
+
+
+# os.cpu_count() is None when the number of cores can't be determined
+def cpu_count():
+    return os.cpu_count() or 1
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=cpu_count())
+
+    return _executor
+
+
+# returns the transformed element trees, or the InvalidRequestError raised for the document
+def transform_or_error(json_input):
+    try:
+        return transform(json_input)
+    except InvalidRequestError as e:
+        return e
+
+
+# transforms each document and returns the per-document results in the same order as the
+# documents. a document that fails validation gets its InvalidRequestError in place of a result
+def transform_batch(documents, executor=None):
+    global _executor
+
+    documents = list(documents)
+
+    if executor is None:
+        if len(documents) <= 1 or cpu_count() == 1:
+            return [transform_or_error(document) for document in documents]
+
+        executor = get_executor()
+
+    chunksize = max(1, math.ceil(len(documents) / (cpu_count() * CHUNKS_PER_WORKER)))
+
+    try:
+        return list(executor.map(transform_or_error, documents, chunksize=chunksize))
+    except BrokenProcessPool:
+        # a worker died (eg: killed for using too much memory). drop the pool so the next batch
+        # starts with a fresh one
+        if executor is _executor:
+            _executor = None
+
+        raise
+
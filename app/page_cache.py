@@ -0,0 +1,61 @@
+import threading
+
+from collections import OrderedDict
+
+
+#
+# per-process LRU of search result pages, in front of the pages cached in redis.
+#
+# entries are keyed by page (page number and page size) and the page's generation, made of the
+# counters in redis that store_github_page() increments every time it writes a github page. when
+# any process stores newer data for a page its generation changes, so entries for the old data are
+# never used again and fall out of the LRU. looking up the generation is a small redis read, the
+# parsed items (and, if cache_html is set, the rendered html) of a hit skip reading, parsing and
+# rendering the page
+#
+
+class PageCache:
+    def __init__(self, max_entries=128, cache_html=True):
+        self.max_entries = max_entries
+        self.cache_html = cache_html
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.stats = {'hits': 0, 'misses': 0}
+
+    # returns (items, html) or None. html is None when rendered html isn't cached
+    def get(self, page, generation):
+        key = (page, generation)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits'] += 1
+                self.entries.move_to_end(key)
+
+            return entry
+
+    def set(self, page, generation, items, html):
+        if self.max_entries <= 0:
+            return
+
+        with self.lock:
+            self.entries[(page, generation)] = (items, html if self.cache_html else None)
+            self.entries.move_to_end((page, generation))
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups > 0 else 0.0
+
+        return stats
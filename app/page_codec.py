@@ -0,0 +1,163 @@
+import json
+import zlib
+
+
+#
+# compact encoding of the github pages cached in redis.
+#
+# a page is a list of items with the same four keys (see simplify_item()). rather than repeating
+# the keys in every item, a page is stored as rows of values in a fixed column order. the url of a
+# repository is almost always https://github.com/<name>, so it is left out (stored as None) when
+# it can be rebuilt from the name. the rows are then serialized and compressed:
+#
+#   serializers    msgpack when it is installed, otherwise compact json
+#   compressors    lz4 when it is installed (faster), otherwise zlib
+#
+# both are optional dependencies. every encoded page starts with a header naming the format
+# version, serializer and compressor used, so a page written by one process can be read by any
+# process that has them installed. decode() raises a ValueError for pages it can't read (an older
+# format version, pages cached before this codec or written with a serializer or compressor that
+# isn't installed here) and callers treat them as not cached
+#
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+FORMAT_VERSION = 1
+
+COLUMNS = ('name', 'url', 'language', 'description')
+
+URL_PREFIX = 'https://github.com/'
+
+ZLIB_LEVEL = 6
+
+
+def _json_dumps(rows):
+    return json.dumps(rows, separators=(',', ':')).encode('utf8')
+
+
+def _json_loads(data):
+    return json.loads(data.decode('utf8'))
+
+
+def _msgpack_dumps(rows):
+    return msgpack.packb(rows, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+# id -> (dumps, loads), or None when its library isn't installed
+serializers = {
+    b'j': (_json_dumps, _json_loads),
+    b'm': (_msgpack_dumps, _msgpack_loads) if msgpack is not None else None
+}
+
+compressors = {
+    b'n': (lambda data: data, lambda data: data),
+    b'z': (lambda data: zlib.compress(data, ZLIB_LEVEL), zlib.decompress),
+    b'l': (lz4.frame.compress, lz4.frame.decompress) if lz4 is not None else None
+}
+
+serializer_names = {'json': b'j', 'msgpack': b'm'}
+compressor_names = {'none': b'n', 'zlib': b'z', 'lz4': b'l'}
+
+
+def available_serializers():
+    return [name for name, serializer_id in serializer_names.items()
+            if serializers[serializer_id] is not None]
+
+
+def available_compressors():
+    return [name for name, compressor_id in compressor_names.items()
+            if compressors[compressor_id] is not None]
+
+
+def _to_rows(items):
+    rows = []
+
+    for item in items:
+        row = [item.get(column) for column in COLUMNS]
+
+        if row[1] == URL_PREFIX + str(row[0]):
+            row[1] = None
+
+        rows.append(row)
+
+    return rows
+
+
+def _from_rows(rows):
+    items = []
+
+    for name, url, language, description in rows:
+        items.append({'name': name, 'url': url if url is not None else URL_PREFIX + name,
+                      'language': language, 'description': description})
+
+    return items
+
+
+class PageCodec:
+    def __init__(self, serializer=None, compressor=None):
+        if serializer is None:
+            serializer = 'msgpack' if msgpack is not None else 'json'
+
+        if compressor is None:
+            compressor = 'lz4' if lz4 is not None else 'zlib'
+
+        if serializer not in available_serializers():
+            raise ValueError('Serializer ' + serializer + ' is not available')
+
+        if compressor not in available_compressors():
+            raise ValueError('Compressor ' + compressor + ' is not available')
+
+        self.name = serializer + '+' + compressor
+
+        self.serializer_id = serializer_names[serializer]
+        self.compressor_id = compressor_names[compressor]
+
+        self.header = bytes([FORMAT_VERSION]) + self.serializer_id + self.compressor_id
+
+    def encode(self, items):
+        dumps = serializers[self.serializer_id][0]
+        compress = compressors[self.compressor_id][0]
+
+        return self.header + compress(dumps(_to_rows(items)))
+
+    # any codec can decode pages encoded by another, as long as their serializer and compressor
+    # are installed
+    def decode(self, data):
+        if len(data) < 3 or data[0] != FORMAT_VERSION:
+            raise ValueError('Unsupported page format')
+
+        serializer = serializers.get(data[1:2])
+        compressor = compressors.get(data[2:3])
+
+        if serializer is None or compressor is None:
+            raise ValueError('Page was encoded with a serializer or compressor that is not '
+                             + 'installed')
+
+        try:
+            return _from_rows(serializer[1](compressor[1](data[3:])))
+        except Exception as e:
+            raise ValueError('Invalid page: ' + str(e))
+
+
+default_codec = PageCodec()
+
+
+def encode(items):
+    return default_codec.encode(items)
+
+
+def decode(data):
+    return default_codec.decode(data)
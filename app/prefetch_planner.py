@@ -0,0 +1,120 @@
+import math
+import threading
+
+
+#
+# decides which github pages to pre-fetch from how a user is navigating the search results.
+#
+# one github page covers several pages of this app, so pre-fetching works in github pages. pages
+# can have any number of items, so a user's position is the index of the first item on the page
+# they are viewing. each user's last position and velocity (items moved per page view, smoothed
+# over recent views) are kept in a cookie. the velocity gives the direction and speed the user is
+# paging in:
+#
+#   no direction yet    (first view, or after a jump to another part of the results) the github
+#                       pages either side of the current one are pre-fetched
+#   paging forward or   the github pages ahead of the user are pre-fetched. a user moving fast
+#   backward            gets more of them, enough to cover lookahead_views more page views, up to
+#                       window github pages
+#
+# the current github page is always part of the plan so it is refreshed before it expires
+#
+
+COOKIE_NAME = 'search_nav'
+
+# weight of the latest step in the smoothed velocity
+VELOCITY_SMOOTHING = 0.5
+
+
+class PrefetchPlanner:
+    def __init__(self, github_page_size, max_items, window=2, lookahead_views=10):
+        self.github_page_size = github_page_size
+        self.max_items = max_items
+        self.window = window
+        self.lookahead_views = lookahead_views
+
+        self.lock = threading.Lock()
+        self.stats = {'plans': 0, 'forward': 0, 'backward': 0, 'undirected': 0,
+                      'github_pages_planned': 0}
+
+    # the position of the first item of page_num
+    def position(self, page_num, page_size):
+        return (page_num - 1) * page_size
+
+    def _github_page(self, position):
+        return position // self.github_page_size + 1
+
+    # returns (last position, velocity) from the navigation cookie, or None if there isn't a valid
+    # one
+    def parse(self, cookie):
+        try:
+            position, velocity = cookie.split(':')
+            position = int(position)
+            velocity = float(velocity)
+        except (AttributeError, ValueError):
+            return None
+
+        if not 0 <= position < self.max_items or not math.isfinite(velocity):
+            return None
+
+        return position, max(-self.max_items, min(velocity, self.max_items))
+
+    # the navigation state after a view of the page starting at position, as stored in the cookie
+    def update(self, navigation, position):
+        if navigation is None:
+            return position, 0.0
+
+        last_position, velocity = navigation
+        step = position - last_position
+
+        # a reload keeps the current velocity
+        if step == 0:
+            return position, velocity
+
+        # a jump (eg: to the first or last page) isn't part of a trajectory
+        if abs(step) > self.github_page_size:
+            return position, 0.0
+
+        return position, VELOCITY_SMOOTHING * step + (1 - VELOCITY_SMOOTHING) * velocity
+
+    def serialize(self, navigation):
+        return str(navigation[0]) + ':' + str(round(navigation[1], 2))
+
+    # returns the github pages to pre-fetch for a view of the page starting at position
+    def plan(self, position, navigation):
+        current = self._github_page(position)
+        last = self._github_page(self.max_items - 1)
+        velocity = navigation[1]
+
+        if abs(velocity) < 1:
+            direction = 'undirected'
+            github_pages = [current - 1, current, current + 1]
+        else:
+            direction = 'forward' if velocity > 0 else 'backward'
+            step = 1 if velocity > 0 else -1
+
+            # github pages the user would move through in the next lookahead_views views
+            ahead = math.ceil(abs(velocity) * self.lookahead_views / self.github_page_size)
+            ahead = max(1, min(ahead, self.window))
+
+            github_pages = [current + step * i for i in range(ahead + 1)]
+
+        github_pages = [github_page for github_page in github_pages if 1 <= github_page <= last]
+
+        with self.lock:
+            self.stats['plans'] += 1
+            self.stats[direction] += 1
+            self.stats['github_pages_planned'] += len(github_pages)
+
+        return github_pages
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+
+        stats['window'] = self.window
+        stats['lookahead_views'] = self.lookahead_views
+        stats['mean_github_pages_planned'] = \
+            stats['github_pages_planned'] / stats['plans'] if stats['plans'] > 0 else 0.0
+
+        return stats
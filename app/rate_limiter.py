@@ -0,0 +1,99 @@
+import math
+import time
+import uuid
+
+from redis.exceptions import WatchError
+
+
+#
+# rate limiter shared by every process (web processes and rq workers) through redis.
+#
+# calls are tracked in a sliding window: a sorted set of the calls made in the last period
+# seconds, scored by the time they were made. a call is only made once there are fewer than
+# calls in the window, otherwise the caller sleeps until the oldest call in the window leaves it.
+#
+# the limits github reports are honored too. update() is given each response and, when github
+# says the quota is used up (X-RateLimit-Remaining: 0) or asks us to back off (Retry-After), every
+# process is blocked until X-RateLimit-Reset or the Retry-After time
+#
+# note: the window is checked and updated in a WATCH/MULTI transaction, which is retried if
+# another process changed the window in between
+#
+
+KEY_PREFIX = 'ratelimit:'
+
+
+class RateLimiter:
+    def __init__(self, connection, calls, period, name='github'):
+        self.connection = connection
+        self.calls = calls
+        self.period = period
+
+        self.key = KEY_PREFIX + name
+        self.blocked_key = KEY_PREFIX + name + ':blocked'
+
+    # reserves a call in the window. returns 0 if the call can be made now, otherwise the number
+    # of seconds to wait before trying again
+    def _reserve(self):
+        now = time.time()
+        window_start = now - self.period
+
+        with self.connection.pipeline() as pipeline:
+            pipeline.watch(self.key, self.blocked_key)
+
+            blocked_until = pipeline.get(self.blocked_key)
+
+            if blocked_until is not None and float(blocked_until) > now:
+                return float(blocked_until) - now
+
+            if pipeline.zcount(self.key, window_start, '+inf') >= self.calls:
+                oldest = pipeline.zrangebyscore(self.key, window_start, '+inf', start=0, num=1,
+                                                withscores=True)
+
+                return max(oldest[0][1] + self.period - now, 0.001)
+
+            pipeline.multi()
+            pipeline.zremrangebyscore(self.key, 0, window_start)
+            pipeline.zadd(self.key, {uuid.uuid4().hex: now})
+            pipeline.expire(self.key, math.ceil(self.period) + 1)
+            pipeline.execute()
+
+        return 0
+
+    # blocks until a call can be made
+    def acquire(self):
+        while True:
+            try:
+                delay = self._reserve()
+            except WatchError:
+                continue
+
+            if delay <= 0:
+                return
+
+            time.sleep(delay)
+
+    # records the limits github reported in a response. returns whether the response means we
+    # were rate limited
+    def update(self, response):
+        now = time.time()
+        headers = response.headers
+        blocked_until = None
+
+        try:
+            if 'Retry-After' in headers:
+                blocked_until = now + float(headers['Retry-After'])
+            elif headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in headers:
+                blocked_until = float(headers['X-RateLimit-Reset'])
+            elif response.status_code == 429:
+                blocked_until = now + self.period
+        except ValueError:
+            pass
+
+        if blocked_until is None or blocked_until <= now:
+            return False
+
+        self.connection.set(self.blocked_key, blocked_until,
+                            ex=math.ceil(blocked_until - now) + 1)
+
+        return response.status_code in (403, 429)
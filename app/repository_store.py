@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+import time
+
+
+#
+# local, persistent index of the repositories fetched from github.
+#
+# every repository in a github search response is written (or updated) in a sqlite database, with
+# more of its fields than the search pages cache (stars, forks and dates). the database is a file
+# of its own, so it survives redis being flushed or restarted, and it is shared by the web
+# processes and the worker (sqlite's write-ahead log lets them read while one of them writes).
+#
+# query() filters, sorts and paginates the stored repositories without a request to github. the
+# language, stars, forks and dates have indexes. description filters are substring matches, which
+# scan the table: fast for the tens of thousands of repositories a crawl stores
+#
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS repositories (
+    name TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    language TEXT,
+    description TEXT,
+    stars INTEGER NOT NULL,
+    forks INTEGER NOT NULL,
+    created_at TEXT,
+    updated_at TEXT,
+    pushed_at TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repositories_language ON repositories (language COLLATE NOCASE, stars);
+CREATE INDEX IF NOT EXISTS repositories_stars ON repositories (stars);
+CREATE INDEX IF NOT EXISTS repositories_forks ON repositories (forks);
+CREATE INDEX IF NOT EXISTS repositories_created_at ON repositories (created_at);
+CREATE INDEX IF NOT EXISTS repositories_updated_at ON repositories (updated_at);
+CREATE INDEX IF NOT EXISTS repositories_pushed_at ON repositories (pushed_at);
+'''
+
+COLUMNS = ('name', 'url', 'language', 'description', 'stars', 'forks', 'created_at',
+           'updated_at', 'pushed_at')
+
+SORTS = ('stars', 'forks', 'created_at', 'updated_at', 'pushed_at', 'name')
+ORDERS = ('desc', 'asc')
+
+BUSY_TIMEOUT = 5   # in seconds, how long a write waits for another process's write
+
+
+# the record stored for an item of a github search response
+def repository_record(item):
+    return (item['full_name'], item['html_url'], item.get('language'), item.get('description'),
+            item.get('stargazers_count', 0), item.get('forks_count', 0), item.get('created_at'),
+            item.get('updated_at'), item.get('pushed_at'))
+
+
+class RepositoryStore:
+    def __init__(self, path):
+        self.path = path
+
+        # sqlite connections can't be shared between threads, each thread opens its own
+        self.local = threading.local()
+
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+
+        return connection
+
+    # writes the repositories of a github search response, replacing older records of them
+    def add(self, items):
+        fetched_at = time.time()
+
+        with self._connection() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO repositories (' + ', '.join(COLUMNS) + ', fetched_at) '
+                + 'VALUES (' + ', '.join('?' * (len(COLUMNS) + 1)) + ')',
+                [repository_record(item) + (fetched_at, ) for item in items])
+
+    # returns (repositories, total). language is an exact (case insensitive) match, description a
+    # case insensitive substring and min_stars a lower bound. raises a ValueError for an invalid
+    # sort, order, page or page size
+    def query(self, language=None, description=None, min_stars=None, sort='stars', order='desc',
+              page=1, per_page=10):
+        if sort not in SORTS:
+            raise ValueError('Sort invalid. sort must be one of ' + ', '.join(SORTS))
+
+        if order not in ORDERS:
+            raise ValueError('Order invalid. order must be one of ' + ', '.join(ORDERS))
+
+        if page < 1 or per_page < 1:
+            raise ValueError('Page invalid. page and per_page must be 1 or more')
+
+        conditions = []
+        params = []
+
+        if language is not None:
+            conditions.append('language = ? COLLATE NOCASE')
+            params.append(language)
+
+        if description is not None:
+            conditions.append('description LIKE ? ESCAPE \'\\\'')
+            params.append('%' + description.replace('\\', '\\\\').replace('%', '\\%')
+                          .replace('_', '\\_') + '%')
+
+        if min_stars is not None:
+            conditions.append('stars >= ?')
+            params.append(min_stars)
+
+        where = ' WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+
+        connection = self._connection()
+
+        total = connection.execute('SELECT COUNT(*) FROM repositories' + where,
+                                   params).fetchone()[0]
+
+        # name breaks ties so pages don't overlap
+        rows = connection.execute(
+            'SELECT ' + ', '.join(COLUMNS) + ' FROM repositories' + where + ' ORDER BY ' + sort
+            + ' ' + order + ', name LIMIT ? OFFSET ?',
+            params + [per_page, (page - 1) * per_page]).fetchall()
+
+        return [dict(row) for row in rows], total
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM repositories').fetchone()[0]
+
+
+stores = {}
+stores_lock = threading.Lock()
+
+
+# the store of the database at path, shared by everything in the process that uses it
+def get_store(path):
+    with stores_lock:
+        if path not in stores:
+            stores[path] = RepositoryStore(path)
+
+        return stores[path]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+
+from urllib.parse import urlencode
+
+
+#
+# github repository searches served by the app.
+#
+# a search is a query string plus an optional language, sort and order. searches are normalized
+# (whitespace collapsed, lower cased, defaults filled in) so the same search written differently
+# shares one cache, and each normalized search gets an id, a hash of it, that namespaces its keys
+# in redis. a search is passed around as a dict (it is also given to background jobs):
+#
+#   q, language, sort, order    the normalized search
+#   id                          the hash namespacing its cache keys
+#   url                         the github search url, without the page number
+#   expire_time                 seconds its github pages are fresh for
+#   pinned                      configured in SEARCH_QUERIES. pinned searches are warmed when the
+#                               app starts and never evicted
+#
+# searches that aren't configured expire after SEARCH_QUERY_EXPIRE_TIME
+#
+
+# defined by github, https://developer.github.com/v3/search/#search-repositories
+SORTS = ('stars', 'forks', 'help-wanted-issues', 'updated')
+ORDERS = ('desc', 'asc')
+MAX_QUERY_LENGTH = 256
+
+
+# raises a ValueError for an invalid search
+def normalize_query(q, language=None, sort=None, order=None):
+    q = ' '.join((q or '').split()).lower()
+    language = (language or '').strip().lower() or None
+    sort = (sort or '').strip().lower() or None
+    order = (order or '').strip().lower() or None
+
+    if len(q) == 0:
+        raise ValueError('Query invalid. q must not be empty')
+
+    if len(q) > MAX_QUERY_LENGTH:
+        raise ValueError('Query invalid. q must be at most ' + str(MAX_QUERY_LENGTH)
+                         + ' characters')
+
+    if language is not None and len(language.split()) != 1:
+        raise ValueError('Language invalid. language must be a single word')
+
+    if sort is not None and sort not in SORTS:
+        raise ValueError('Sort invalid. sort must be one of ' + ', '.join(SORTS))
+
+    if order is not None and order not in ORDERS:
+        raise ValueError('Order invalid. order must be one of ' + ', '.join(ORDERS))
+
+    # github ignores the order of best match results
+    if sort is None:
+        order = None
+    elif order is None:
+        order = 'desc'
+
+    return {'q': q, 'language': language, 'sort': sort, 'order': order}
+
+
+def query_id(normalized):
+    key = json.dumps([normalized[field] for field in ('q', 'language', 'sort', 'order')])
+
+    return hashlib.sha256(key.encode('utf8')).hexdigest()[:16]
+
+
+# the search url of the query, the page number is appended to it
+def query_url(search_url, normalized, github_page_size):
+    q = normalized['q']
+
+    if normalized['language'] is not None:
+        q += ' language:' + normalized['language']
+
+    params = [('q', q)]
+
+    if normalized['sort'] is not None:
+        params += [('sort', normalized['sort']), ('order', normalized['order'])]
+
+    params.append(('per_page', github_page_size))
+
+    return search_url + '?' + urlencode(params) + '&page='
+
+
+# returns the search dict (see above) of a search, raises a ValueError for an invalid search
+def search_query(config, q, language=None, sort=None, order=None):
+    normalized = normalize_query(q, language, sort, order)
+
+    query = dict(normalized)
+    query['id'] = query_id(normalized)
+    query['url'] = query_url(config.get('GITHUB_SEARCH_URL'), normalized,
+                             config.get('GITHUB_PAGE_SIZE'))
+    query['expire_time'] = config.get('SEARCH_QUERY_EXPIRE_TIME')
+    query['pinned'] = False
+
+    for configured in config.get('SEARCH_QUERIES'):
+        if normalize_query(configured['q'], configured.get('language'), configured.get('sort'),
+                           configured.get('order')) == normalized:
+            query['expire_time'] = configured.get('expire_time', config.get('CACHE_EXPIRE_TIME'))
+            query['pinned'] = True
+
+    return query
+
+
+def configured_queries(config):
+    return [search_query(config, configured['q'], configured.get('language'),
+                         configured.get('sort'), configured.get('order'))
+            for configured in config.get('SEARCH_QUERIES')]
@@ -0,0 +1,187 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from app import json_backend
+from app.json_transformer import transform
+
+
+#
+# opt-in content-addressed cache of transform() results.
+#
+# results are cached as serialized JSON bytes under the sha256 of the input. there are two keys
+# per result:
+#
+#   raw:<digest of the request body>       lets a byte-for-byte repeat skip parsing entirely
+#   doc:<digest of the canonical input>    catches repeats that differ only in key order or
+#                                          whitespace. the canonical form is the input
+#                                          re-serialized with sorted keys and no whitespace
+#
+# two tiers are supported and can be combined:
+#
+#   memory   a per-process LRU of at most max_entries entries holding at most max_bytes bytes of
+#            results
+#   redis    shared by all processes. entries expire after expire_time seconds
+#
+# in both tiers raw keys store the doc key rather than a second copy of the result
+#
+# results larger than max_item_size bytes are never cached in either tier. only successful
+# transforms are cached, inputs that fail validation are re-validated every time
+#
+
+KEY_PREFIX = 'transform:'
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TransformCache:
+    def __init__(self, connection=None, max_entries=256, expire_time=3600,
+                 max_item_size=8 * 1024 * 1024, max_bytes=256 * 1024 * 1024):
+        self.connection = connection
+        self.max_entries = max_entries
+        self.expire_time = expire_time
+        self.max_item_size = max_item_size
+        self.max_bytes = max_bytes
+
+        # key -> result, or the doc key for raw keys. memory_bytes is the size of all the values
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+
+        self.stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'redis_hits': 0, 'stores': 0,
+                      'too_large': 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _memory_get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+
+            if value is not None:
+                self.entries.move_to_end(key)
+
+            # raw keys point at the doc key holding the result, which may have been evicted
+            if isinstance(value, str):
+                key = value
+                value = self.entries.get(key)
+
+                if value is not None:
+                    self.entries.move_to_end(key)
+
+            return value
+
+    # the least recently used entries are evicted until there are at most max_entries holding at
+    # most max_bytes
+    def _memory_set(self, key, value):
+        if self.max_entries <= 0 or len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            old_value = self.entries.pop(key, None)
+
+            if old_value is not None:
+                self.memory_bytes -= len(old_value)
+
+            self.entries[key] = value
+            self.memory_bytes += len(value)
+
+            while len(self.entries) > self.max_entries or self.memory_bytes > self.max_bytes:
+                self.memory_bytes -= len(self.entries.popitem(last=False)[1])
+
+    def get(self, key):
+        output = self._memory_get(key)
+
+        if output is not None:
+            self._count('memory_hits')
+            return output
+
+        if self.connection is None:
+            return None
+
+        doc_key = key
+        output = self.connection.get(KEY_PREFIX + key)
+
+        # raw keys point at the doc key holding the result
+        if output is not None and key.startswith('raw:'):
+            doc_key = output.decode('ascii')
+            output = self.connection.get(KEY_PREFIX + doc_key)
+
+        if output is not None:
+            self._count('redis_hits')
+            self._memory_set(doc_key, output)
+
+            if doc_key != key:
+                self._memory_set(key, doc_key)
+
+        return output
+
+    # returns whether the result was stored, results over max_item_size are not
+    def set(self, doc_key, output, raw_key=None):
+        if len(output) > self.max_item_size:
+            self._count('too_large')
+            return False
+
+        self._memory_set(doc_key, output)
+
+        if raw_key is not None:
+            self._memory_set(raw_key, doc_key)
+
+        if self.connection is not None:
+            pipeline = self.connection.pipeline(transaction=False)
+            pipeline.set(KEY_PREFIX + doc_key, output, self.expire_time)
+
+            if raw_key is not None:
+                pipeline.set(KEY_PREFIX + raw_key, doc_key, self.expire_time)
+
+            pipeline.execute()
+
+        return True
+
+    # returns the serialized transform of a JSON request body. raises a ValueError for invalid
+    # JSON and an InvalidRequestError for input that fails validation
+    def transform_body(self, body):
+        if isinstance(body, str):
+            body = body.encode('utf8')
+
+        raw_key = 'raw:' + digest(body)
+        output = self.get(raw_key)
+
+        if output is not None:
+            self._count('hits')
+            return output
+
+        json_input = json_backend.loads(body)
+        doc_key = 'doc:' + digest(json_backend.dumps(json_input))
+        output = self.get(doc_key)
+
+        if output is not None:
+            self._count('hits')
+            # remember the raw body too, so the next byte-for-byte repeat skips parsing
+            self.set(doc_key, output, raw_key)
+
+            return output
+
+        self._count('misses')
+
+        output = json_backend.dumps(transform(json_input))
+
+        if self.set(doc_key, output, raw_key):
+            self._count('stores')
+
+        return output
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self.entries)
+            stats['memory_bytes'] = self.memory_bytes
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups > 0 else 0.0
+
+        return stats
@@ -0,0 +1,338 @@
+import threading
+import uuid
+
+from collections import OrderedDict
+
+from app.error import InvalidRequestError
+from app.json_transformer import build_element_trees, flatten_elements
+
+
+#
+# stateful element trees that are edited with small patches instead of being re-posted and
+# re-transformed in full.
+#
+# a TreeDocument keeps the id -> element index built by flatten_elements(). after
+# build_element_trees() each element's children list holds its child elements, so the index and
+# the nested output share the same element dicts and a patch only touches the elements it
+# affects:
+#
+#   add       {"op": "add", "id": ..., "parent_id": ..., "title": ...}    O(1)
+#   move      {"op": "move", "id": ..., "parent_id": ...}                 O(depth + subtree) *
+#   delete    {"op": "delete", "id": ...}                                 O(subtree) *
+#   retitle   {"op": "retitle", "id": ..., "title": ...}                  O(1)
+#
+# * plus removing the element from its siblings' list, which shifts the siblings after it. the
+#   element is found in the list through its position in positions, which is a hint: a stale
+#   position (after a sibling before it was removed) re-indexes the whole list once
+#
+# the same rules as transform() are enforced: ids are unique, parent_ids reference existing
+# elements, levels are consistent (an element's level is its parent's level + 1, or 0 for a root)
+# and there are no cycles. transform() leaves elements in a cycle out of its output, a document
+# rejects them when it is created. delete removes the element's whole subtree, and move re-levels
+# it.
+#
+# a list of patches is applied atomically. every patch's op, ids and level are checked before any
+# of them is applied, and if a patch still fails the patches before it are undone and the document
+# is left unchanged
+#
+# note: documents are held in the memory of the process that created them, so with several web
+# processes requests for a document must be routed to the same process (eg: sticky sessions)
+#
+
+patch_ops = {'add', 'move', 'delete', 'retitle'}
+
+
+class TreeDocument:
+    def __init__(self, json_input):
+        self.elements = flatten_elements(json_input)
+        self.element_trees = build_element_trees(self.elements)
+        self.positions = {}
+        self.lock = threading.Lock()
+
+        self._check_tree()
+
+    # walks down from the roots, checking levels and recording each element's position among its
+    # siblings. an element that isn't reached is in a cycle, or under one. with the levels checked
+    # and no cycles, every walk up or down the tree ends within depth steps
+    def _check_tree(self):
+        pending = [(self.element_trees, 0)]
+
+        while len(pending) > 0:
+            siblings, level = pending.pop()
+
+            for index, element in enumerate(siblings):
+                if element['level'].__class__ is not int or element['level'] != level:
+                    raise InvalidRequestError('Element ' + str(element['id']) + '\'s level does '
+                                              + 'not match its level in the tree')
+
+                self.positions[element['id']] = index
+                pending.append((element['children'], level + 1))
+
+        if len(self.positions) < len(self.elements):
+            element_id = next(element_id for element_id in self.elements
+                              if element_id not in self.positions)
+
+            raise InvalidRequestError('Element ' + str(element_id) + ' is not under a root '
+                                      + 'element, its parents form a cycle')
+
+    def _get(self, element_id):
+        if element_id not in self.elements:
+            raise InvalidRequestError('Element ' + str(element_id) + ' does not exist')
+
+        return self.elements[element_id]
+
+    def _siblings(self, element):
+        if element['parent_id'] is None:
+            return self.element_trees
+
+        return self.elements[element['parent_id']]['children']
+
+    def _parent_level(self, element_id, parent_id):
+        if parent_id is None:
+            return -1
+
+        if parent_id not in self.elements:
+            raise InvalidRequestError('Element ' + str(element_id) + ' has an invalid parent')
+
+        return self.elements[parent_id]['level']
+
+    # returns the element's index in siblings. a stale position re-indexes the list, which is
+    # searched by identity: list.index() would compare the element dicts by value
+    def _index(self, siblings, element):
+        index = self.positions.get(element['id'])
+
+        if index is None or index >= len(siblings) or siblings[index] is not element:
+            for i, sibling in enumerate(siblings):
+                self.positions[sibling['id']] = i
+
+            index = self.positions[element['id']]
+
+        return index
+
+    def _subtree(self, element):
+        subtree = [element]
+
+        for node in subtree:
+            subtree.extend(node['children'])
+
+        return subtree
+
+    def _add(self, patch, changed):
+        missing_keys = list({'parent_id', 'title'} - patch.keys())
+
+        if len(missing_keys) > 0:
+            raise InvalidRequestError('Add patch is missing the required keys: '
+                                      + ','.join(missing_keys))
+
+        element_id = patch['id']
+        parent_id = patch['parent_id']
+
+        if element_id in self.elements:
+            raise InvalidRequestError('Duplicate id \'' + str(element_id) + '\' detected')
+
+        level = self._parent_level(element_id, parent_id) + 1
+
+        if patch.get('level', level) != level:
+            raise InvalidRequestError('Element ' + str(element_id) + '\'s level does not '
+                                      + 'match its level in the tree')
+
+        element = {'children': [], 'id': element_id, 'level': level, 'parent_id': parent_id,
+                   'title': patch['title']}
+
+        siblings = self._siblings(element)
+
+        self.elements[element_id] = element
+        siblings.append(element)
+        self.positions[element_id] = len(siblings) - 1
+        changed.add(element_id)
+
+        def undo():
+            siblings.pop()
+            del self.elements[element_id]
+            del self.positions[element_id]
+
+        return undo
+
+    def _move(self, patch, changed):
+        if 'parent_id' not in patch:
+            raise InvalidRequestError('Move patch is missing the required keys: parent_id')
+
+        element = self._get(patch['id'])
+        parent_id = patch['parent_id']
+        old_parent_id = element['parent_id']
+
+        delta = self._parent_level(element['id'], parent_id) + 1 - element['level']
+
+        # walk up from the new parent to the moved element's level. reaching the moved element
+        # means the new parent is inside its subtree
+        ancestor_id = parent_id
+
+        while ancestor_id is not None and self.elements[ancestor_id]['level'] > element['level']:
+            ancestor_id = self.elements[ancestor_id]['parent_id']
+
+        if ancestor_id is not None and ancestor_id == element['id']:
+            raise InvalidRequestError('Moving element ' + str(element['id']) + ' under '
+                                      + str(parent_id) + ' would create a cycle')
+
+        old_siblings = self._siblings(element)
+        old_index = self._index(old_siblings, element)
+
+        del old_siblings[old_index]
+        element['parent_id'] = parent_id
+        new_siblings = self._siblings(element)
+        new_siblings.append(element)
+        new_index = len(new_siblings) - 1
+        self.positions[element['id']] = new_index
+
+        for node in self._subtree(element):
+            node['level'] += delta
+            changed.add(node['id'])
+
+        def undo():
+            del new_siblings[new_index]
+            old_siblings.insert(old_index, element)
+            self.positions[element['id']] = old_index
+            element['parent_id'] = old_parent_id
+
+            for node in self._subtree(element):
+                node['level'] -= delta
+
+        return undo
+
+    def _delete(self, patch, changed, deleted):
+        element = self._get(patch['id'])
+
+        siblings = self._siblings(element)
+        index = self._index(siblings, element)
+        subtree = self._subtree(element)
+
+        del siblings[index]
+
+        for node in subtree:
+            del self.elements[node['id']]
+            self.positions.pop(node['id'], None)
+            deleted.add(node['id'])
+
+        def undo():
+            for node in subtree:
+                self.elements[node['id']] = node
+
+            siblings.insert(index, element)
+            self.positions[element['id']] = index
+
+        return undo
+
+    def _retitle(self, patch, changed):
+        element = self._get(patch['id'])
+
+        if 'title' not in patch:
+            raise InvalidRequestError('Retitle patch is missing the required keys: title')
+
+        old_title = element['title']
+        element['title'] = patch['title']
+        changed.add(element['id'])
+
+        def undo():
+            element['title'] = old_title
+
+        return undo
+
+    # checks what can be checked without the document: the op, and that ids and parent_ids can be
+    # used as keys of the element index and levels are integers
+    def _validate(self, patch):
+        if not isinstance(patch, dict) or patch.get('op') not in patch_ops:
+            raise InvalidRequestError('Patch operation must be one of: '
+                                      + ','.join(sorted(patch_ops)))
+
+        if 'id' not in patch:
+            raise InvalidRequestError('Patch is missing the required keys: id')
+
+        for key in ('id', 'parent_id'):
+            try:
+                hash(patch.get(key))
+            except TypeError:
+                raise InvalidRequestError('Patch ' + key + ' ' + str(patch[key])
+                                          + ' must be a string, number or null')
+
+        if 'level' in patch and patch['level'].__class__ is not int:
+            raise InvalidRequestError('Patch level ' + str(patch['level'])
+                                      + ' must be an integer')
+
+    def _apply(self, patch, changed, deleted):
+        if patch['op'] == 'add':
+            return self._add(patch, changed)
+        elif patch['op'] == 'move':
+            return self._move(patch, changed)
+        elif patch['op'] == 'delete':
+            return self._delete(patch, changed, deleted)
+        else:
+            return self._retitle(patch, changed)
+
+    # applies the patches atomically and returns a diff of the affected elements:
+    #
+    #   {"updated": [elements, without their children], "deleted": [ids]}
+    #
+    def patch(self, patches):
+        if not isinstance(patches, list):
+            raise InvalidRequestError('Patches must be a list')
+
+        changed = set()
+        deleted = set()
+        undos = []
+
+        for patch in patches:
+            self._validate(patch)
+
+        with self.lock:
+            try:
+                for patch in patches:
+                    undos.append(self._apply(patch, changed, deleted))
+            except Exception:
+                for undo in reversed(undos):
+                    undo()
+
+                raise
+
+            updated = [{key: value for key, value in self.elements[element_id].items()
+                        if key != 'children'}
+                       for element_id in changed if element_id in self.elements]
+
+            # an id can be deleted and then added back by a later patch
+            deleted = [element_id for element_id in deleted if element_id not in self.elements]
+
+        return {'updated': updated, 'deleted': deleted}
+
+
+# in-process registry of documents by handle. the least recently used document is dropped once
+# there are more than max_documents
+class TreeDocumentStore:
+    def __init__(self, max_documents=16):
+        self.max_documents = max_documents
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, json_input):
+        document = TreeDocument(json_input)
+        handle = uuid.uuid4().hex
+
+        with self.lock:
+            self.documents[handle] = document
+
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+
+        return handle, document
+
+    # returns None for an unknown (or evicted) handle
+    def get(self, handle):
+        with self.lock:
+            document = self.documents.get(handle)
+
+            if document is not None:
+                self.documents.move_to_end(handle)
+
+            return document
+
+    def delete(self, handle):
+        with self.lock:
+            return self.documents.pop(handle, None) is not None
@@ -0,0 +1,56 @@
+import random
+
+
+#
+# synthetic JSON transformer inputs for benchmarking.
+#
+# generates the level keyed input format the transformer expects ({"0": [...], "1": [...]}) with
+# node_count elements spread over at most depth levels, with width children per element on average.
+# every element of a level gets one child before the rest of the next level picks parents at
+# random, so the trees are not perfectly balanced. the root level holds enough elements for the
+# remaining levels to fit the requested node count
+#
+
+def generate_hierarchy(node_count, width=10, depth=10, title_size=16, seed=0):
+    rng = random.Random(seed)
+    title = 'x' * title_size
+
+    # smallest number of roots such that roots * (1 + width + ... + width^(depth - 1)) >= nodes
+    capacity = sum(width ** level for level in range(max(depth, 1)))
+    root_count = max(1, -(-node_count // capacity))
+
+    json_input = {}
+    previous_level = []
+    next_id = 0
+    level = 0
+
+    while next_id < node_count and level < max(depth, 1):
+        if level == 0:
+            level_size = min(root_count, node_count)
+        else:
+            level_size = min(len(previous_level) * width, node_count - next_id)
+
+        elements = []
+
+        for i in range(level_size):
+            if level == 0:
+                parent_id = None
+            else:
+                parent_id = previous_level[rng.randrange(len(previous_level))] \
+                    if i >= len(previous_level) else previous_level[i]
+
+            elements.append({
+                'children': [],
+                'id': next_id,
+                'level': level,
+                'parent_id': parent_id,
+                'title': title
+            })
+
+            next_id += 1
+
+        json_input[str(level)] = elements
+        previous_level = [element['id'] for element in elements]
+        level += 1
+
+    return json_input
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from app.github_fetcher import simplify_item
+from app.page_codec import PageCodec, available_compressors, available_serializers
+
+
+#
+# size and speed of the encodings of cached github pages.
+#
+# the items of the example github response in the repo root are repeated (with distinct names) to
+# fill a github page, then encoded as the json array pages were cached as before app/page_codec.py
+# and with every serializer and compressor combination installed. each case reports the bytes
+# stored in redis and the best encode and decode time over several runs. the repeated items
+# compress better than a real github page would, run with --items-per-page 30 for a page of
+# distinct items:
+#
+#   $ python -m benchmarks.page_codec_benchmark --output before.json
+#   $ python -m benchmarks.page_codec_benchmark --compare before.json
+#
+
+EXAMPLE_RESPONSE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'github-search-api-example-response.json')
+
+
+def generate_page(items_per_page):
+    with open(EXAMPLE_RESPONSE, 'rb') as f:
+        response = json.loads(f.read().decode('utf8'))
+
+    example_items = [simplify_item(item) for item in response['items']]
+
+    items = []
+
+    for i in range(items_per_page):
+        item = dict(example_items[i % len(example_items)])
+
+        if i >= len(example_items):
+            item['name'] = item['name'] + '-' + str(i)
+            item['url'] = 'https://github.com/' + item['name']
+
+        items.append(item)
+
+    return items
+
+
+def _cases():
+    cases = [('json', lambda items: json.dumps(items).encode('utf8'),
+              lambda data: json.loads(data.decode('utf8')))]
+
+    for serializer in available_serializers():
+        for compressor in available_compressors():
+            codec = PageCodec(serializer, compressor)
+            cases.append((codec.name, codec.encode, codec.decode))
+
+    return cases
+
+
+def _best_time(run, repeat):
+    best = None
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run_benchmarks(items_per_page=100, repeat=100):
+    items = generate_page(items_per_page)
+    results = []
+
+    for name, encode, decode in _cases():
+        data = encode(items)
+
+        if decode(data) != items:
+            raise RuntimeError(name + ' does not round trip')
+
+        results.append({
+            'name': name,
+            'bytes': len(data),
+            'encode_seconds': _best_time(lambda: encode(items), repeat),
+            'decode_seconds': _best_time(lambda: decode(data), repeat)
+        })
+
+    return {
+        'parameters': {'items_per_page': items_per_page, 'repeat': repeat},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')},
+        'results': results
+    }
+
+
+def _print_report(report, baseline=None):
+    baseline_results = {}
+
+    if baseline is not None:
+        baseline_results = {result['name']: result for result in baseline['results']}
+
+    json_result = report['results'][0]
+
+    print('%-16s %10s %10s %14s %14s %10s' % ('case', 'bytes', 'vs json', 'encode ms',
+                                              'decode ms', 'vs base'))
+
+    for result in report['results']:
+        change = ''
+
+        if result['name'] in baseline_results:
+            change = '%.2fx' % (baseline_results[result['name']]['decode_seconds']
+                                / result['decode_seconds'])
+
+        print('%-16s %10d %9.0f%% %14.4f %14.4f %10s' % (
+            result['name'], result['bytes'], 100 * result['bytes'] / json_result['bytes'],
+            result['encode_seconds'] * 1000, result['decode_seconds'] * 1000, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the encodings of cached github pages')
+    parser.add_argument('--items-per-page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.items_per_page, args.repeat)
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    _print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.hierarchy import generate_hierarchy
+
+
+#
+# throughput and peak memory benchmarks for the JSON transformer.
+#
+# each case is timed over several runs on a fresh copy of the input (flatten and build mutate
+# their input) and the best run is kept. peak memory is measured in a separate run under
+# tracemalloc, as tracing slows the code down. results are written as JSON so runs can be compared:
+#
+#   $ python -m benchmarks.transform_benchmark --nodes 100000 --output after.json
+#   $ python -m benchmarks.transform_benchmark --nodes 100000 --compare after.json
+#
+# the route cases go through the Flask test client and need the same environment as the tests (a
+# local redis). if the app cannot be created they are reported as skipped
+#
+
+
+def _transformer_cases():
+    from app.json_transformer import build_element_trees, flatten_elements, transform
+
+    def flatten(input_str):
+        json_input = json.loads(input_str)
+
+        return lambda: flatten_elements(json_input)
+
+    def build(input_str):
+        elements = flatten_elements(json.loads(input_str))
+
+        return lambda: build_element_trees(elements)
+
+    def full(input_str):
+        json_input = json.loads(input_str)
+
+        return lambda: transform(json_input)
+
+    def parse_and_transform(input_str):
+        return lambda: transform(json.loads(input_str))
+
+    return [
+        ('flatten_elements', flatten),
+        ('build_element_trees', build),
+        ('transform', full),
+        ('json.loads + transform', parse_and_transform)
+    ]
+
+
+def _route_cases():
+    import requests_mock
+
+    from app import create_app
+    from tests.testing_config import TEST_CONFIG
+
+    # the app warms the GitHub cache on start up, which must not reach GitHub from a benchmark
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(requests_mock.ANY, json={'items': []})
+        client = create_app(TEST_CONFIG).test_client()
+
+    def form_route(input_str):
+        return lambda: _check(client.post('/json-transformer', data={'json_input': input_str}))
+
+    def api_route(input_str):
+        return lambda: _check(client.put('/api/json-transformer', data=input_str,
+                                         content_type='application/json'))
+
+    return [
+        ('POST /json-transformer', form_route),
+        ('PUT /api/json-transformer', api_route)
+    ]
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError('Route returned status code ' + str(response.status_code))
+
+    return response
+
+
+def _measure(setup, input_str, repeat):
+    best = None
+
+    for i in range(repeat):
+        run = setup(input_str)
+
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    run = setup(input_str)
+
+    tracemalloc.start()
+
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def run_benchmarks(nodes, width=10, depth=10, title_size=16, repeat=3, routes=True):
+    input_str = json.dumps(generate_hierarchy(nodes, width, depth, title_size))
+
+    cases = _transformer_cases()
+    skipped = []
+
+    if routes:
+        try:
+            cases += _route_cases()
+        except Exception as e:
+            skipped.append({'cases': 'routes', 'reason': str(e)})
+
+    results = []
+
+    for name, setup in cases:
+        seconds, peak = _measure(setup, input_str, repeat)
+
+        results.append({
+            'name': name,
+            'seconds': seconds,
+            'nodes_per_second': nodes / seconds if seconds > 0 else None,
+            'peak_memory_bytes': peak
+        })
+
+    return {
+        'parameters': {'nodes': nodes, 'width': width, 'depth': depth, 'title_size': title_size,
+                       'repeat': repeat, 'input_bytes': len(input_str)},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')},
+        'results': results,
+        'skipped': skipped
+    }
+
+
+def _print_report(report, baseline=None):
+    baseline_results = {}
+
+    if baseline is not None:
+        baseline_results = {result['name']: result for result in baseline['results']}
+
+    print('%-28s %12s %16s %14s %10s' % ('case', 'seconds', 'nodes/second', 'peak MiB',
+                                         'vs base'))
+
+    for result in report['results']:
+        change = ''
+
+        if result['name'] in baseline_results:
+            change = '%.2fx' % (baseline_results[result['name']]['seconds'] / result['seconds'])
+
+        print('%-28s %12.4f %16.0f %14.1f %10s' % (result['name'], result['seconds'],
+                                                   result['nodes_per_second'] or 0,
+                                                   result['peak_memory_bytes'] / 2 ** 20, change))
+
+    for skipped in report['skipped']:
+        print('skipped ' + skipped['cases'] + ': ' + skipped['reason'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the JSON transformer')
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--title-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-routes', action='store_true', help='skip the Flask route cases')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.nodes, args.width, args.depth, args.title_size, args.repeat,
+                            not args.no_routes)
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    _print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
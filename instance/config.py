@@ -6,14 +6,87 @@ TESTING = False
 REDIS_URL = 'redis://localhost:6379/0'
 
 CACHE_EXPIRE_TIME = 3600   # in seconds, 1 hour
-PAGE_SIZE = 10
+# expired pages are still served for this long while they are refreshed in the background. only
+# after this does a request wait on github
+CACHE_STALE_TIME = 600   # in seconds, 10 minutes
+# pages that expire within this time are refreshed early by the pre-fetch job with a conditional
+# request
+CACHE_REFRESH_TIME = 300   # in seconds, 5 minutes
+PAGE_SIZE = 10   # default, a page size up to GITHUB_PAGE_SIZE can be given with ?per_page=
+
+# upper bound for gzip encoded JSON transformer request bodies once decompressed
+JSON_MAX_DECOMPRESSED_SIZE = 512 * 1024 * 1024   # in bytes, 512MB
+
+# most violations reported by the JSON transformer API when called with ?collect_all=1
+TRANSFORM_MAX_ERRORS = 100
+
+# opt-in cache of JSON transformer results, keyed by a hash of the input. results are kept in a
+# per-process LRU of TRANSFORM_CACHE_MAX_ENTRIES entries holding at most TRANSFORM_CACHE_MAX_BYTES
+# and, if TRANSFORM_CACHE_REDIS is set, in redis for TRANSFORM_CACHE_EXPIRE_TIME seconds
+TRANSFORM_CACHE_ENABLED = False
+TRANSFORM_CACHE_REDIS = False
+TRANSFORM_CACHE_MAX_ENTRIES = 256
+TRANSFORM_CACHE_EXPIRE_TIME = 3600   # in seconds, 1 hour
+TRANSFORM_CACHE_MAX_ITEM_SIZE = 8 * 1024 * 1024   # in bytes, 8MB
+TRANSFORM_CACHE_MAX_BYTES = 256 * 1024 * 1024   # in bytes, 256MB per process
+
+# maximum number of patchable element tree documents held in memory by each process
+TREE_DOCUMENTS_MAX = 16
 
 # defined by Github
-GITHUB_BASE_QUERY = 'https://api.github.com/search/repositories?q=elixir&per_page=100&page='
+GITHUB_SEARCH_URL = 'https://api.github.com/search/repositories'
 # github gives a hard limit: only the first 1000 search results are available
 # https://developer.github.com/v3/search/
 GITHUB_MAX_ITEMS = 1000
 GITHUB_PAGE_SIZE = 100
 
+# only one process fetches a github page at a time, others wait for its result. the lock expires
+# after GITHUB_FETCH_LOCK_TIMEOUT in case its holder dies, so it must outlast a fetch including
+# waiting on the github rate limit
+GITHUB_FETCH_LOCK_TIMEOUT = 300   # in seconds, 5 minutes
+GITHUB_FETCH_WAIT_TIMEOUT = 30   # in seconds
+
+# github pages fetched concurrently when pre-fetching and warming the cache
+GITHUB_PREFETCH_CONCURRENCY = 4
+
+# github pages pre-fetched ahead of a user paging through the results. users paging faster get
+# more, enough for their next GITHUB_PREFETCH_LOOKAHEAD_VIEWS page views, up to the window
+GITHUB_PREFETCH_WINDOW = 2
+GITHUB_PREFETCH_LOOKAHEAD_VIEWS = 10
+# a github page is put in at most one pre-fetch job every GITHUB_PREFETCH_COOLDOWN
+GITHUB_PREFETCH_COOLDOWN = 30   # in seconds
+
+# searches warmed when the app starts and never evicted, each with its own expire time (in seconds,
+# CACHE_EXPIRE_TIME if not given). other searches expire after SEARCH_QUERY_EXPIRE_TIME, and only
+# the SEARCH_MAX_QUERIES used most recently are kept
+SEARCH_QUERIES = [
+    {'q': 'elixir', 'expire_time': 3600}
+]
+SEARCH_QUERY_EXPIRE_TIME = 600   # in seconds, 10 minutes
+SEARCH_MAX_QUERIES = 100
+
+# crawls of every result of a search (see app/github_crawler.py) split the search by
+# CRAWL_DATE_FIELD (created or pushed) into date ranges with at most GITHUB_MAX_ITEMS results each,
+# from CRAWL_START_DATE to today, and fetch CRAWL_CONCURRENCY github pages at a time. the previous
+# index of a search is dropped CRAWL_INDEX_GRACE_TIME after a crawl replaces it
+CRAWL_DATE_FIELD = 'created'
+CRAWL_START_DATE = '2008-01-01'
+CRAWL_CONCURRENCY = 4
+CRAWL_INDEX_GRACE_TIME = 60   # in seconds
+# a crawl is rate limited to 10 github requests a minute, tens of thousands of results take hours
+CRAWL_JOB_TIMEOUT = 6 * 3600   # in seconds, 6 hours
+
+# repositories in github responses are also written, with their stars, forks and dates, to a
+# local sqlite database that can be queried at /api/repositories. a relative path is in the
+# instance folder. None disables the store
+REPOSITORY_STORE_PATH = 'repositories.sqlite3'
+
+# search pages served by each process are kept in a per-process LRU of
+# SEARCH_PAGE_CACHE_MAX_ENTRIES pages, including their rendered html if SEARCH_PAGE_CACHE_HTML is
+# set. browsers and proxies may cache a page for up to SEARCH_PAGE_MAX_AGE
+SEARCH_PAGE_CACHE_MAX_ENTRIES = 128
+SEARCH_PAGE_CACHE_HTML = True
+SEARCH_PAGE_MAX_AGE = 60   # in seconds
+
 
 
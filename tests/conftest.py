@@ -4,7 +4,7 @@ import os
 import pytest
 import requests_mock
 
-from app import create_app
+from app import create_app, redis_store
 from tests.testing_config import TEST_CONFIG
 
 
@@ -20,7 +20,7 @@ with open(os.path.join(
     test_github_search_api_last_page_response = json.loads(f.read().decode('utf8').rstrip())
 
 
-github_url = TEST_CONFIG['GITHUB_BASE_QUERY']
+github_url = 'https://api.github.com/search/repositories?q=elixir&per_page=100&page='
 
 
 @pytest.fixture
@@ -31,6 +31,9 @@ def app():
 
         app = create_app(TEST_CONFIG)
 
+        # start each test with an empty cache (and rate limit window)
+        redis_store.flushall()
+
         yield app
 
 
@@ -0,0 +1,49 @@
+import json
+
+from app.json_transformer import flatten_elements, transform
+from benchmarks.hierarchy import generate_hierarchy
+from benchmarks.page_codec_benchmark import run_benchmarks as run_page_codec_benchmarks
+from benchmarks.transform_benchmark import run_benchmarks
+
+
+def test_generate_hierarchy_node_count_and_depth():
+    json_input = generate_hierarchy(1234, width=3, depth=4)
+
+    level_counts = {}
+    flatten_elements(json_input, level_counts=level_counts)
+
+    assert sum(level_counts.values()) == 1234
+    assert len(json_input) <= 4
+
+
+def test_generate_hierarchy_is_valid_input():
+    json_input = generate_hierarchy(500, width=4, depth=6, title_size=3)
+
+    element_trees = transform(json_input)
+
+    assert len(element_trees) == len(json_input['0'])
+    assert element_trees[0]['title'] == 'xxx'
+
+
+def test_run_benchmarks_report():
+    report = run_benchmarks(200, repeat=1, routes=False)
+
+    assert report['parameters']['nodes'] == 200
+    assert [result['name'] for result in report['results']] == \
+        ['flatten_elements', 'build_element_trees', 'transform', 'json.loads + transform']
+    assert all(result['peak_memory_bytes'] > 0 for result in report['results'])
+
+    # the report must be plain JSON so runs can be saved and compared
+    json.dumps(report)
+
+
+def test_run_page_codec_benchmarks_report():
+    report = run_page_codec_benchmarks(100, repeat=1)
+
+    assert report['results'][0]['name'] == 'json'
+    assert 'json+zlib' in [result['name'] for result in report['results']]
+
+    # the encoded pages are smaller than the json they replace
+    assert all(result['bytes'] < report['results'][0]['bytes'] for result in report['results'][1:])
+
+    json.dumps(report)
@@ -0,0 +1,64 @@
+import io
+import json
+import os
+
+from app.error import InvalidRequestError
+from app.json_stream import load_stream
+from app.json_transformer import transform
+
+#
+# for more elaborate testing import and use the unittest module. here we keep it very
+# lightweight and simple
+#
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_in.json'), 'rb') as f:
+    test_data_json_input_str = f.read().decode('utf8').rstrip()
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_out.json'), 'rb') as f:
+    test_data_json_output_str = f.read().decode('utf8').rstrip()
+
+
+def dumps(json_obj):
+    return json.dumps(json_obj, sort_keys=True, indent=2)
+
+
+def load_index(json_input):
+    return load_stream(io.BytesIO(json.dumps(json_input).encode('utf8')))
+
+
+def test_element_index_iter_json():
+    index = load_index(json.loads(test_data_json_input_str))
+
+    assert len(index) == 7
+    assert test_data_json_output_str == dumps(json.loads(''.join(index.iter_json(16))))
+
+
+def test_element_index_matches_transform_with_extra_keys_and_late_parents():
+    # the element under level '1' references a parent that is only added under level '2'
+    json_input = {
+        '0': [{'children': [], 'id': 'a', 'level': 0, 'parent_id': None, 'title': 'A'}],
+        '1': [{'children': [], 'id': 'b', 'level': 1, 'parent_id': 'c', 'title': 'B',
+               'color': 'red'}],
+        '2': [{'children': [], 'id': 'c', 'level': 2, 'parent_id': 'a', 'title': 'C'}]
+    }
+
+    index = load_index(json_input)
+
+    assert dumps(transform(json_input)) == dumps(json.loads(''.join(index.iter_json(1024))))
+
+
+def test_element_index_invalid_parent_throws():
+    json_input = {
+        '0': [{'children': [], 'id': 1, 'level': 0, 'parent_id': None, 'title': 'Title'}],
+        '1': [{'children': [], 'id': 2, 'level': 1, 'parent_id': 10, 'title': 'Child Title'}]
+    }
+
+    try:
+        load_index(json_input)
+
+        assert False, 'Invalid request error should be thrown for non root element with invalid ' \
+                      + 'parent'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 2 has an invalid parent',)
@@ -0,0 +1,103 @@
+import datetime
+import re
+import requests_mock
+
+from urllib.parse import parse_qs, urlparse
+
+from rq import Queue
+
+from app import redis_store, github_fetcher
+from app.github_crawler import split_shard, shard_url, run_crawl, get_index_info, \
+    get_index_page, enqueue_crawl
+from app.search_queries import search_query
+from tests.testing_config import TEST_CONFIG
+
+
+# shards over 5 results are split, and shards are fetched 2 results a page
+CONFIG = dict(TEST_CONFIG, GITHUB_MAX_ITEMS=5, GITHUB_PAGE_SIZE=2)
+
+query = search_query(CONFIG, 'elixir')
+
+# 4 repositories created on each of the first 6 days of 2019
+repositories = [{'full_name': 'user/repo-' + str(day) + '-' + str(i),
+                 'html_url': 'https://github.com/user/repo-' + str(day) + '-' + str(i),
+                 'language': 'Elixir', 'description': None,
+                 'created': datetime.date(2019, 1, day)}
+                for day in range(1, 7) for i in range(4)]
+
+
+# answers searches with a created:A..B qualifier like the github search api would
+def github_search(request, context):
+    params = parse_qs(urlparse(request.url).query)
+    start, end = [datetime.datetime.strptime(date, '%Y-%m-%d').date()
+                  for date in re.search(r'created:(\S+)\.\.(\S+)', params['q'][0]).groups()]
+    page, per_page = int(params['page'][0]), int(params['per_page'][0])
+
+    found = [dict(repository, created=None) for repository in repositories
+             if start <= repository['created'] <= end]
+
+    return {'total_count': len(found), 'items': found[(page - 1) * per_page:page * per_page]}
+
+
+def test_split_shard():
+    assert split_shard((datetime.date(2019, 1, 1), datetime.date(2019, 1, 4))) == \
+        [(datetime.date(2019, 1, 1), datetime.date(2019, 1, 2)),
+         (datetime.date(2019, 1, 3), datetime.date(2019, 1, 4))]
+
+
+def test_shard_url():
+    assert shard_url(CONFIG, query, (datetime.date(2019, 1, 1), datetime.date(2019, 1, 4))) == \
+        'https://api.github.com/search/repositories?q=elixir+created%3A2019-01-01..2019-01-04' \
+        + '&per_page=2&page='
+
+
+def test_crawl(app, monkeypatch):
+    monkeypatch.setattr(github_fetcher, 'CALLS_PER_MINUTE', 10000)
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(requests_mock.ANY, json=github_search)
+
+        run_crawl(redis_store, CONFIG, query)
+
+    info = get_index_info(redis_store, query['id'])
+
+    # every repository once, past the cap of 5 results a search
+    assert info['total'] == 24
+    assert info['shards'] > 1
+
+    items, total = get_index_page(redis_store, CONFIG, query['id'], 3, 10)
+
+    assert total == 24
+    assert [item['name'] for item in items] == \
+        [repository['full_name'] for repository in repositories[20:24]]
+
+
+def test_crawl_failure_keeps_index(app, monkeypatch):
+    monkeypatch.setattr(github_fetcher, 'CALLS_PER_MINUTE', 10000)
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(requests_mock.ANY, json=github_search)
+
+        run_crawl(redis_store, CONFIG, query)
+
+    version = get_index_info(redis_store, query['id'])['version']
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(requests_mock.ANY, status_code=500)
+
+        run_crawl(redis_store, CONFIG, query)
+
+    assert get_index_info(redis_store, query['id'])['version'] == version
+
+
+def test_get_index_page_not_crawled(app):
+    assert get_index_page(redis_store, CONFIG, query['id'], 1, 10) == (None, 0)
+
+
+def test_enqueue_crawl_once(app):
+    task_queue = Queue('default', connection=redis_store)
+
+    assert enqueue_crawl(redis_store, task_queue, CONFIG, query, 600)
+    assert not enqueue_crawl(redis_store, task_queue, CONFIG, query, 600)
+
+    assert len(task_queue) == 1
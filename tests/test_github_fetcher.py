@@ -0,0 +1,284 @@
+import requests_mock
+import time
+
+from rq import Queue
+
+from app import redis_store, github_fetcher
+from app.github_fetcher import store_github_page, get_github_pages, get_page, \
+    page_num_to_github_page_nums, slice_page, pre_fetch_pages, fetch_page, fetch_github_page, \
+    refresh_github_page, get_validators, plan_prefetch, prefetch_pages, \
+    warm_cache, enqueue_warm_cache, enqueue_prefetch, job_settings, github_page_key, \
+    register_query, FETCH_LOCK_PREFIX, GENERATION_PREFIX, VALIDATORS_PREFIX
+from app.search_queries import search_query
+from tests.conftest import github_url, test_github_search_api_first_page_response, \
+    test_github_search_api_last_page_response
+from tests.testing_config import TEST_CONFIG
+
+
+query = search_query(TEST_CONFIG, 'elixir')
+query_id = query['id']
+
+
+# simplified items like the ones cached for github pages
+def repos(*names):
+    return [{'name': name, 'url': 'https://github.com/' + name, 'language': 'Elixir',
+             'description': None} for name in names]
+
+
+def test_page_num_to_github_page_nums():
+    assert page_num_to_github_page_nums(1, 10, 100, 1000) == [1]
+    assert page_num_to_github_page_nums(10, 10, 100, 1000) == [1]
+    assert page_num_to_github_page_nums(11, 10, 100, 1000) == [2]
+
+    # items 90 to 119
+    assert page_num_to_github_page_nums(4, 30, 100, 1000) == [1, 2]
+
+
+def test_page_num_to_github_page_nums_stops_at_max_items():
+    # items 994 to 999, github has no page 11
+    assert page_num_to_github_page_nums(143, 7, 100, 1000) == [10]
+
+
+def test_slice_page():
+    github_pages_items = [list(range(0, 100)), list(range(100, 200))]
+
+    assert slice_page(github_pages_items[:1], 2, 10, 100) == list(range(10, 20))
+    assert slice_page(github_pages_items, 4, 30, 100) == list(range(90, 120))
+    assert slice_page(github_pages_items[1:], 3, 50, 100) == list(range(100, 150))
+
+
+def test_store_github_page_get_github_pages(app):
+    store_github_page(redis_store, query_id, 2, repos('a/a', 'b/b'),
+                      TEST_CONFIG['CACHE_EXPIRE_TIME'])
+
+    assert get_github_pages(redis_store, query_id, [1, 2, 3]) == [None, repos('a/a', 'b/b'), None]
+    assert 0 < redis_store.ttl(github_page_key(query_id, 2)) <= TEST_CONFIG['CACHE_EXPIRE_TIME']
+
+
+def test_get_github_pages_no_pages(app):
+    assert get_github_pages(redis_store, query_id, []) == []
+
+
+def test_get_page_across_github_pages(app):
+    numbered_repos = repos(*[str(i) + '/repo' for i in range(0, 200)])
+
+    store_github_page(redis_store, query_id, 1, numbered_repos[0:100], 3600)
+
+    items, ttl, generation = get_page(redis_store, query_id, 4, 30, 100, 1000)
+
+    # github page 2 isn't cached
+    assert items is None and generation is None
+
+    store_github_page(redis_store, query_id, 2, numbered_repos[100:200], 60)
+
+    items, ttl, generation = get_page(redis_store, query_id, 4, 30, 100, 1000)
+
+    assert items == numbered_repos[90:120]
+    assert ttl <= 60
+    assert generation == '1.2'
+
+    store_github_page(redis_store, query_id, 2, numbered_repos[100:200], 60)
+
+    assert get_page(redis_store, query_id, 4, 30, 100, 1000)[2] == '1.3'
+
+    # a github page that expired and is stored again gets a new generation
+    redis_store.delete(github_page_key(query_id, 1),
+                       github_page_key(query_id, 1, GENERATION_PREFIX))
+    store_github_page(redis_store, query_id, 1, numbered_repos[0:100], 3600)
+
+    assert get_page(redis_store, query_id, 4, 30, 100, 1000)[2] == '4.3'
+
+
+def test_pre_fetch_pages_fetches_github_page_once(app):
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), json=test_github_search_api_first_page_response)
+
+        pre_fetch_pages(TEST_CONFIG, query, [1, 1])
+
+        assert mock_request.call_count == 1
+
+    assert redis_store.exists(github_page_key(query_id, 1))
+
+
+def test_fetch_page(app):
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), json=test_github_search_api_first_page_response)
+
+        items = fetch_page(redis_store, query_id, github_url, 2, 10, 100, 1000, 60, 60, 5)
+
+    assert items[0]['name'] == test_github_search_api_first_page_response['items'][10]['full_name']
+    assert len(items) == 10
+    assert not redis_store.exists(github_page_key(query_id, 1, FETCH_LOCK_PREFIX))
+
+    # the test response only has 30 items
+    assert len(get_github_pages(redis_store, query_id, [1])[0]) == 30
+
+
+def test_fetch_github_page_waits_for_lock_holder(app):
+    # another process holds the lock and has cached the page
+    redis_store.set(github_page_key(query_id, 1, FETCH_LOCK_PREFIX), 'token', 60)
+    store_github_page(redis_store, query_id, 1, repos('a/a'), 60)
+
+    with requests_mock.Mocker() as mock_request:
+        assert fetch_github_page(redis_store, query_id, github_url, 1, 60, 60, 5) == repos('a/a')
+        assert mock_request.call_count == 0
+
+
+def test_fetch_github_page_wait_timeout(app):
+    redis_store.set(github_page_key(query_id, 1, FETCH_LOCK_PREFIX), 'token', 60)
+
+    with requests_mock.Mocker() as mock_request:
+        assert fetch_github_page(redis_store, query_id, github_url, 1, 60, 60, 0.3) is None
+        assert mock_request.call_count == 0
+
+    # the lock of the other process is left alone
+    assert redis_store.get(github_page_key(query_id, 1, FETCH_LOCK_PREFIX)) == b'token'
+
+
+def test_fetch_github_page_stores_validators(app):
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), json=test_github_search_api_first_page_response,
+                         headers={'ETag': '"abc"',
+                                  'Last-Modified': 'Tue, 02 Apr 2019 10:00:00 GMT'})
+
+        fetch_github_page(redis_store, query_id, github_url, 1, 60, 60, 5)
+
+    assert get_validators(redis_store, query_id, 1) == {'etag': '"abc"',
+                                              'last_modified': 'Tue, 02 Apr 2019 10:00:00 GMT'}
+
+
+def test_refresh_github_page_not_modified(app):
+    store_github_page(redis_store, query_id, 1, repos('a/a', 'b/b'), 10, {'etag': '"abc"'})
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), status_code=304)
+
+        refresh_github_page(redis_store, query_id, github_url, 1, 3600, 60)
+
+        assert mock_request.last_request.headers['If-None-Match'] == '"abc"'
+
+    # the cached page is kept and only its expiry is extended
+    assert get_github_pages(redis_store, query_id, [1]) == [repos('a/a', 'b/b')]
+    assert redis_store.ttl(github_page_key(query_id, 1)) > 10
+    assert redis_store.ttl(github_page_key(query_id, 1, VALIDATORS_PREFIX)) > 10
+
+
+def test_refresh_github_page_modified(app):
+    store_github_page(redis_store, query_id, 1, repos('a/a'), 10, {'etag': '"abc"'})
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), json=test_github_search_api_first_page_response,
+                         headers={'ETag': '"def"'})
+
+        refresh_github_page(redis_store, query_id, github_url, 1, 3600, 60)
+
+    assert get_github_pages(redis_store, query_id, [1])[0][0]['name'] == 'elixir-lang/elixir'
+    assert get_validators(redis_store, query_id, 1) == {'etag': '"def"'}
+
+
+def test_undecodable_github_page_is_refetched(app):
+    # a github page cached as json, before pages were encoded with the page codec
+    redis_store.set(github_page_key(query_id, 1), '[{"name": "a/a"}]', 60)
+    redis_store.set(github_page_key(query_id, 1, GENERATION_PREFIX), 1, 60)
+
+    assert get_github_pages(redis_store, query_id, [1]) == [None]
+    assert get_page(redis_store, query_id, 1, 10, 100, 1000)[0] is None
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), json=test_github_search_api_first_page_response)
+
+        items = fetch_github_page(redis_store, query_id, github_url, 1, 60, 60, 5)
+
+    assert items[0]['name'] == 'elixir-lang/elixir'
+    assert get_github_pages(redis_store, query_id, [1]) == [items]
+
+
+def test_plan_prefetch(app):
+    store_github_page(redis_store, query_id, 1, [], 3600)
+    store_github_page(redis_store, query_id, 2, [], 60)
+
+    # github page 1 is cached, github page 2 is about to expire and github page 3 is missing
+    assert plan_prefetch(redis_store, query_id, [1, 2, 2, 3], 300) == [('refresh', 2), ('fetch', 3)]
+
+
+def test_prefetch_pages_concurrently(app, monkeypatch):
+    fetched = []
+
+    def slow_fetch_github_page(connection, query_id, url, github_page_num, *args):
+        time.sleep(0.5)
+        fetched.append(github_page_num)
+
+    monkeypatch.setattr(github_fetcher, 'fetch_github_page', slow_fetch_github_page)
+
+    start = time.monotonic()
+    prefetch_pages(redis_store, TEST_CONFIG, query, [1, 10])
+
+    assert time.monotonic() - start < 0.9
+    assert sorted(fetched) == [1, 10]
+
+
+def test_enqueue_warm_cache_once(app):
+    task_queue = Queue('default', connection=redis_store)
+
+    enqueue_warm_cache(redis_store, task_queue, TEST_CONFIG)
+    enqueue_warm_cache(redis_store, task_queue, TEST_CONFIG)
+
+    assert len(task_queue) == 1
+
+
+def test_warm_cache_skips_cached_pages(app):
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(github_url + str(1), json=test_github_search_api_first_page_response)
+        mock_request.get(github_url + str(10), json=test_github_search_api_last_page_response)
+
+        warm_cache(TEST_CONFIG)
+        warm_cache(TEST_CONFIG)
+
+        assert mock_request.call_count == 2
+
+    assert redis_store.exists(github_page_key(query_id, 1), github_page_key(query_id, 10)) == 2
+
+
+def test_enqueue_prefetch_cooldown(app):
+    task_queue = Queue('default', connection=redis_store)
+    settings = job_settings(TEST_CONFIG)
+
+    assert enqueue_prefetch(redis_store, task_queue, settings, query, [1, 2], 30) == [1, 2]
+
+    # github page 2 was just enqueued, only github page 3 is new
+    assert enqueue_prefetch(redis_store, task_queue, settings, query, [2, 3], 30) == [3]
+    assert enqueue_prefetch(redis_store, task_queue, settings, query, [1, 2, 3], 30) == []
+
+    assert len(task_queue) == 2
+    assert task_queue.jobs[0].args == (settings, query, [1, 2])
+    assert 'TRANSFORM_CACHE_ENABLED' not in task_queue.jobs[0].args[0]
+
+
+def test_github_pages_are_namespaced_by_query(app):
+    other_query_id = search_query(TEST_CONFIG, 'phoenix')['id']
+
+    store_github_page(redis_store, query_id, 1, repos('a/a'), 60)
+    store_github_page(redis_store, other_query_id, 1, repos('b/b'), 60)
+
+    assert get_github_pages(redis_store, query_id, [1]) == [repos('a/a')]
+    assert get_github_pages(redis_store, other_query_id, [1]) == [repos('b/b')]
+
+
+def test_register_query_evicts_least_recently_used(app):
+    queries = [search_query(TEST_CONFIG, q) for q in ('ecto', 'phoenix', 'plug')]
+
+    assert register_query(redis_store, TEST_CONFIG, queries[0])
+    assert register_query(redis_store, TEST_CONFIG, queries[1])
+    assert not register_query(redis_store, TEST_CONFIG, queries[0])
+
+    store_github_page(redis_store, queries[1]['id'], 1, repos('a/a'), 60)
+    store_github_page(redis_store, queries[0]['id'], 1, repos('b/b'), 60)
+
+    # SEARCH_MAX_QUERIES is 2, phoenix is the least recently used
+    assert register_query(redis_store, TEST_CONFIG, queries[2])
+
+    assert not redis_store.exists(github_page_key(queries[1]['id'], 1))
+    assert redis_store.exists(github_page_key(queries[0]['id'], 1))
+
+    # configured queries are never part of the LRU
+    assert not register_query(redis_store, TEST_CONFIG, query)
@@ -0,0 +1,60 @@
+import gzip
+import json
+
+from app import json_backend
+
+
+def test_json_backend_round_trip():
+    obj = {'b': [1, 2.5, None], 'a': 'é'}
+
+    assert json_backend.loads(json_backend.dumps(obj)) == obj
+
+
+def test_json_backend_dumps_sorts_keys():
+    assert json_backend.dumps({'b': 1, 'a': 2}) == b'{"a":2,"b":1}'
+
+
+def test_json_backend_dumps_big_integers():
+    assert json_backend.dumps({'id': 2 ** 70}) == ('{"id":' + str(2 ** 70) + '}').encode('utf8')
+
+
+def test_json_backend_loads_big_integers():
+    for value in (2 ** 64, -2 ** 63 - 1, 10 ** 30):
+        data = '{"id": ' + str(value) + '}'
+
+        assert json_backend.loads(data.encode('utf8')) == {'id': value}
+        assert json_backend.loads(data) == {'id': value}
+        assert json_backend.loads(data)['id'].__class__ is int
+
+
+def test_json_backend_loads_invalid_throws():
+    try:
+        json_backend.loads(b'{"a": ')
+
+        assert False, 'ValueError should be thrown for invalid JSON'
+    except ValueError:
+        pass
+
+
+def test_json_backend_gunzip():
+    data = json.dumps({'a': 1}).encode('utf8')
+
+    assert json_backend.gunzip(gzip.compress(data)) == data
+
+
+def test_json_backend_gunzip_over_max_size_throws():
+    try:
+        json_backend.gunzip(gzip.compress(b' ' * 1000), 100)
+
+        assert False, 'ValueError should be thrown for a body over the max size'
+    except ValueError as e:
+        assert e.args == ('Decompressed body exceeds 100 bytes',)
+
+
+def test_json_backend_gunzip_invalid_throws():
+    try:
+        json_backend.gunzip(b'not gzip')
+
+        assert False, 'ValueError should be thrown for an invalid gzip body'
+    except ValueError:
+        pass
@@ -0,0 +1,161 @@
+import io
+import json
+import os
+
+from app.error import InvalidRequestError
+from app.json_stream import transform_stream
+
+#
+# for more elaborate testing import and use the unittest module. here we keep it very
+# lightweight and simple
+#
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_in.json'), 'rb') as f:
+    test_data_json_input_str = f.read().decode('utf8').rstrip()
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_out.json'), 'rb') as f:
+    test_data_json_output_str = f.read().decode('utf8').rstrip()
+
+
+def dumps(json_obj):
+    return json.dumps(json_obj, sort_keys=True, indent=2)
+
+
+def stream_transform(json_str, chunk_size=1024):
+    chunks = transform_stream(io.BytesIO(json_str.encode('utf8')), chunk_size)
+
+    return json.loads(''.join(chunks))
+
+
+def test_json_stream_empty_json():
+    assert '[]' == dumps(stream_transform('{}'))
+
+
+def test_json_stream_valid_data():
+    assert test_data_json_output_str == dumps(stream_transform(test_data_json_input_str))
+
+
+def test_json_stream_valid_data_tiny_chunks():
+    # chunk boundaries fall inside keys, strings and elements
+    assert test_data_json_output_str == dumps(stream_transform(test_data_json_input_str, 3))
+
+
+def test_json_stream_valid_data_one_byte_chunks():
+    # chunk boundaries also fall inside numbers and literals
+    assert test_data_json_output_str == dumps(stream_transform(test_data_json_input_str, 1))
+
+
+def test_json_stream_keeps_extra_keys():
+    elements_input = '''
+{
+  "0": [
+    {"children": [], "id": 1, "level": 0, "parent_id": null, "title": "\\u00e9", "a": [1]}
+  ]
+}
+'''.strip()
+
+    assert [{'a': [1], 'children': [], 'id': 1, 'level': 0, 'parent_id': None,
+             'title': 'é'}] == stream_transform(elements_input, 2)
+
+
+def test_json_stream_deep_hierarchy():
+    depth = 5000
+    elements = {str(level): [{'children': [], 'id': level, 'level': level,
+                              'parent_id': level - 1 if level > 0 else None, 'title': 'T'}]
+                for level in range(depth)}
+
+    chunks = transform_stream(io.BytesIO(json.dumps(elements).encode('utf8')))
+    output = ''.join(chunks)
+
+    assert output.count('"id":') == depth
+
+
+def test_json_stream_top_level_not_dictionary_throws():
+    try:
+        stream_transform('[]')
+
+        assert False, 'Invalid request error should be thrown for a non-dictionary input'
+    except InvalidRequestError as e:
+        assert e.args == ('Top-level element must be a dictionary',)
+
+
+def test_json_stream_invalid_parent_throws():
+    elements_input = '''
+{
+  "0": [{"children": [], "id": 1, "level": 0, "parent_id": null, "title": "Title"}],
+  "1": [{"children": [], "id": 2, "level": 1, "parent_id": 10, "title": "Child Title"}]
+}
+'''.strip()
+
+    try:
+        stream_transform(elements_input)
+
+        assert False, 'Invalid request error should be thrown for non root element with invalid ' \
+                      + 'parent'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 2 has an invalid parent',)
+
+
+def test_json_stream_duplicate_id_throws():
+    elements_input = '''
+{
+  "0": [
+    {"children": [], "id": 1, "level": 0, "parent_id": null, "title": "Title"},
+    {"children": [], "id": 1, "level": 0, "parent_id": null, "title": "Title"}
+  ]
+}
+'''.strip()
+
+    try:
+        stream_transform(elements_input)
+
+        assert False, 'Invalid request error should be thrown for request with duplicate ids'
+    except InvalidRequestError as e:
+        assert e.args == ('Duplicate id \'1\' detected',)
+
+
+def test_json_stream_truncated_input_throws():
+    try:
+        stream_transform(test_data_json_input_str[:-20])
+
+        assert False, 'Invalid request error should be thrown for truncated input'
+    except InvalidRequestError as e:
+        assert e.args[0].startswith('Invalid JSON')
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_json_stream_early_syntax_error_throws_without_reading_the_rest():
+    elements = ','.join('{"id": ' + str(element_id) + ', "children": [], "level": 0, '
+                        + '"parent_id": null, "title": "' + 'x' * 100 + '"}'
+                        for element_id in range(10000))
+    stream = CountingStream(('{"0": [{"id": 0, "title": tru}, ' + elements + ']}').encode('utf8'))
+
+    try:
+        transform_stream(stream, 1024)
+
+        assert False, 'Invalid request error should be thrown for invalid JSON'
+    except InvalidRequestError as e:
+        assert e.args[0].startswith('Invalid JSON')
+
+    assert stream.reads == 1
+
+
+def test_json_stream_truncated_utf8_throws():
+    try:
+        transform_stream(io.BytesIO(b'{"0": []} \xc3'))
+
+        assert False, 'Invalid request error should be thrown for input ending part way through ' \
+                      + 'a character'
+    except InvalidRequestError as e:
+        assert e.args == ('Input is not valid UTF-8',)
@@ -0,0 +1,30 @@
+from app.page_cache import PageCache
+
+
+def test_page_cache_generation():
+    page_cache = PageCache(max_entries=4)
+    page_cache.set(1, 1, ['a'], '<html>a</html>')
+
+    assert page_cache.get(1, 1) == (['a'], '<html>a</html>')
+
+    # newer data was stored for the page
+    assert page_cache.get(1, 2) is None
+
+
+def test_page_cache_lru():
+    page_cache = PageCache(max_entries=2)
+    page_cache.set(1, 1, ['a'], None)
+    page_cache.set(2, 1, ['b'], None)
+    page_cache.get(1, 1)
+    page_cache.set(3, 1, ['c'], None)
+
+    assert page_cache.get(2, 1) is None
+    assert page_cache.get(1, 1) is not None
+    assert page_cache.get_stats()['entries'] == 2
+
+
+def test_page_cache_without_html():
+    page_cache = PageCache(cache_html=False)
+    page_cache.set(1, 1, ['a'], '<html>a</html>')
+
+    assert page_cache.get(1, 1) == (['a'], None)
@@ -0,0 +1,64 @@
+import json
+import pytest
+
+from app import page_codec
+from app.page_codec import PageCodec, available_compressors, available_serializers
+
+
+items = [
+    {'name': 'elixir-lang/elixir', 'url': 'https://github.com/elixir-lang/elixir',
+     'language': 'Elixir', 'description': 'Elixir is a dynamic, functional language'},
+    {'name': 'moved/repo', 'url': 'https://example.com/moved/repo', 'language': None,
+     'description': None}
+]
+
+
+def test_round_trip_every_available_codec():
+    for serializer in available_serializers():
+        for compressor in available_compressors():
+            codec = PageCodec(serializer, compressor)
+
+            assert codec.decode(codec.encode(items)) == items
+            assert codec.decode(codec.encode([])) == []
+
+
+def test_url_is_left_out_when_it_can_be_rebuilt():
+    data = PageCodec('json', 'none').encode(items)
+
+    assert json.loads(data[3:].decode('utf8')) == [
+        ['elixir-lang/elixir', None, 'Elixir', 'Elixir is a dynamic, functional language'],
+        ['moved/repo', 'https://example.com/moved/repo', None, None]
+    ]
+
+
+def test_decodes_pages_of_other_codecs():
+    data = PageCodec('json', 'zlib').encode(items)
+
+    assert page_codec.decode(data) == items
+
+
+def test_rejects_other_format_versions():
+    data = PageCodec('json', 'none').encode(items)
+
+    with pytest.raises(ValueError):
+        page_codec.decode(bytes([page_codec.FORMAT_VERSION + 1]) + data[1:])
+
+
+def test_rejects_json_pages():
+    with pytest.raises(ValueError):
+        page_codec.decode(json.dumps(items).encode('utf8'))
+
+
+def test_rejects_corrupt_pages():
+    data = PageCodec('json', 'zlib').encode(items)
+
+    with pytest.raises(ValueError):
+        page_codec.decode(data[:-4])
+
+    with pytest.raises(ValueError):
+        page_codec.decode(b'')
+
+
+def test_unavailable_codec():
+    with pytest.raises(ValueError):
+        PageCodec('pickle', 'zlib')
@@ -0,0 +1,64 @@
+from app.prefetch_planner import PrefetchPlanner
+
+
+def test_prefetch_planner_first_view():
+    planner = PrefetchPlanner(100, 1000)
+    navigation = planner.update(planner.parse(None), planner.position(15, 10))
+
+    assert navigation == (140, 0.0)
+    assert planner.plan(140, navigation) == [1, 2, 3]
+
+
+def test_prefetch_planner_forward():
+    planner = PrefetchPlanner(100, 1000, window=2, lookahead_views=10)
+    navigation = planner.update(planner.parse('130:10.0'), 140)
+
+    assert navigation == (140, 10.0)
+    assert planner.plan(140, navigation) == [2, 3]
+
+
+def test_prefetch_planner_fast_backward():
+    planner = PrefetchPlanner(100, 1000, window=2, lookahead_views=10)
+    navigation = planner.update(planner.parse('540:-50'), 490)
+
+    assert planner.plan(490, navigation) == [5, 4, 3]
+
+
+def test_prefetch_planner_page_size():
+    planner = PrefetchPlanner(100, 1000, window=2, lookahead_views=10)
+
+    # pages of 50 items, moving forward one page per view
+    navigation = planner.update(planner.parse('0:50'), planner.position(2, 50))
+
+    assert navigation == (50, 50.0)
+    assert planner.plan(50, navigation) == [1, 2, 3]
+
+
+def test_prefetch_planner_jump():
+    planner = PrefetchPlanner(100, 1000)
+    navigation = planner.update(planner.parse('0:5'), 990)
+
+    assert navigation == (990, 0.0)
+    assert planner.plan(990, navigation) == [9, 10]
+
+
+def test_prefetch_planner_invalid_cookie():
+    planner = PrefetchPlanner(100, 1000)
+
+    assert planner.parse('abc') is None
+    assert planner.parse('1000:1') is None
+    assert planner.parse('5:nan') is None
+    assert planner.serialize(planner.update(planner.parse('50:10000'), 60)) == '60:505.0'
+
+
+def test_prefetch_planner_stats():
+    planner = PrefetchPlanner(100, 1000, window=3)
+    planner.plan(140, (140, 0.0))
+    planner.plan(140, (140, 10.0))
+
+    stats = planner.get_stats()
+
+    assert stats['window'] == 3
+    assert stats['plans'] == 2
+    assert stats['undirected'] == 1 and stats['forward'] == 1
+    assert stats['mean_github_pages_planned'] == 2.5
@@ -0,0 +1,55 @@
+import requests
+import time
+
+from app import redis_store
+from app.rate_limiter import RateLimiter
+
+
+def make_response(status_code, headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+
+    return response
+
+
+def test_rate_limiter_window(app):
+    redis_store.flushall()
+
+    rate_limiter = RateLimiter(redis_store, 2, 60, 'test')
+    rate_limiter.acquire()
+    rate_limiter.acquire()
+
+    # the window is shared with every other limiter using the same name
+    assert 59 < RateLimiter(redis_store, 2, 60, 'test')._reserve() <= 60
+    assert RateLimiter(redis_store, 2, 60, 'other')._reserve() == 0
+
+
+def test_rate_limiter_remaining_exhausted(app):
+    redis_store.flushall()
+
+    rate_limiter = RateLimiter(redis_store, 10, 60, 'test')
+    response = make_response(200, {'X-RateLimit-Remaining': '0',
+                                   'X-RateLimit-Reset': str(int(time.time()) + 30)})
+
+    # the response itself succeeded, but no more calls can be made until the reset
+    assert not rate_limiter.update(response)
+    assert 28 < rate_limiter._reserve() <= 30
+
+
+def test_rate_limiter_retry_after(app):
+    redis_store.flushall()
+
+    rate_limiter = RateLimiter(redis_store, 10, 60, 'test')
+
+    assert rate_limiter.update(make_response(403, {'Retry-After': '20'}))
+    assert 19 < rate_limiter._reserve() <= 20
+
+
+def test_rate_limiter_not_limited(app):
+    redis_store.flushall()
+
+    rate_limiter = RateLimiter(redis_store, 10, 60, 'test')
+
+    assert not rate_limiter.update(make_response(200, {'X-RateLimit-Remaining': '9'}))
+    assert rate_limiter._reserve() == 0
@@ -0,0 +1,72 @@
+import pytest
+
+from app.repository_store import RepositoryStore
+from tests.conftest import test_github_search_api_first_page_response
+
+
+github_items = test_github_search_api_first_page_response['items']
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RepositoryStore(str(tmp_path / 'repositories.sqlite3'))
+    store.add(github_items)
+
+    return store
+
+
+def test_add_keeps_full_records(store):
+    items, total = store.query(per_page=1)
+
+    assert total == len(github_items) == store.count()
+    assert items == [{'name': 'elixir-lang/elixir', 'url': 'https://github.com/elixir-lang/elixir',
+                      'language': 'Elixir', 'description': github_items[0]['description'],
+                      'stars': 14945, 'forks': 2151, 'created_at': '2011-01-09T08:43:57Z',
+                      'updated_at': '2019-03-26T01:24:54Z', 'pushed_at': '2019-03-24T14:55:28Z'}]
+
+
+def test_add_replaces_records(store):
+    store.add([dict(github_items[0], stargazers_count=1)])
+
+    items, total = store.query(sort='stars', order='asc', per_page=1)
+
+    assert total == len(github_items)
+    assert items[0]['name'] == 'elixir-lang/elixir' and items[0]['stars'] == 1
+
+
+def test_query_filters(store):
+    items, total = store.query(language='ELIXIR', min_stars=1000, per_page=100)
+
+    assert total == len(items) > 0
+    assert all(item['language'] == 'Elixir' and item['stars'] >= 1000 for item in items)
+
+    items, total = store.query(description='FRAMEWORK', per_page=100)
+
+    assert total > 0
+    assert all('framework' in item['description'].lower() for item in items)
+
+    # like wildcards in the description are matched literally
+    assert store.query(description='%')[1] == \
+        len([item for item in github_items if '%' in (item['description'] or '')])
+
+
+def test_query_sorts_and_paginates(store):
+    first_items, total = store.query(sort='created_at', order='asc', page=1, per_page=20)
+    last_items = store.query(sort='created_at', order='asc', page=2, per_page=20)[0]
+
+    created = [item['created_at'] for item in first_items + last_items]
+
+    assert len(created) == total
+    assert created == sorted(created)
+
+
+def test_query_invalid(store):
+    with pytest.raises(ValueError):
+        store.query(sort='description')
+
+    with pytest.raises(ValueError):
+        store.query(page=0)
+
+
+def test_store_persists(store):
+    assert RepositoryStore(store.path).count() == len(github_items)
@@ -1,6 +1,17 @@
 
+import gzip
 import json
 import os
+import requests_mock
+
+from rq import Queue
+
+from app import create_app, redis_store
+from app.github_crawler import store_index
+from app.github_fetcher import store_github_page
+from app.search_queries import search_query
+from tests.conftest import test_github_search_api_first_page_response
+from tests.testing_config import TEST_CONFIG
 
 
 #
@@ -17,6 +28,9 @@ with open(os.path.join(os.path.dirname(__file__),
     test_data_json_output_str = f.read().decode('utf8').rstrip()
 
 
+elixir_query_id = search_query(TEST_CONFIG, 'elixir')['id']
+
+
 def dumps(json_obj):
     return json.dumps(json_obj, sort_keys=True, indent=2)
 
@@ -62,3 +76,316 @@ def test_github_elixir_search_get_last_page(client):
 
     assert response.status_code == 200
     assert 'andreapavoni/nova' in str(response.data)
+
+
+def test_github_elixir_search_get_last_page_of_odd_page_size(client):
+    # the last 6 items, all on github page 10
+    response = client.get('/github-elixir-search?per_page=7&page=143')
+
+    assert response.status_code == 200
+    assert 'andreapavoni/nova' in str(response.data)
+
+
+def test_json_transformer_stream_post(client):
+    response = client.post('/json-transformer/stream', data=test_data_json_input_str,
+                           content_type='application/json')
+
+    assert response.status_code == 200
+    assert test_data_json_output_str == dumps(response.json)
+
+
+def test_json_transformer_stream_post_invalid(client):
+    response = client.post('/json-transformer/stream', data='[]', content_type='application/json')
+
+    assert response.status_code == 400
+
+
+def test_api_json_transformer_put(client):
+    response = client.put('/api/json-transformer', data=test_data_json_input_str,
+                          content_type='application/json')
+
+    assert response.status_code == 200
+    assert test_data_json_output_str == dumps(response.json)
+
+
+def test_api_json_transformer_put_gzip(client):
+    response = client.put('/api/json-transformer',
+                          data=gzip.compress(test_data_json_input_str.encode('utf8')),
+                          content_type='application/json', headers={'Content-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert test_data_json_output_str == dumps(response.json)
+
+
+def test_api_json_transformer_put_invalid_json(client):
+    response = client.put('/api/json-transformer', data='{"0": ',
+                          content_type='application/json')
+
+    assert response.status_code == 400
+
+
+def test_api_json_transformer_put_wrong_content_type(client):
+    response = client.put('/api/json-transformer', data=test_data_json_input_str,
+                          content_type='text/plain')
+
+    assert response.status_code == 415
+
+
+def test_api_json_transformer_batch_post(client):
+    body = '[' + test_data_json_input_str + ', [], {}]'
+
+    response = client.post('/api/json-transformer/batch', data=body,
+                           content_type='application/json')
+
+    assert response.status_code == 200
+    assert len(response.json) == 3
+    assert test_data_json_output_str == dumps(response.json[0]['result'])
+    assert response.json[1] == {'error': 'Top-level element must be a dictionary'}
+    assert response.json[2] == {'result': []}
+
+
+def test_api_json_transformer_batch_post_wrong_field_types(client):
+    body = '[' + test_data_json_input_str + ', {"0": [{"children": null, "id": 1, "level": 0, ' \
+        + '"parent_id": null, "title": "T"}]}]'
+
+    response = client.post('/api/json-transformer/batch', data=body,
+                           content_type='application/json')
+
+    assert response.status_code == 200
+    assert test_data_json_output_str == dumps(response.json[0]['result'])
+    assert response.json[1] == {'error': 'Element 1\'s children must be an array'}
+
+
+def test_api_json_transformer_batch_post_ndjson(client):
+    body = json.dumps(json.loads(test_data_json_input_str)) + '\n{"0": \n{}\n'
+
+    response = client.post('/api/json-transformer/batch', data=body,
+                           content_type='application/x-ndjson')
+    entries = [json.loads(line) for line in response.data.decode('utf8').splitlines()]
+
+    assert response.status_code == 200
+    assert len(entries) == 3
+    assert test_data_json_output_str == dumps(entries[0]['result'])
+    assert entries[1]['error'].startswith('Invalid JSON')
+    assert entries[2] == {'result': []}
+
+
+def test_api_documents_patch(client):
+    response = client.post('/api/documents', data=test_data_json_input_str,
+                           content_type='application/json')
+
+    assert response.status_code == 201
+
+    document_url = '/api/documents/' + response.json['handle']
+
+    response = client.patch(document_url, data='[{"op": "retitle", "id": 10, "title": "Home"}]',
+                            content_type='application/json')
+
+    assert response.status_code == 200
+    assert response.json == {'updated': [{'id': 10, 'level': 0, 'parent_id': None,
+                                          'title': 'Home'}], 'deleted': []}
+
+    response = client.get(document_url)
+
+    assert response.status_code == 200
+    assert response.json[0]['title'] == 'Home'
+
+    assert client.delete(document_url).status_code == 204
+
+    # the app's 404 error handler responds with a 400
+    assert client.get(document_url).status_code == 400
+
+
+def test_api_json_transformer_put_collect_all(client):
+    body = '{"0": [{"children": [1], "id": 1, "level": 1, "parent_id": 2, "title": "T"}]}'
+
+    response = client.put('/api/json-transformer?collect_all=1', data=body,
+                          content_type='application/json')
+
+    assert response.status_code == 400
+    assert [error['rule'] for error in response.json['errors']] == \
+        ['root_parent', 'empty_children', 'level', 'valid_parent']
+    assert response.json['truncated'] is False
+
+
+def test_api_json_transformer_put_collect_all_max_errors(client):
+    body = json.dumps({'1': [{'children': [], 'id': i, 'level': 1, 'parent_id': None, 'title': 'T'}
+                             for i in range(20)]})
+
+    for max_errors, errors in (('0', 1), ('-5', 1), ('3', 3), ('1000', 10)):
+        response = client.put('/api/json-transformer?collect_all=1&max_errors=' + max_errors,
+                              data=body, content_type='application/json')
+
+        assert response.status_code == 400
+        assert len(response.json['errors']) == errors
+        assert response.json['truncated'] is True
+
+
+def test_github_elixir_search_prefetch_navigation(client):
+    client.get('/github-elixir-search?page=1')
+    response = client.get('/github-elixir-search?page=2')
+
+    assert response.status_code == 200
+    # positions are item indexes, page 2 starts at item 10
+    assert 'search_nav=10:5.0' in response.headers['Set-Cookie']
+
+    stats = client.get('/api/github-elixir-search/prefetch-stats').json
+
+    assert stats['window'] == 2
+    assert stats['plans'] == 2 and stats['forward'] == 1
+
+
+def test_github_elixir_search_serves_stale_page(client):
+    # past its fresh time but not yet dropped by redis
+    store_github_page(redis_store, elixir_query_id, 1, [{'name': 'stale/repo', 'url': '',
+                                                         'language': 'Elixir', 'description': ''}],
+                      60)
+
+    with requests_mock.Mocker() as mock_request:
+        response = client.get('/github-elixir-search?page=1')
+
+        assert mock_request.call_count == 0
+
+    assert response.status_code == 200
+    assert 'stale/repo' in str(response.data)
+
+    # the pre-fetch job refreshes the stale github page
+    job = Queue('default', connection=redis_store).jobs[-1]
+
+    assert 1 in job.args[2]
+
+
+def test_github_elixir_search_page_cache(client):
+    store_github_page(redis_store, elixir_query_id, 1, [{'name': 'first/repo', 'url': '',
+                                                         'language': 'Elixir', 'description': ''}],
+                      3600)
+
+    response = client.get('/github-elixir-search?page=1')
+    etag = response.headers['ETag']
+
+    assert response.headers['Cache-Control'] == 'private, max-age=60'
+    assert client.get('/github-elixir-search?page=1').status_code == 200
+    assert client.get('/github-elixir-search?page=1',
+                      headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/github-elixir-search/cache-stats').json['hits'] == 2
+
+    # storing newer data for the page changes its generation
+    store_github_page(redis_store, elixir_query_id, 1, [{'name': 'second/repo', 'url': '',
+                                                         'language': 'Elixir', 'description': ''}],
+                      3600)
+
+    response = client.get('/github-elixir-search?page=1', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert 'second/repo' in str(response.data)
+
+
+def test_github_elixir_search_per_page(client):
+    response = client.get('/github-elixir-search?page=2&per_page=25')
+
+    assert response.status_code == 200
+    assert 'per_page=25' in str(response.data)
+
+    # items 25 to 29 of the first github page, the test response only has 30 items
+    assert str(response.data).count('<tr>') == 1 + 5
+
+
+def test_github_elixir_search_per_page_invalid(client):
+    response = client.get('/github-elixir-search?per_page=101')
+
+    assert response.status_code == 400
+
+
+def test_github_search(client):
+    phoenix_url = 'https://api.github.com/search/repositories?q=phoenix+language%3Aelixir' \
+        + '&sort=stars&order=desc&per_page=100&page='
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(phoenix_url + str(1), json=test_github_search_api_first_page_response)
+
+        response = client.get('/github-search?q=Phoenix&language=elixir&sort=stars&page=2')
+
+    assert response.status_code == 200
+
+    # links carry the normalized search
+    assert 'q=phoenix' in str(response.data) and 'sort=stars' in str(response.data) \
+        and 'order=desc' in str(response.data)
+
+    # the new search is warmed in the background
+    job = Queue('default', connection=redis_store).jobs[0]
+
+    assert job.args[1]['url'] == phoenix_url
+    assert job.args[2] == [1, 10]
+
+
+def test_github_search_last_page_of_small_search(client):
+    phoenix_url = 'https://api.github.com/search/repositories?q=phoenix&per_page=100&page='
+
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(phoenix_url + str(1), json={
+            'total_count': 15, 'items': test_github_search_api_first_page_response['items'][:15]})
+
+        response = client.get('/github-search?q=phoenix')
+
+    assert response.status_code == 200
+    assert 'page=2&amp;q=phoenix">Last Page' in str(response.data)
+    assert client.get('/github-search?q=phoenix&page=2').status_code == 200
+    assert client.get('/github-search?q=phoenix&page=3').status_code == 400
+
+
+def test_github_search_and_elixir_search_pages_are_cached_separately(client):
+    assert 'action="/github-search"' not in str(client.get('/github-elixir-search').data)
+    assert 'action="/github-search"' in str(client.get('/github-search?q=elixir').data)
+
+
+def test_github_search_invalid(client):
+    assert client.get('/github-search').status_code == 400
+    assert client.get('/github-search?q=phoenix&sort=name').status_code == 400
+
+
+def test_github_elixir_search_all(client):
+    # the app's 404 error handler responds with a 400
+    assert client.get('/github-elixir-search?all=1').status_code == 400
+
+    response = client.post('/api/github-search/crawl', data={'q': 'elixir'})
+
+    assert response.status_code == 202
+    assert response.json == {'query': elixir_query_id, 'enqueued': True}
+
+    store_index(redis_store, TEST_CONFIG, elixir_query_id,
+                [{'name': 'user/repo-' + str(i), 'url': 'https://github.com/user/repo-' + str(i),
+                  'language': 'Elixir', 'description': None} for i in range(1500)], 4)
+
+    response = client.get('/github-elixir-search?all=1&page=150')
+
+    assert response.status_code == 200
+    assert 'user/repo-1499' in str(response.data) and 'all=1' in str(response.data)
+    assert client.get('/api/github-search/crawl?q=elixir').json['total'] == 1500
+
+
+def test_api_repositories(tmp_path):
+    with requests_mock.Mocker() as mock_request:
+        mock_request.get(requests_mock.ANY, json=test_github_search_api_first_page_response)
+
+        app = create_app(dict(TEST_CONFIG,
+                              REPOSITORY_STORE_PATH=str(tmp_path / 'repositories.sqlite3')))
+        redis_store.flushall()
+
+        assert app.test_client().get('/github-elixir-search?page=1').status_code == 200
+
+    # the store is kept when redis is flushed
+    redis_store.flushall()
+
+    response = app.test_client().get('/api/repositories?language=elixir&sort=forks&per_page=2')
+
+    assert response.status_code == 200
+    assert response.json['total'] > 2
+    assert [item['name'] for item in response.json['items']] == \
+        ['elixir-lang/elixir', 'elixir-ecto/ecto']
+
+    assert app.test_client().get('/api/repositories?sort=owner').status_code == 400
+
+
+def test_api_repositories_disabled(client):
+    # the app's 404 error handler responds with a 400
+    assert client.get('/api/repositories').status_code == 400
@@ -0,0 +1,54 @@
+import pytest
+
+from app.search_queries import normalize_query, query_id, search_query, configured_queries
+from tests.conftest import github_url
+from tests.testing_config import TEST_CONFIG
+
+
+def test_normalize_query():
+    assert normalize_query('  Web   Framework ', ' Elixir ') == \
+        {'q': 'web framework', 'language': 'elixir', 'sort': None, 'order': None}
+
+    assert normalize_query('web', sort='stars') == \
+        {'q': 'web', 'language': None, 'sort': 'stars', 'order': 'desc'}
+
+    # the order of best match results is ignored
+    assert normalize_query('web', order='asc')['order'] is None
+
+
+@pytest.mark.parametrize('q, language, sort, order', [
+    ('', None, None, None),
+    (None, None, None, None),
+    ('x' * 257, None, None, None),
+    ('web', 'elixir erlang', None, None),
+    ('web', None, 'name', None),
+    ('web', None, 'stars', 'up')
+])
+def test_normalize_query_invalid(q, language, sort, order):
+    with pytest.raises(ValueError):
+        normalize_query(q, language, sort, order)
+
+
+def test_query_id():
+    assert query_id(normalize_query('Web  Framework')) == query_id(normalize_query('web framework'))
+    assert query_id(normalize_query('web')) != query_id(normalize_query('web', 'elixir'))
+    assert query_id(normalize_query('web')) != query_id(normalize_query('web', sort='stars'))
+
+
+def test_search_query():
+    query = search_query(TEST_CONFIG, 'phoenix', 'elixir', 'stars', 'asc')
+
+    assert query['url'] == 'https://api.github.com/search/repositories' \
+        + '?q=phoenix+language%3Aelixir&sort=stars&order=asc&per_page=100&page='
+    assert query['expire_time'] == TEST_CONFIG['SEARCH_QUERY_EXPIRE_TIME']
+    assert not query['pinned']
+
+
+def test_configured_queries():
+    queries = configured_queries(TEST_CONFIG)
+
+    assert len(queries) == 1
+    assert queries[0]['url'] == github_url
+    assert queries[0]['expire_time'] == 3600
+    assert queries[0]['pinned']
+    assert search_query(TEST_CONFIG, ' ELIXIR ') == queries[0]
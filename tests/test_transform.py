@@ -2,8 +2,11 @@
 import json
 import os
 
-from app.error import InvalidRequestError
-from app.json_transformer import transform
+from concurrent.futures import ProcessPoolExecutor
+
+from app.error import InvalidRequestError, ValidationErrors
+from app.json_transformer import flatten_elements, transform, transform_batch, \
+    transform_vectorized
 
 #
 # for more elaborate testing import and use the unittest module. here we keep it very
@@ -266,3 +269,252 @@ def test_json_transform_element_level_does_not_match_input():
                       + 'with a level that does not match the input'
     except InvalidRequestError as e:
         assert e.args == ('Element 1\'s level does not match its level in the input',)
+
+
+def test_json_transform_batch():
+    invalid_input = {'0': [{'children': [], 'id': 1, 'level': 0, 'parent_id': 10, 'title': 'T'}]}
+    documents = [json.loads(test_data_json_input_str), invalid_input, {}]
+
+    results = transform_batch(documents)
+
+    assert len(results) == 3
+    assert test_data_json_output_str == dumps(results[0])
+    assert isinstance(results[1], InvalidRequestError)
+    assert results[1].args == ('Element 1 is a root element and cannot have a parent',)
+    assert results[2] == []
+
+
+def test_json_transform_batch_wrong_field_types():
+    def document(**fields):
+        return {'0': [dict({'children': [], 'id': 1, 'level': 0, 'parent_id': None, 'title': 'T'},
+                           **fields)]}
+
+    documents = [json.loads(test_data_json_input_str), document(children=5),
+                 document(children=None), document(id=[1]), document(parent_id={'id': 1})]
+
+    results = transform_batch(documents)
+
+    assert test_data_json_output_str == dumps(results[0])
+    assert [result.args for result in results[1:]] == [
+        ('Element 1\'s children must be an array',),
+        ('Element 1\'s children must be an array',),
+        ('Element id [1] must be a string, number or null',),
+        ('Element 1\'s parent_id must be a string, number or null',)
+    ]
+
+
+def test_json_transform_batch_process_pool():
+    documents = [json.loads(test_data_json_input_str), '[]'] * 4
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = transform_batch(documents, executor)
+
+    assert test_data_json_output_str == dumps(results[6])
+    assert results[7].args == ('Top-level element must be a dictionary',)
+
+
+def test_json_transform_batch_empty():
+    assert transform_batch([]) == []
+
+
+def test_json_transform_vectorized_valid_data():
+    assert test_data_json_output_str == \
+        dumps(transform_vectorized(json.loads(test_data_json_input_str)))
+
+
+def test_json_transform_vectorized_non_integer_ids():
+    json_input = {
+        '0': [{'children': [], 'id': 'a', 'level': 0, 'parent_id': None, 'title': 'A'}],
+        '1': [{'children': [], 'id': 'b', 'level': 1, 'parent_id': 'a', 'title': 'B'}]
+    }
+
+    assert dumps(transform(json.loads(json.dumps(json_input)))) == \
+        dumps(transform_vectorized(json_input))
+
+
+def test_json_transform_vectorized_mixed_bool_and_int():
+    json_input = {
+        '0': [{'children': [], 'id': 1, 'level': 0, 'parent_id': None, 'title': 'A'}],
+        '1': [{'children': [], 'id': 2, 'level': 1, 'parent_id': True, 'title': 'B'},
+              {'children': [], 'id': 3, 'level': True, 'parent_id': 1, 'title': 'C'}]
+    }
+
+    try:
+        transform_vectorized(json_input)
+
+        assert False, 'Invalid request error should be thrown for a boolean level'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 3\'s level does not match its level in the input',)
+
+    json_input['1'][1]['level'] = 1
+
+    assert dumps(transform(json.loads(json.dumps(json_input)))) == \
+        dumps(transform_vectorized(json_input))
+
+
+def test_json_transform_vectorized_invalid_parent_throws():
+    json_input = {
+        '0': [{'children': [], 'id': 1, 'level': 0, 'parent_id': None, 'title': 'Title'}],
+        '1': [{'children': [], 'id': 2, 'level': 1, 'parent_id': 10, 'title': 'Child Title'}]
+    }
+
+    try:
+        transform_vectorized(json_input)
+
+        assert False, 'Invalid request error should be thrown for non root element with invalid ' \
+                      + 'parent'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 2 has an invalid parent',)
+
+    # nothing is linked when a check fails
+    assert json_input['0'][0]['children'] == []
+
+
+def test_json_transform_vectorized_duplicate_id_throws():
+    json_input = {
+        '0': [{'children': [], 'id': 1, 'level': 0, 'parent_id': None, 'title': 'Title'}],
+        '1': [{'children': [], 'id': 1, 'level': 1, 'parent_id': 1, 'title': 'Child Title'}]
+    }
+
+    try:
+        transform_vectorized(json_input)
+
+        assert False, 'Invalid request error should be thrown for request with duplicate ids'
+    except InvalidRequestError as e:
+        assert e.args == ('Duplicate id \'1\' detected',)
+
+
+def deep_hierarchy_input(depth):
+    # every element hangs off the root, so the root's children are in level order
+    json_input = {'0': [{'children': [], 'id': 0, 'level': 0, 'parent_id': None, 'title': '0'}]}
+
+    for level in range(1, depth):
+        json_input[str(level)] = [{'children': [], 'id': level, 'level': level, 'parent_id': 0,
+                                   'title': str(level)}]
+
+    return json_input
+
+
+def test_json_transform_orders_levels_numerically():
+    element_trees = transform(deep_hierarchy_input(12))
+
+    assert [child['id'] for child in element_trees[0]['children']] == list(range(1, 12))
+
+
+def test_json_transform_level_counts():
+    level_counts = {}
+    flatten_elements(json.loads(test_data_json_input_str), level_counts=level_counts)
+
+    assert level_counts == {'0': 1, '1': 3, '2': 3}
+
+    level_counts = {}
+    flatten_elements(deep_hierarchy_input(12), level_counts=level_counts)
+
+    assert list(level_counts.keys()) == [str(i) for i in range(12)]
+
+
+def test_json_transform_non_numeric_key_throws():
+    try:
+        transform({'0': [], 'one': []})
+
+        assert False, 'Invalid request error should be thrown for a non-numeric level key'
+    except InvalidRequestError as e:
+        assert e.args == ('Top-level element keys must be numbers',)
+
+
+def test_json_transform_padded_level_key_throws():
+    elements_input = {'00': [{'children': [], 'id': 1, 'level': 0, 'parent_id': None,
+                              'title': 'Title'}]}
+
+    try:
+        transform(elements_input)
+
+        assert False, 'Invalid request error should be thrown for request containing an element ' \
+                      + 'with a level that does not match the input'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 1 is not a root element and must have a parent',)
+
+
+def test_json_transform_collect_all_reports_every_violation():
+    elements_input = {
+        '0': [{'children': [], 'id': 1, 'level': 0, 'parent_id': 10, 'title': 'Title'}],
+        '1': [
+            {'children': [], 'id': 2, 'level': 1, 'parent_id': 1, 'title': 'Child 1'},
+            {'children': [], 'id': 2, 'level': 1, 'parent_id': 1, 'title': 'Child 2'},
+            {'children': [], 'id': 3, 'level': 2, 'parent_id': 99, 'title': 'Child 3'},
+            {'children': [], 'id': 4, 'level': 1, 'parent_id': 1}
+        ]
+    }
+
+    try:
+        transform(elements_input, collect_all=True)
+
+        assert False, 'Validation errors should be thrown for invalid input'
+    except ValidationErrors as e:
+        assert [(v['id'], v['rule']) for v in e.violations] == [
+            (1, 'root_parent'),
+            (2, 'unique_id'),
+            (3, 'level'),
+            (4, 'required_keys'),
+            (1, 'valid_parent'),
+            (3, 'valid_parent')
+        ]
+        assert e.violations[0]['message'] == \
+            'Element 1 is a root element and cannot have a parent'
+        assert not e.truncated
+
+
+def test_json_transform_collect_all_wrong_field_types():
+    elements_input = {
+        '0': [{'children': None, 'id': 1, 'level': 0, 'parent_id': 5, 'title': 'T'},
+              {'children': [], 'id': [2], 'level': 0, 'parent_id': None, 'title': 'T'},
+              {'children': [], 'id': 3, 'level': 0, 'parent_id': [1], 'title': 'T'}],
+        '1': [{'children': [], 'id': 4, 'level': 1, 'parent_id': 1, 'title': 'T'}],
+        'x': []
+    }
+
+    try:
+        transform(elements_input, collect_all=True)
+
+        assert False, 'Validation errors should be thrown for invalid input'
+    except ValidationErrors as e:
+        assert [(v['id'], v['rule']) for v in e.violations] == [
+            (None, 'level_key'),
+            (1, 'root_parent'),
+            (1, 'children_type'),
+            ([2], 'id_type'),
+            (3, 'parent_id_type'),
+            (3, 'root_parent'),
+            (4, 'valid_parent')
+        ]
+
+
+def test_json_transform_collect_all_stops_at_max_errors():
+    elements_input = {'1': [{'children': [], 'id': i, 'level': 1, 'parent_id': None, 'title': 'T'}
+                            for i in range(10)]}
+
+    try:
+        transform(elements_input, collect_all=True, max_errors=3)
+
+        assert False, 'Validation errors should be thrown for invalid input'
+    except ValidationErrors as e:
+        assert len(e.violations) == 3
+        assert e.truncated
+
+
+def test_json_transform_collect_all_records_at_least_one_error():
+    elements_input = {'1': [{'children': [], 'id': i, 'level': 1, 'parent_id': None, 'title': 'T'}
+                            for i in range(10)]}
+
+    try:
+        transform(elements_input, collect_all=True, max_errors=0)
+
+        assert False, 'Validation errors should be thrown for invalid input'
+    except ValidationErrors as e:
+        assert len(e.violations) == 1
+        assert e.truncated
+
+
+def test_json_transform_collect_all_valid_data():
+    assert test_data_json_output_str == \
+        dumps(transform(json.loads(test_data_json_input_str), collect_all=True))
@@ -0,0 +1,108 @@
+import json
+import os
+
+from app.error import InvalidRequestError
+from app.transform_cache import TransformCache
+
+#
+# for more elaborate testing import and use the unittest module. here we keep it very
+# lightweight and simple
+#
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_in.json'), 'rb') as f:
+    test_data_json_input_str = f.read().decode('utf8').rstrip()
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_out.json'), 'rb') as f:
+    test_data_json_output_str = f.read().decode('utf8').rstrip()
+
+
+def dumps(json_obj):
+    return json.dumps(json_obj, sort_keys=True, indent=2)
+
+
+def test_transform_cache_miss_then_hit():
+    cache = TransformCache()
+
+    first = cache.transform_body(test_data_json_input_str)
+    second = cache.transform_body(test_data_json_input_str)
+
+    assert test_data_json_output_str == dumps(json.loads(first))
+    assert first == second
+
+    stats = cache.get_stats()
+
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['memory_hits'] == 1
+
+
+def test_transform_cache_hit_on_canonically_equal_input():
+    cache = TransformCache()
+
+    cache.transform_body(test_data_json_input_str)
+    output = cache.transform_body(json.dumps(json.loads(test_data_json_input_str)))
+
+    assert test_data_json_output_str == dumps(json.loads(output))
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_transform_cache_evicts_least_recently_used():
+    cache = TransformCache(max_entries=2)
+
+    cache.transform_body('{}')
+    cache.transform_body(test_data_json_input_str)
+
+    # each result is stored under a raw and a doc key, so '{}' has been evicted
+    assert cache.get_stats()['memory_entries'] == 2
+
+    cache.transform_body('{}')
+
+    assert cache.get_stats()['misses'] == 3
+
+
+def test_transform_cache_evicts_past_max_bytes():
+    output = TransformCache().transform_body(test_data_json_input_str)
+
+    # room for one result and the raw key pointing at it, but not a second result with it
+    cache = TransformCache(max_bytes=len(output) + 100)
+
+    cache.transform_body(test_data_json_input_str)
+    cache.transform_body('{"0": []}')
+
+    assert cache.get_stats()['memory_bytes'] <= len(output) + 100
+
+    cache.transform_body(test_data_json_input_str)
+
+    stats = cache.get_stats()
+
+    assert stats['misses'] == 3
+    assert stats['stores'] == 3
+    assert stats['memory_bytes'] <= len(output) + 100
+
+
+def test_transform_cache_skips_large_results():
+    cache = TransformCache(max_item_size=10)
+
+    cache.transform_body(test_data_json_input_str)
+
+    stats = cache.get_stats()
+
+    assert stats['too_large'] == 1
+    assert stats['stores'] == 0
+    assert stats['memory_entries'] == 0
+
+
+def test_transform_cache_does_not_cache_invalid_input():
+    cache = TransformCache()
+
+    for i in range(2):
+        try:
+            cache.transform_body('[]')
+
+            assert False, 'Invalid request error should be thrown for a non-dictionary input'
+        except InvalidRequestError as e:
+            assert e.args == ('Top-level element must be a dictionary',)
+
+    assert cache.get_stats()['misses'] == 2
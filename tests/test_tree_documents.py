@@ -0,0 +1,201 @@
+import json
+import os
+
+from app.error import InvalidRequestError
+from app.json_transformer import transform
+from app.tree_documents import TreeDocument, TreeDocumentStore
+
+#
+# for more elaborate testing import and use the unittest module. here we keep it very
+# lightweight and simple
+#
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_in.json'), 'rb') as f:
+    test_data_json_input_str = f.read().decode('utf8').rstrip()
+
+with open(os.path.join(os.path.dirname(__file__),
+                       'test_data/test_data_transform_json_out.json'), 'rb') as f:
+    test_data_json_output_str = f.read().decode('utf8').rstrip()
+
+
+def dumps(json_obj):
+    return json.dumps(json_obj, sort_keys=True, indent=2)
+
+
+def new_document():
+    return TreeDocument(json.loads(test_data_json_input_str))
+
+
+def test_tree_document_matches_transform():
+    assert test_data_json_output_str == dumps(new_document().element_trees)
+
+
+def element(element_id, level, parent_id):
+    return {'id': element_id, 'children': [], 'level': level, 'parent_id': parent_id,
+            'title': str(element_id)}
+
+
+def test_tree_document_with_cycle_throws():
+    try:
+        TreeDocument({'0': [element(1, 0, None)], '1': [element(2, 1, 3), element(3, 1, 2)]})
+
+        assert False, 'Invalid request error should be thrown for elements that form a cycle'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 2 is not under a root element, its parents form a cycle',)
+
+
+def test_tree_document_with_inconsistent_levels_throws():
+    try:
+        TreeDocument({'0': [element(1, 0, None)], '2': [element(2, 2, 1)]})
+
+        assert False, 'Invalid request error should be thrown for a level that does not match ' \
+                      + 'the parent\'s level'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 2\'s level does not match its level in the tree',)
+
+
+def test_tree_document_keeps_sibling_order():
+    document = TreeDocument({'0': [element(element_id, 0, None) for element_id in range(6)]})
+
+    document.patch([{'op': 'delete', 'id': 1}, {'op': 'move', 'id': 3, 'parent_id': 0},
+                    {'op': 'delete', 'id': 4}, {'op': 'add', 'id': 6, 'parent_id': None,
+                                                'title': '6'}])
+
+    assert [root['id'] for root in document.element_trees] == [0, 2, 5, 6]
+    assert [child['id'] for child in document.elements[0]['children']] == [3]
+
+    try:
+        document.patch([{'op': 'delete', 'id': 2}, {'op': 'move', 'id': 6, 'parent_id': 3},
+                        {'op': 'delete', 'id': 7}])
+
+        assert False, 'Invalid request error should be thrown for an element that does not exist'
+    except InvalidRequestError:
+        pass
+
+    assert [root['id'] for root in document.element_trees] == [0, 2, 5, 6]
+    assert document.patch([{'op': 'delete', 'id': 5}])['deleted'] == [5]
+    assert [root['id'] for root in document.element_trees] == [0, 2, 6]
+
+
+def test_tree_document_add_and_retitle():
+    document = new_document()
+
+    diff = document.patch([
+        {'op': 'add', 'id': 100, 'parent_id': 17, 'title': 'Pane'},
+        {'op': 'retitle', 'id': 10, 'title': 'Home'}
+    ])
+
+    assert sorted(diff['updated'], key=lambda element: element['id']) == [
+        {'id': 10, 'level': 0, 'parent_id': None, 'title': 'Home'},
+        {'id': 100, 'level': 3, 'parent_id': 17, 'title': 'Pane'}
+    ]
+    assert diff['deleted'] == []
+    assert document.elements[17]['children'][0]['title'] == 'Pane'
+    assert document.element_trees[0]['title'] == 'Home'
+
+
+def test_tree_document_move_relevels_subtree():
+    document = new_document()
+
+    diff = document.patch([{'op': 'move', 'id': 12, 'parent_id': None}])
+
+    assert {element['id']: element['level'] for element in diff['updated']} == \
+        {12: 0, 17: 1, 15: 1}
+    assert document.element_trees[-1] is document.elements[12]
+    assert document.elements[12] not in document.elements[10]['children']
+
+
+def test_tree_document_delete_removes_subtree():
+    document = new_document()
+
+    diff = document.patch([{'op': 'delete', 'id': 12}])
+
+    assert sorted(diff['deleted']) == [12, 15, 17]
+    assert 17 not in document.elements
+
+
+def test_tree_document_move_under_own_subtree_throws():
+    document = new_document()
+
+    try:
+        document.patch([{'op': 'move', 'id': 10, 'parent_id': 17}])
+
+        assert False, 'Invalid request error should be thrown for a move that creates a cycle'
+    except InvalidRequestError as e:
+        assert e.args == ('Moving element 10 under 17 would create a cycle',)
+
+
+def test_tree_document_failed_patch_leaves_document_unchanged():
+    document = new_document()
+
+    try:
+        document.patch([
+            {'op': 'delete', 'id': 13},
+            {'op': 'move', 'id': 12, 'parent_id': None},
+            {'op': 'add', 'id': 101, 'parent_id': 12, 'title': 'Chimney'},
+            {'op': 'retitle', 'id': 10, 'title': 'Home'},
+            {'op': 'add', 'id': 10, 'parent_id': None, 'title': 'Duplicate'}
+        ])
+
+        assert False, 'Invalid request error should be thrown for request with duplicate ids'
+    except InvalidRequestError as e:
+        assert e.args == ('Duplicate id \'10\' detected',)
+
+    assert test_data_json_output_str == dumps(document.element_trees)
+    assert test_data_json_output_str == dumps(transform(json.loads(test_data_json_input_str)))
+
+
+def test_tree_document_patch_with_unhashable_id_leaves_document_unchanged():
+    document = new_document()
+
+    try:
+        document.patch([
+            {'op': 'retitle', 'id': 10, 'title': 'Home'},
+            {'op': 'add', 'id': [5], 'parent_id': None, 'title': 'List'}
+        ])
+
+        assert False, 'Invalid request error should be thrown for an id that is a list'
+    except InvalidRequestError as e:
+        assert e.args == ('Patch id [5] must be a string, number or null',)
+
+    assert test_data_json_output_str == dumps(document.element_trees)
+
+
+def test_tree_document_patch_with_non_integer_level_throws():
+    document = new_document()
+
+    try:
+        document.patch([{'op': 'add', 'id': 100, 'parent_id': 17, 'level': True,
+                         'title': 'Pane'}])
+
+        assert False, 'Invalid request error should be thrown for a level that is not an integer'
+    except InvalidRequestError as e:
+        assert e.args == ('Patch level True must be an integer',)
+
+    assert 100 not in document.elements
+
+
+def test_tree_document_add_with_invalid_parent_throws():
+    document = new_document()
+
+    try:
+        document.patch([{'op': 'add', 'id': 100, 'parent_id': 1000, 'title': 'Orphan'}])
+
+        assert False, 'Invalid request error should be thrown for an element with an invalid ' \
+                      + 'parent'
+    except InvalidRequestError as e:
+        assert e.args == ('Element 100 has an invalid parent',)
+
+
+def test_tree_document_store_evicts_least_recently_used():
+    store = TreeDocumentStore(max_documents=2)
+
+    first, _ = store.create({})
+    second, _ = store.create({})
+
+    store.get(first)
+    store.create({})
+
+    assert store.get(first) is not None
+    assert store.get(second) is None
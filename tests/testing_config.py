@@ -6,9 +6,45 @@ TEST_CONFIG = {
     'REDIS_URL': 'redis://localhost:6379/0',
 
     'CACHE_EXPIRE_TIME': 3600,
+    'CACHE_STALE_TIME': 600,
+    'CACHE_REFRESH_TIME': 300,
     'PAGE_SIZE': 10,
 
-    'GITHUB_BASE_QUERY': 'https://api.github.com/search/repositories?q=elixir&per_page=100&page=',
+    'JSON_MAX_DECOMPRESSED_SIZE': 1024 * 1024,
+    'TRANSFORM_MAX_ERRORS': 10,
+
+    'TRANSFORM_CACHE_ENABLED': False,
+    'TRANSFORM_CACHE_REDIS': False,
+    'TRANSFORM_CACHE_MAX_ENTRIES': 16,
+    'TRANSFORM_CACHE_EXPIRE_TIME': 60,
+    'TRANSFORM_CACHE_MAX_ITEM_SIZE': 1024 * 1024,
+    'TRANSFORM_CACHE_MAX_BYTES': 4 * 1024 * 1024,
+
+    'TREE_DOCUMENTS_MAX': 4,
+
+    'GITHUB_SEARCH_URL': 'https://api.github.com/search/repositories',
     'GITHUB_MAX_ITEMS': 1000,
-    'GITHUB_PAGE_SIZE': 100
+    'GITHUB_PAGE_SIZE': 100,
+    'GITHUB_FETCH_LOCK_TIMEOUT': 60,
+    'GITHUB_FETCH_WAIT_TIMEOUT': 5,
+    'GITHUB_PREFETCH_CONCURRENCY': 4,
+    'GITHUB_PREFETCH_WINDOW': 2,
+    'GITHUB_PREFETCH_LOOKAHEAD_VIEWS': 10,
+    'GITHUB_PREFETCH_COOLDOWN': 30,
+
+    'SEARCH_QUERIES': [{'q': 'elixir', 'expire_time': 3600}],
+    'SEARCH_QUERY_EXPIRE_TIME': 600,
+    'SEARCH_MAX_QUERIES': 2,
+
+    'CRAWL_DATE_FIELD': 'created',
+    'CRAWL_START_DATE': '2019-01-01',
+    'CRAWL_CONCURRENCY': 4,
+    'CRAWL_INDEX_GRACE_TIME': 60,
+    'CRAWL_JOB_TIMEOUT': 600,
+
+    'REPOSITORY_STORE_PATH': None,
+
+    'SEARCH_PAGE_CACHE_MAX_ENTRIES': 16,
+    'SEARCH_PAGE_CACHE_HTML': True,
+    'SEARCH_PAGE_MAX_AGE': 60
 }